@@ -75,12 +75,12 @@ export function OfficialPanel() {
 
   const loadAlerts = async () => {
     try {
-      const response = await fetch("/alerts", {
+      const response = await fetch("/alerts?ack=0", {
         headers: getAuthHeaders(),
       })
       if (response.ok) {
         const data = await response.json()
-        setAlerts(data)
+        setAlerts(data.alerts)
       }
     } catch (error) {
       console.error("Failed to load alerts:", error)
@@ -151,15 +151,25 @@ export function OfficialPanel() {
       })
 
       const data = await response.json()
-      if (response.ok) {
-        toast({
-          title: "Training completed",
-          description: `Trained for ${data.iters} iterations. Buffer size: ${data.buffer_size}`,
-        })
-        loadAgentStats() // Refresh stats
-      } else {
+      if (!response.ok) {
         throw new Error(data.error || "Training failed")
       }
+      // training runs as a background job; poll until it finishes
+      let job = data
+      while (job.status === "queued" || job.status === "running") {
+        await new Promise((resolve) => setTimeout(resolve, 500))
+        const res = await fetch(`/api/train_rl/${data.job_id}`, { headers: getAuthHeaders() })
+        job = await res.json()
+        if (!res.ok) throw new Error(job.error || "Training failed")
+      }
+      if (job.status !== "done") {
+        throw new Error(job.error || "Training failed")
+      }
+      toast({
+        title: "Training completed",
+        description: `Trained for ${data.iters} iterations. Buffer size: ${data.buffer_size}`,
+      })
+      loadAgentStats() // Refresh stats
     } catch (error) {
       toast({
         title: "Error",
@@ -174,7 +184,7 @@ export function OfficialPanel() {
   const handleViewLogs = async () => {
     setLoadingState("logs", true)
     try {
-      const response = await fetch("/api/logs", {
+      const response = await fetch("/api/logs?limit=50", {
         headers: getAuthHeaders(),
       })
 
@@ -429,8 +439,8 @@ export function OfficialPanel() {
             <div className="space-y-2">
               {alerts
                 .filter((alert) => !alert.ack)
-                .map((alert, index) => (
-                  <div key={index} className="flex items-center justify-between p-2 bg-destructive/10 rounded">
+                .map((alert) => (
+                  <div key={alert.id} className="flex items-center justify-between p-2 bg-destructive/10 rounded">
                     <div>
                       <div className="text-sm font-medium">Lane {alert.lane + 1}</div>
                       <div className="text-xs text-muted-foreground">{alert.msg}</div>
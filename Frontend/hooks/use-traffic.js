@@ -3,11 +3,13 @@
 import { useEffect, useRef, useState } from "react"
 import { getAuthHeaders } from "../lib/auth"
 
-export default function useTraffic({ intervalMs = 1000 } = {}) {
+export default function useTraffic({ intervalMs = 1000, stream = true } = {}) {
   const [latest, setLatest] = useState(null)
   const historyRef = useRef([[], [], [], []]) // last 30 points per lane
   const [running, setRunning] = useState(true)
   const intervalRef = useRef(intervalMs)
+  const dataRef = useRef(null)
+  const etagRef = useRef(null)
 
   useEffect(() => {
     intervalRef.current = intervalMs
@@ -15,22 +17,39 @@ export default function useTraffic({ intervalMs = 1000 } = {}) {
 
   useEffect(() => {
     let mounted = true
+    let id = null
+    let source = null
+
+    function apply(data, record = true) {
+      if (!mounted) return
+      dataRef.current = data
+      // maintain history buffer (counts)
+      if (record) {
+        for (let i = 0; i < 4; i++) {
+          const arr = historyRef.current[i]
+          arr.push(data.counts ? data.counts[i] : 0)
+          if (arr.length > 30) arr.shift()
+        }
+      }
+      setLatest({ data, history: JSON.parse(JSON.stringify(historyRef.current)) })
+    }
+
     async function fetchOnce() {
       try {
-        const res = await fetch("/api/traffic_data", { headers: getAuthHeaders() })
+        const headers = { ...getAuthHeaders() }
+        if (etagRef.current) headers["If-None-Match"] = etagRef.current
+        const res = await fetch("/api/traffic_data", { headers })
         if (res.status === 401) {
           // let caller handle unauth
           throw { code: 401, message: "unauthenticated" }
         }
-        const data = await res.json()
-        if (!mounted) return
-        // maintain history buffer (counts)
-        for (let i = 0; i < 4; i++) {
-          const arr = historyRef.current[i]
-          arr.push(data.counts ? data.counts[i] : 0)
-          if (arr.length > 30) arr.shift()
+        if (res.status === 304 && dataRef.current) {
+          // unchanged since the last poll
+          apply(dataRef.current)
+          return
         }
-        setLatest({ data, history: JSON.parse(JSON.stringify(historyRef.current)) })
+        etagRef.current = res.headers.get("ETag")
+        apply(await res.json())
       } catch (err) {
         if (err && err.code === 401) {
           // bubble up
@@ -40,22 +59,60 @@ export default function useTraffic({ intervalMs = 1000 } = {}) {
         }
       }
     }
-    fetchOnce()
-    let id = null
-    function loop() {
-      id = setTimeout(async () => {
-        if (running) {
-          await fetchOnce()
+
+    function poll() {
+      fetchOnce()
+      function loop() {
+        id = setTimeout(async () => {
+          if (running) {
+            await fetchOnce()
+          }
+          loop()
+        }, intervalRef.current)
+      }
+      loop()
+    }
+
+    if (!running) {
+      return () => {
+        mounted = false
+      }
+    }
+
+    if (stream && typeof window !== "undefined" && "EventSource" in window) {
+      // server pushes a snapshot, then only deltas when the state changes
+      source = new EventSource("/api/stream")
+      source.addEventListener("snapshot", (ev) => {
+        const msg = JSON.parse(ev.data)
+        apply(msg.state)
+      })
+      source.addEventListener("delta", (ev) => {
+        const msg = JSON.parse(ev.data)
+        // only a change in counts is a new history point; timer-only deltas just update the view
+        apply({ ...(dataRef.current || {}), ...msg.delta }, "counts" in msg.delta)
+      })
+      source.addEventListener("closed", () => {
+        // the intersection was removed: stop instead of reconnecting
+        source.close()
+        source = null
+      })
+      source.onerror = () => {
+        // stream unavailable (e.g. proxy buffering): fall back to conditional polling
+        if (source && source.readyState === EventSource.CLOSED && mounted && id === null) {
+          source = null
+          poll()
         }
-        loop()
-      }, intervalRef.current)
+      }
+    } else {
+      poll()
     }
-    loop()
+
     return () => {
       mounted = false
       clearTimeout(id)
+      if (source) source.close()
     }
-  }, [running])
+  }, [running, stream])
 
   return {
     latest,
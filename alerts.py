@@ -0,0 +1,225 @@
+# alerts.py
+import os, json, time, bisect, threading, itertools
+from collections import OrderedDict, deque
+from typing import List, Optional, Tuple
+
+ALERT_MAX_KEPT = 50000
+ALERT_MAX_AGE_SECONDS = 180*86400
+ALERT_COMPACT_EVERY = 1000   # log events between snapshot rewrites
+ALERT_PAGE_MAX = 1000
+
+class AlertStore:
+    # alerts by id in raise order, an open-alert index per lane, and a JSONL event log;
+    # `path` holds the compacted snapshot (a JSON list, same shape as the old alerts.json). Events go
+    # through `journal` (a JournalWriter) so raises on the control loop never wait on disk; without
+    # one they are appended synchronously (tools and tests)
+    def __init__(self, path: Optional[str] = None, max_kept: int = ALERT_MAX_KEPT,
+                 max_age: float = ALERT_MAX_AGE_SECONDS, compact_every: int = ALERT_COMPACT_EVERY,
+                 journal=None):
+        self.path = path
+        self.journal = journal
+        self.log_path = f"{path}.log" if path else None
+        self.max_kept = max(1, int(max_kept))
+        self.max_age = float(max_age)
+        self.compact_every = max(1, int(compact_every))
+        self.lock = threading.Lock()
+        self.items: "OrderedDict[int, dict]" = OrderedDict()
+        self.open = {}        # lane -> {id: alert} of unacknowledged alerts
+        self.by_lane = {}     # lane -> deque of ids, ascending
+        self._ids = itertools.count(1)
+        self.log_events = 0
+        self.compacting = False
+        self.stats = {"raised": 0, "acked": 0, "expired": 0, "compactions": 0, "errors": 0, "last_error": None}
+
+    # ---------- in-memory index ----------
+    def _insert(self, a: dict):
+        aid = a["id"]
+        self.items[aid] = a
+        self.by_lane.setdefault(a["lane"], deque()).append(aid)
+        if not a.get("ack", False):
+            self.open.setdefault(a["lane"], {})[aid] = a
+
+    def _drop_oldest(self):
+        aid, a = self.items.popitem(last=False)
+        lane_ids = self.by_lane.get(a["lane"])
+        if lane_ids and lane_ids[0] == aid:
+            lane_ids.popleft()
+        self.open.get(a["lane"], {}).pop(aid, None)
+
+    def _apply_ack(self, a: dict, ts: float):
+        a["ack"] = True
+        a["ack_ts"] = ts
+        self.open.get(a["lane"], {}).pop(a["id"], None)
+
+    def _expire(self, now):
+        # oldest first, so this is amortized O(1) per raise
+        while self.items:
+            a = next(iter(self.items.values()))
+            if len(self.items) <= self.max_kept and a.get("ts", now) >= now - self.max_age:
+                break
+            self._drop_oldest(); self.stats["expired"] += 1
+
+    # ---------- persistence ----------
+    def load(self):
+        items = []
+        if self.path and os.path.exists(self.path):
+            try:
+                with open(self.path) as f:
+                    items = json.load(f)
+            except Exception as e:
+                self.stats["errors"] += 1; self.stats["last_error"] = f"{self.path}:{e}"
+        with self.lock:
+            self.items.clear(); self.open.clear(); self.by_lane.clear()
+            next_id = 1
+            for a in items:
+                a = dict(a)
+                if "id" not in a:   # pre-index alerts.json entries
+                    a["id"] = next_id
+                next_id = max(next_id, int(a["id"]) + 1)
+                a["lane"] = int(a.get("lane", 0))
+                self._insert(a)
+            # replay events newer than the snapshot (a crash mid-compaction leaves an .old log too)
+            for log in (f"{self.log_path}.old", self.log_path) if self.log_path else ():
+                if not os.path.exists(log):
+                    continue
+                with open(log) as f:
+                    for line in f:
+                        try:
+                            ev = json.loads(line)
+                        except ValueError:
+                            continue   # torn last line
+                        if ev.get("op") == "raise" and ev["alert"]["id"] not in self.items:
+                            self._insert(dict(ev["alert"]))
+                        elif ev.get("op") == "ack" and ev.get("id") in self.items:
+                            self._apply_ack(self.items[ev["id"]], ev.get("ts", time.time()))
+                        next_id = max(next_id, int(ev.get("id", ev.get("alert", {}).get("id", 0))) + 1)
+            self._ids = itertools.count(next_id)
+            self._expire(time.time())
+
+    def _log(self, events: List[dict]):
+        # called under the lock so the queued order matches the in-memory order
+        if not self.log_path or not events:
+            return
+        lines = [json.dumps(ev) for ev in events]
+        if self.journal is not None:
+            self.journal.append_lines(self.log_path, lines)
+        else:
+            try:
+                with open(self.log_path, "a") as f:
+                    f.write("".join(line + "\n" for line in lines))
+            except Exception as e:
+                self.stats["errors"] += 1; self.stats["last_error"] = f"{self.log_path}:{e}"
+                return
+        self.log_events += len(events)
+        if self.log_events >= self.compact_every and not self.compacting:
+            self.compacting = True
+            threading.Thread(target=self.compact, name="alerts-compact", daemon=True).start()
+
+    def compact(self):
+        # move the live log aside, snapshot everything it covers, then drop it. Runs on its own thread and
+        # does its file work outside the lock: any event in the moved log was applied in memory before
+        # the move, so the snapshot taken after it covers the log; events the journal writes after the
+        # move land in the new log, and replaying them over the snapshot is a no-op
+        if not self.path:
+            return
+        try:
+            if self.log_path and os.path.exists(self.log_path):
+                os.replace(self.log_path, f"{self.log_path}.old")
+            with self.lock:
+                self.log_events = 0
+                snapshot = [dict(a) for a in self.items.values()]
+            tmp = f"{self.path}.tmp"
+            with open(tmp, "w") as f:
+                json.dump(snapshot, f)
+            os.replace(tmp, self.path)
+            if self.log_path and os.path.exists(f"{self.log_path}.old"):
+                os.remove(f"{self.log_path}.old")
+            self.stats["compactions"] += 1
+        except Exception as e:
+            self.stats["errors"] += 1; self.stats["last_error"] = f"compact:{e}"
+        finally:
+            self.compacting = False
+
+    # ---------- operations ----------
+    def has_open(self, lane: int) -> bool:
+        return bool(self.open.get(lane))
+
+    def raise_alert(self, lane: int, msg: str, ts: Optional[float] = None) -> Optional[dict]:
+        # at most one open alert per lane; returns the new alert or None
+        lane = int(lane)
+        ts = time.time() if ts is None else ts
+        with self.lock:
+            if self.open.get(lane):
+                return None
+            a = {"id": next(self._ids), "lane": lane, "msg": msg, "ts": ts, "ack": False}
+            self._insert(a)
+            self._expire(ts)
+            self.stats["raised"] += 1
+            out = dict(a)
+            self._log([{"op": "raise", "alert": out}])
+        return out
+
+    def ack(self, lane: Optional[int] = None, alert_id: Optional[int] = None) -> int:
+        # acknowledge one alert by id, or every open alert on a lane
+        now = time.time()
+        with self.lock:
+            if alert_id is not None:
+                a = self.items.get(int(alert_id))
+                targets = [a] if a is not None and not a.get("ack", False) else []
+            else:
+                targets = list(self.open.get(int(lane), {}).values())
+            for a in targets:
+                self._apply_ack(a, now)
+            self.stats["acked"] += len(targets)
+            events = [{"op": "ack", "id": a["id"], "ts": now} for a in targets]
+            self._log(events)
+        return len(events)
+
+    def open_alerts(self) -> List[dict]:
+        with self.lock:
+            return sorted((dict(a) for d in self.open.values() for a in d.values()), key=lambda a: a["id"])
+
+    def query(self, lane: Optional[int] = None, ack: Optional[bool] = None, since: Optional[float] = None,
+              until: Optional[float] = None, cursor: Optional[int] = None, limit: int = 100) -> Tuple[List[dict], Optional[int]]:
+        # newest first; `cursor` is the id to continue below (the previous page's next_cursor)
+        limit = max(1, min(int(limit), ALERT_PAGE_MAX))
+        with self.lock:
+            if ack is False:
+                pool = sorted((aid for d in (self.open.values() if lane is None else [self.open.get(lane, {})])
+                               for aid in d), reverse=True)
+            elif lane is not None:
+                ids = self.by_lane.get(lane, deque())
+                hi = bisect.bisect_left(ids, cursor) if cursor is not None else len(ids)
+                pool = (ids[i] for i in range(hi - 1, -1, -1))
+            elif self.items:
+                # ids are contiguous (only the oldest ever expire), so the cursor is a direct seek
+                first, last = next(iter(self.items)), next(reversed(self.items))
+                pool = range(last if cursor is None else min(last, cursor - 1), first - 1, -1)
+            else:
+                pool = ()
+            out = []
+            for aid in pool:
+                if cursor is not None and aid >= cursor:
+                    continue
+                a = self.items.get(aid)
+                if a is None:
+                    continue
+                if until is not None and a["ts"] > until:
+                    continue
+                if since is not None and a["ts"] < since:
+                    break   # ids follow raise time, so everything further is older
+                if ack is not None and bool(a.get("ack", False)) != ack:
+                    continue
+                out.append(dict(a))
+                if len(out) > limit:
+                    break
+        more = len(out) > limit
+        out = out[:limit]
+        return out, (out[-1]["id"] if more else None)
+
+    def all(self) -> List[dict]:
+        with self.lock:
+            return [dict(a) for a in self.items.values()]
+
+    def __len__(self):
+        return len(self.items)
@@ -1,4 +1,4 @@
-# opencv.py
+# app_opencv.py
 import cv2
 
 def get_video_capture(source=0):
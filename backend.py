@@ -1,80 +1,79 @@
 # backend.py
-import os, time, threading, uuid, hashlib, json, math, random
+import os, time, threading, uuid, hashlib, hmac, json, math, atexit
 from functools import wraps
 from typing import Optional
-from flask import Flask, jsonify, request
-import pandas as pd
-import numpy as np
-
-from detection import load_model, run_yolo_detection, run_mock_detection_from_counts
-from density import calculate_density
-from decision import DecisionManager, MIN_GREEN, MAX_GREEN
+from flask import Flask, Response, g, jsonify, request, stream_with_context
+import numpy as np   # not deferred: controller, decision, forecast and rollups import it at load anyway
+
+from detection import load_model, warm_up
+from models import ModelRegistry
+from decision import MIN_GREEN, RL_MAX_LANES
+from controller import Intersection, IntersectionRegistry, Scheduler, LANE_CAPACITY
+from journal import JournalWriter, segments
+from forecast import Forecaster, hour_of_day
+from rollups import Rollups
+from users import UserStore, SessionStore
+from training import TrainingJobs, Checkpointer
+from metrics import REGISTRY, CONTENT_TYPE, stage
+from stream import EncodedView
+from overrides import OverrideLog, OVERRIDE_COLUMNS, parse_cursor
 
 ROIS = [(50,250,120,200),(200,250,120,200),(350,250,120,200),(500,250,120,200)]
-LANE_CAPACITY = 10
-YOLO_TRIGGER_BEFORE = 10
+DEFAULT_INTERSECTION = "main"
+TICK_WORKERS = 8
 HISTORY_PATH = "history.csv"
 USERS_PATH = "users.csv"
 OVERRIDES_PATH = "overrides.csv"
 ALERTS_PATH = "alerts.json"
-MAX_GREEN_STREAK_SECONDS = 30*60
+JOURNAL_FLUSH_EVERY = 64
+JOURNAL_FLUSH_INTERVAL = 1.0
+JOURNAL_FSYNC = "interval"   # "commit" | "interval" | "never"
+JOURNAL_MAX_BYTES = 50*1024*1024
+# rotated segments kept per journal file. History rows are ~40 bytes, one per phase, so a 50 MB segment
+# is over a year; past the limit the oldest is deleted (with a warning), and since statistics, rollups
+# and forecasts are rebuilt from the kept segments on start, they then cover only those. The overrides
+# file is the audit trail and keeps every segment.
+HISTORY_BACKUPS = 5
+OVERRIDES_BACKUPS = None
+# each open SSE stream holds a worker thread under a threaded WSGI server, so past this many (across all
+# intersections) new streams get 503 and clients fall back to polling; serving thousands of viewers
+# needs an async worker (e.g. gunicorn -k gevent) and a higher limit
+MAX_STREAMS = 200
+MODEL_PATH = "yolov8n.pt"
+MODEL_BACKGROUND_LOAD = True
+TRAIN_WORKERS = 1
+RL_CHECKPOINT_DIR = "checkpoints"
+RL_CHECKPOINT_INTERVAL = 300.0
+SESSION_TTL_SECONDS = 12*3600
+SESSION_MAX = 100000
 PORT = 5000
+# False inside spawned training workers, which re-import this script as __mp_main__ when it is run
+# directly; they only need training.py, so nothing here may start threads or write files for them
+SERVER_PROCESS = __name__ != "__mp_main__"
 
 app = Flask(__name__, static_folder="static", template_folder="templates")
+# not deferred: the CORS hooks must be on the app before its first request (~8 ms of import)
 from flask_cors import CORS
 CORS(app,
      supports_credentials=True,
      resources={r"/*": {"origins": "*"}},
      expose_headers=["Authorization"])
 
-latest = {
-    "densities": [0.0]*len(ROIS),
-    "counts": [0]*len(ROIS),
-    "timers": [MIN_GREEN]*len(ROIS),
-    "next_lane": 0,
-    "signal_timer": MIN_GREEN,
-    "mode": "mock",
-    "error": None,
-    "timestamp": time.time()
-}
-
-state = {
-    "controller": {"type": "auto"},
-    "streak_seconds": [0]*len(ROIS),
-    "alerts": [],
-    "smoothed_densities": None,
-    "rain": False,
-    "peak": False
-}
-
-MOCK_MODE = True
-
-def _ensure_users():
-    if not os.path.exists(USERS_PATH):
-        pd.DataFrame(columns=["username", "pw_hash", "role"]).to_csv(USERS_PATH, index=False)
-
 def hash_pw(pw):
     return hashlib.sha256(pw.encode()).hexdigest()
 
+users = UserStore(USERS_PATH)
+
 def create_user(username, password, role="user"):
-    _ensure_users()
-    df = pd.read_csv(USERS_PATH)
-    if username in df['username'].values:
-        return False
-    new_row = {"username": username, "pw_hash": hash_pw(password), "role": role}
-    df = pd.concat([df, pd.DataFrame([new_row])], ignore_index=True)
-    df.to_csv(USERS_PATH, index=False)
-    return True
-
-SESSIONS = {}
+    return users.add(username, hash_pw(password), role)
+
+SESSIONS = SessionStore(ttl=SESSION_TTL_SECONDS, max_size=SESSION_MAX)
 def login_user(username,password):
-    _ensure_users()
-    df = pd.read_csv(USERS_PATH)
-    row = df[df['username']==username]
-    if row.empty: return None
-    if row.iloc[0]['pw_hash'] != hash_pw(password): return None
+    u = users.get(username)
+    if u is None: return None
+    if not hmac.compare_digest(u['pw_hash'], hash_pw(password or "")): return None
     token = str(uuid.uuid4())
-    SESSIONS[token] = {"username":username,"role":row.iloc[0]['role'],"ts":time.time()}
+    SESSIONS.put(token, {"username":username,"role":u['role'],"ts":time.time()})
     return token
 
 def get_session(token):
@@ -108,6 +107,16 @@ def require_token(f):
         return f(*args, **kwargs)
     return inner
 
+def with_intersection(f):
+    # resolves the <iid> route arg (default intersection on legacy routes) to an Intersection
+    @wraps(f)
+    def inner(*args, iid=DEFAULT_INTERSECTION, **kwargs):
+        ix = registry.get(iid)
+        if ix is None:
+            return jsonify({"error":"unknown_intersection"}), 404
+        return f(ix, *args, **kwargs)
+    return inner
+
 def official_required(f):
     @wraps(f)
     @require_token
@@ -118,231 +127,286 @@ def official_required(f):
     return inner
 
 # ---------- persistence helpers ----------
-def ensure_file(path, columns):
-    if not os.path.exists(path):
-        df = pd.DataFrame(columns=columns)
-        df.to_csv(path, index=False)
-
-def append_history_row(counts):
-    cols = [f"lane{i+1}" for i in range(len(counts))]
-    ensure_file(HISTORY_PATH, cols + ["ts"])
-    row = {c: int(v) for c,v in zip(cols, counts)}
-    row["ts"] = time.time()
-    df = pd.DataFrame([row])
-    df.to_csv(HISTORY_PATH, mode="a", header=False, index=False)
-
-def log_override(username, lane, duration, reason="manual"):
-    ensure_file(OVERRIDES_PATH, ["ts","user","lane","duration","reason"])
-    row = {"ts": time.time(), "user": username, "lane": int(lane), "duration": float(duration), "reason": reason}
-    df = pd.DataFrame([row])
-    df.to_csv(OVERRIDES_PATH, mode="a", header=False, index=False)
-
-def save_alerts():
-    with open(ALERTS_PATH, "w") as f:
-        json.dump(state["alerts"], f)
-
-def load_alerts():
-    if os.path.exists(ALERTS_PATH):
-        try:
-            with open(ALERTS_PATH, "r") as f:
-                state["alerts"] = json.load(f)
-        except Exception:
-            state["alerts"] = []
-
-
-dm = DecisionManager(num_lanes=len(ROIS))
-dm.init_agent()
-
-MODEL = None
-try:
-    MODEL = load_model()
-except Exception:
-    MODEL = None
-
-# ---------- Mock generator (enhanced) ----------
-class MockGen:
-    def __init__(self, rows=None, max_random=8, seed=None):
-        self.rows = [list(r) for r in (rows or [])]
-        self.i = 0
-        self.max_random = int(max_random)
-        self._rand = random.Random(seed)
-    def next(self):
-        if self.rows:
-            out = self.rows[self.i % len(self.rows)]
-            self.i += 1
-            return list(out)
-        return [self._rand.randint(0, self.max_random) for _ in ROIS]
-    def current(self):
-        if not self.rows:
-            return None
-        idx = (self.i - 1) % len(self.rows)
-        return list(self.rows[idx])
-    def peek(self, offset=0):
-        if not self.rows:
-            return None
-        idx = (self.i + offset) % len(self.rows)
-        return list(self.rows[idx])
-    def reset(self):
-        self.i = 0
-    def set_rows(self, rows):
-        self.rows = [list(r) for r in rows]
-        self.reset()
-    def load_csv(self, path, lane_cols=None):
-        if not os.path.exists(path):
-            raise FileNotFoundError(path)
-        df = pd.read_csv(path)
-        if lane_cols:
-            cols = lane_cols
-        else:
-            cols = [c for c in df.columns if str(c).lower().startswith("lane")]
-            if not cols:
-                cols = [c for c in df.select_dtypes(include=[np.number]).columns]
-        rows = []
-        for _, r in df.iterrows():
-            rows.append([int(r[c]) for c in cols])
-        self.set_rows(rows)
-    def set_max_random(self, m):
-        self.max_random = int(m)
-
-mock_gen = MockGen(seed=42)
+journal = JournalWriter(flush_every=JOURNAL_FLUSH_EVERY, flush_interval=JOURNAL_FLUSH_INTERVAL,
+                        fsync=JOURNAL_FSYNC, max_bytes=JOURNAL_MAX_BYTES, backups=HISTORY_BACKUPS)
+journal.retain(OVERRIDES_PATH, OVERRIDES_BACKUPS)
+if SERVER_PROCESS:
+    journal.start()
+    atexit.register(journal.stop)
+
+T_HISTORY = stage("history_append")
+
+def append_history_row(counts, path=HISTORY_PATH):
+    with T_HISTORY.time():
+        cols = [f"lane{i+1}" for i in range(len(counts))]
+        row = {c: int(v) for c,v in zip(cols, counts)}
+        row["ts"] = time.time()
+        journal.append_csv(path, cols + ["ts"], list(row.values()))
+        if path == HISTORY_PATH:
+            history.add_row(row)
+
+def log_override(username, lane, duration, reason="manual", intersection=DEFAULT_INTERSECTION):
+    row = [time.time(), username, int(lane), float(duration), reason, intersection]
+    journal.append_csv(OVERRIDES_PATH, OVERRIDE_COLUMNS, row)
+
+override_log = OverrideLog(OVERRIDES_PATH, OVERRIDES_BACKUPS)
+
+# ---------- resident history store ----------
+# History (and so /official/prediction, /api/history/rollups and /user/status) covers the default
+# intersection only: it is the one registered with a history_path. Intersections added at runtime
+# through POST /api/intersections record no history.
+class LaneStats:
+    # running count/mean/variance (Welford), population variance like np.std
+    __slots__ = ("n", "mean", "m2")
+    def __init__(self, n=0, mean=0.0, m2=0.0):
+        self.n = int(n); self.mean = float(mean); self.m2 = float(m2)
+    @classmethod
+    def of(cls, vals):
+        if vals.size == 0:
+            return cls()
+        mean = float(vals.mean())
+        return cls(vals.size, mean, float(((vals - mean)**2).sum()))
+    def add(self, x):
+        self.n += 1
+        d = x - self.mean
+        self.mean += d / self.n
+        self.m2 += d * (x - self.mean)
+    def merge(self, other):
+        # Chan et al. parallel combination
+        n = self.n + other.n
+        if n == 0:
+            return LaneStats()
+        d = other.mean - self.mean
+        return LaneStats(n, self.mean + d * other.n / n, self.m2 + other.m2 + d * d * self.n * other.n / n)
+    def var(self):
+        return self.m2 / self.n if self.n > 0 else 0.0
+    def std(self):
+        return math.sqrt(max(0.0, self.var()))
+
+class HistoryStore:
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.load_lock = threading.Lock()
+        self.stats = {}
+        self.tod = {}   # (col, hour of day) -> LaneStats
+        self.rollups = Rollups()
+        self._exists = False
+        self.loaded = False
+        self.version = 0
+    def ensure_loaded(self):
+        # the CSV scan (and pandas) is paid on first use, not at import
+        if not self.loaded:
+            with self.load_lock:
+                if not self.loaded:
+                    self.load()
+    @property
+    def exists(self):
+        self.ensure_loaded()
+        return self._exists
+    def load(self):
+        import pandas as pd
+        with self.lock:
+            self.stats = {}
+            self.tod = {}
+            self.rollups.clear()
+            paths = segments(self.path, HISTORY_BACKUPS)
+            self._exists = bool(paths)
+            if self._exists:
+                df = pd.concat([pd.read_csv(p) for p in paths], ignore_index=True)
+                ts = pd.to_numeric(df["ts"], errors="coerce").values if "ts" in df.columns else None
+                hours = hour_of_day(np.nan_to_num(ts)) if ts is not None else None
+                for col in df.columns:
+                    if not str(col).lower().startswith("lane"):
+                        continue
+                    vals = pd.to_numeric(df[col], errors="coerce").values.astype(float)
+                    keep = ~np.isnan(vals)
+                    self.stats[col] = LaneStats.of(vals[keep])
+                    if ts is not None:
+                        self.rollups.add_many(col, ts, vals)
+                    if hours is not None:
+                        keep &= ~np.isnan(ts)
+                        for h in np.unique(hours[keep]):
+                            self.tod[(col, int(h))] = LaneStats.of(vals[keep & (hours == h)])
+            self.version += 1
+            self.loaded = True
+    def add_row(self, row):
+        self.ensure_loaded()
+        h = hour_of_day(row["ts"]) if row.get("ts") is not None else None
+        with self.lock:
+            self._exists = True
+            for col, v in row.items():
+                if not str(col).lower().startswith("lane") or v is None:
+                    continue
+                self.stats.setdefault(col, LaneStats()).add(float(v))
+                if h is not None:
+                    self.tod.setdefault((col, h), LaneStats()).add(float(v))
+            self.rollups.add_row(row)
+            self.version += 1
+    def lane(self, lane_idx):
+        self.ensure_loaded()
+        with self.lock:
+            s = self.stats.get(f"lane{lane_idx+1}")
+            return None if s is None else LaneStats(s.n, s.mean, s.m2)
+    def lanes(self, lane_idxs, hours=None):
+        # consistent (version, exists, [LaneStats]) view; hours pools the time-of-day buckets
+        self.ensure_loaded()
+        with self.lock:
+            out = []
+            for i in lane_idxs:
+                col = f"lane{i+1}"
+                if hours is None:
+                    s = self.stats.get(col)
+                    out.append(None if s is None else LaneStats(s.n, s.mean, s.m2))
+                    continue
+                s = LaneStats()
+                for h in hours:
+                    if (col, h) in self.tod:
+                        s = s.merge(self.tod[(col, h)])
+                out.append(s)
+            return self.version, self._exists, out
+    def window(self, lane_idxs, since, hours=None):
+        # like lanes(), but over rows since `since`, summed from the hourly rollups
+        self.ensure_loaded()
+        with self.lock:
+            out = []
+            for i in lane_idxs:
+                n, total, sq = self.rollups.summary(f"lane{i+1}", since=since, hours=hours)
+                mean = total / n if n else 0.0
+                out.append(LaneStats(n, mean, max(0.0, sq - total * mean)))
+            return self.version, self._exists, out
+    def mean(self, lane_idx):
+        s = self.lane(lane_idx)
+        return s.mean if s is not None and s.n > 0 else None
+
+history = HistoryStore(HISTORY_PATH)
+forecaster = Forecaster(history)
+
+def load_alerts(ix=None):
+    # snapshot plus event-log replay; raises and acks are persisted by the store itself
+    ix = ix or main_ix
+    ix.alerts.load()
+    ix.touch_state()
+
+# ---------- intersections ----------
+def _record_phase(ix, counts):
+    if ix.history_path:
+        append_history_row(counts, ix.history_path)
+
+def _official_status(ix):
+    # built once per (published state, controller/alerts) change and served as cached bytes
+    with ix.lock:
+        resp = dict(ix.feed.snapshot)
+        resp["controller"] = dict(ix.state.get("controller", {"type":"auto"}))
+        resp["alerts"] = ix.alerts.open_alerts()
+    return resp
+
+def checkpoint_path(iid):
+    return os.path.join(RL_CHECKPOINT_DIR, f"q_{iid}.bin")
+
+def enable_rl(ix):
+    # lazily gives the intersection its agent (from its checkpoint, if any) and checkpoints it from then on
+    if ix.dm.agent is not None:
+        return ix.dm.agent
+    path = checkpoint_path(ix.iid)
+    agent = ix.enable_rl(path)
+    checkpointer.track(agent, path)
+    return agent
+
+def register_intersection(iid, rois, rl=False, **kwargs):
+    ix = Intersection(iid, rois, journal=journal, **kwargs)
+    ix.on_phase = _record_phase
+    ix.status_view = EncodedView(lambda: (ix.feed.version, ix.state_version), lambda: _official_status(ix))
+    if rl:
+        enable_rl(ix)
+    return registry.add(ix)
+
+registry = IntersectionRegistry()
+checkpointer = Checkpointer(interval=RL_CHECKPOINT_INTERVAL)
+atexit.register(checkpointer.stop)
+main_ix = register_intersection(DEFAULT_INTERSECTION, ROIS, rl=True, lane_capacity=LANE_CAPACITY, seed=42,
+                                history_path=HISTORY_PATH, alerts_path=ALERTS_PATH)
+# module-level aliases for the default intersection
+latest, state, dm, mock_gen = main_ix.latest, main_ix.state, main_ix.dm, main_ix.mock_gen
+
+# one detector instance shared by every intersection, loaded once
+models = ModelRegistry(load_model, warmup=warm_up)
 
 # ---------- Background processing loop ----------
 _stop = threading.Event()
-
-def normal_pdf(x, mu, sigma):
-    if sigma <= 0: sigma = 1e-6
-    return (1.0 / (sigma * math.sqrt(2*math.pi))) * math.exp(-0.5 * ((x-mu)/sigma)**2)
-
-def normal_cdf(x, mu, sigma):
-    if sigma <= 0: sigma = 1e-6
-    return 0.5 * (1 + math.erf((x-mu)/(sigma*math.sqrt(2))))
+train_jobs = TrainingJobs(workers=TRAIN_WORKERS)
+atexit.register(train_jobs.shutdown)
+scheduler = Scheduler(registry, workers=TICK_WORKERS, stop_event=_stop)
 
 def processing_loop(mock_mode_flag=True, video_source=0):
-    global latest, MODEL, dm
-    try:
-        MODEL = load_model()
-    except Exception:
-        MODEL = None
-    cap = None
-    # do not set mock_mode once here; read MOCK_MODE each loop
-    if not MOCK_MODE:
-        try:
-            from opencv import get_video_capture
-            cap = get_video_capture(video_source)
-        except Exception as e:
-            latest["error"] = f"camera_open_err:{e}"
-            # fallback to mock mode if camera open fails
-    current_green = 0
-    # initial snapshot
-    initial_counts = mock_gen.next() if MOCK_MODE else [0]*len(ROIS)
-    detections0 = run_mock_detection_from_counts(initial_counts, ROIS) if MOCK_MODE else [[] for _ in ROIS]
-    densities0, counts0 = calculate_density(detections0, lane_capacity=LANE_CAPACITY)
-    _, duration0, timers0 = dm.get_next_signal_state(densities0, current_green, rain=state["rain"], peak=state["peak"], prefer_rl=False)
-    latest.update({"densities": densities0, "counts": counts0, "timers": timers0,
-                   "next_lane": current_green, "signal_timer": duration0, "mode": "mock" if MOCK_MODE else "camera",
-                   "error": None, "timestamp": time.time()})
-    signal_timer = duration0
-    next_densities = None
-    next_counts = None
-    yolo_triggered = False
-    load_alerts()
-
-    while not _stop.is_set():
-        time.sleep(1.0)
-        signal_timer -= 1.0
-
-        # read runtime mode each loop
-        mock_mode = MOCK_MODE
-
-        # trigger detection only when timer <= YOLO_TRIGGER_BEFORE and not already taken
-        if signal_timer <= YOLO_TRIGGER_BEFORE and not yolo_triggered:
-            try:
-                if mock_mode:
-                    next_counts = mock_gen.next()
-                    detections_next = run_mock_detection_from_counts(next_counts, ROIS)
-                else:
-                    from opencv import read_frame
-                    if cap is None:
-                        cap = None
-                        try:
-                            from opencv import get_video_capture
-                            cap = get_video_capture(video_source)
-                        except Exception as e:
-                            latest["error"] = f"camera_open_err:{e}"
-                            mock_mode = True
-                    frame = read_frame(cap) if cap is not None else None
-                    detections_next = run_yolo_detection(frame, MODEL, ROIS) if frame is not None else []
-                next_densities, next_counts = calculate_density(detections_next, lane_capacity=LANE_CAPACITY)
-                yolo_triggered = True
-            except Exception as e:
-                next_densities, next_counts = None, None
-                latest["error"] = f"detection_error:{str(e)}"
-
-        controller = state.get("controller", {"type":"auto"})
-        if controller.get("type") == "manual":
-            controller["remaining"] = max(0, controller.get("remaining", 0) - 1)
-            latest.update({"mode": "manual", "next_lane": controller["lane"], "signal_timer": controller["remaining"]})
-            if controller["remaining"] <= 0:
-                state["controller"] = {"type": "auto"}
-            continue
-
-        if signal_timer <= 0:
-            if next_densities is not None:
-                chosen_lane, chosen_dur, timers = dm.get_next_signal_state(next_densities, current_green,
-                                                                           rain=state["rain"], peak=state["peak"],
-                                                                           prefer_rl=False)
-                current_green = chosen_lane
-                signal_timer = chosen_dur
-                latest.update({"densities": next_densities, "counts": next_counts, "timers": timers,
-                               "next_lane": current_green, "signal_timer": signal_timer,
-                               "mode": "mock" if mock_mode else "camera", "error": None,
-                               "timestamp": time.time()})
-                append_history_row(next_counts)
-            else:
-                next_idx = (current_green + 1) % len(ROIS)
-                fallback_t = dm.last_timers[next_idx] if getattr(dm, "last_timers", None) else MIN_GREEN
-                current_green = next_idx
-                signal_timer = int(round(fallback_t))
-                latest.update({"densities": dm.last_timers if getattr(dm, "last_timers", None) else [0]*len(ROIS),
-                               "counts": dm.last_timers if getattr(dm, "last_timers", None) else [0]*len(ROIS),
-                               "timers": dm.last_timers if getattr(dm, "last_timers", None) else [0]*len(ROIS),
-                               "next_lane": current_green, "signal_timer": signal_timer,
-                               "mode": "fallback", "error": "detection_failed", "timestamp": time.time()})
-            yolo_triggered = False
-            next_densities, next_counts = None, None
-
-            timers_now = latest.get("timers", [0]*len(ROIS))
-            for i, t in enumerate(timers_now):
-                if t >= MAX_GREEN:
-                    state["streak_seconds"][i] += signal_timer if signal_timer>0 else 0
-                else:
-                    state["streak_seconds"][i] = 0
-                if state["streak_seconds"][i] >= MAX_GREEN_STREAK_SECONDS:
-                    existing = [a for a in state["alerts"] if a.get("lane")==i and not a.get("ack", False)]
-                    if not existing:
-                        alert = {"lane": i, "msg": f"Lane {i+1} at MAX_GREEN for prolonged period", "ts": time.time(), "ack": False}
-                        state["alerts"].append(alert)
-                        save_alerts()
-            continue
-
-        latest["signal_timer"] = signal_timer
-        latest["timestamp"] = time.time()
+    # mock intersections start ticking right away; camera ones pick the model up when it is ready
+    models.load(MODEL_PATH, background=MODEL_BACKGROUND_LOAD, on_ready=registry.set_model)
+    history.ensure_loaded()
+    checkpointer.start()
+    main_ix.video_source = video_source
+    for ix in registry.all():
+        ix.start()
+        load_alerts(ix)
+    scheduler.run()
+
+# ---------- metrics ----------
+HTTP_SECONDS = REGISTRY.histogram("aito_http_request_seconds", "Request latency by route", ("method", "route"))
+HTTP_REQUESTS = REGISTRY.counter("aito_http_requests_total", "Requests by route and status", ("method", "route", "status"))
+REGISTRY.gauge("aito_intersections", "Registered intersections", fn=lambda: len(registry))
+REGISTRY.gauge("aito_ticks_missed", "Scheduler ticks skipped after a stall", fn=lambda: scheduler.clock.missed)
+REGISTRY.gauge("aito_tick_overruns", "Ticks whose work exceeded the period", fn=lambda: scheduler.clock.overruns)
+REGISTRY.gauge("aito_sessions", "Live sessions", fn=lambda: len(SESSIONS))
+REGISTRY.gauge("aito_journal_pending", "Records queued for the journal writer, including ones held for retry", fn=lambda: journal.pending())
+REGISTRY.gauge("aito_journal_errors", "Journal write errors (failed records are kept and retried)", fn=lambda: journal.stats["errors"])
+REGISTRY.gauge("aito_stream_subscribers", "Open SSE streams", ("intersection",),
+               fn=lambda: {ix.iid: ix.feed.subscribers for ix in registry.all()})
+REGISTRY.gauge("aito_agent_q_version", "Q table version", ("intersection",),
+               fn=lambda: {ix.iid: ix.dm.agent.q_version for ix in registry.all() if ix.dm.agent is not None})
+REGISTRY.gauge("aito_detection_trigger_lead_seconds", "Seconds before a phase change that detection is requested",
+               ("intersection",), fn=lambda: {ix.iid: ix.trigger_lead for ix in registry.all() if not ix.mock_mode})
+
+@app.before_request
+def _start_timer():
+    g.t0 = time.perf_counter()
+
+def _observe(status):
+    t0 = g.pop("t0", None)
+    if t0 is not None:
+        # label by the route pattern, not the URL, to keep cardinality bounded
+        route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        HTTP_SECONDS.labels(request.method, route).observe(time.perf_counter() - t0)
+        HTTP_REQUESTS.labels(request.method, route, status).inc()
+
+@app.after_request
+def _observe_request(resp):
+    _observe(resp.status_code)
+    return resp
+
+@app.teardown_request
+def _observe_failed_request(exc):
+    # after_request never runs when an exception propagates (debug/testing, or a failing after_request
+    # hook); t0 is still set only in that case, so this records the 500 without double counting
+    _observe(500)
+
+@app.route("/ready")
+def api_ready():
+    # 200 once the control loop is ticking, history is loaded and, if any intersection runs on
+    # a camera, the detector is loaded and warmed up
+    model = models.status(MODEL_PATH)
+    needs_model = any(not ix.mock_mode for ix in registry.all())
+    checks = {"loop": scheduler.clock.ticks > 0, "history": history.loaded,
+              "model": model["state"] == "ready" or not needs_model}
+    ok = all(checks.values())
+    return jsonify({"ready": ok, "checks": checks, "model": model}), 200 if ok else 503
+
+@app.route("/metrics")
+def api_metrics():
+    return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
 
 # ---------- Prediction helper ----------
-def predict_next_hour_from_history(lane_idx: int, minutes: int = 60):
-    if not os.path.exists(HISTORY_PATH):
-        return {"error":"no_history"}
-    df = pd.read_csv(HISTORY_PATH)
-    col = f"lane{lane_idx+1}"
-    if col not in df.columns or df[col].dropna().size < 2:
-        return {"error":"insufficient_history"}
-    vals = df[col].dropna().values
-    mu = float(np.mean(vals))
-    sigma = float(np.std(vals)) if np.std(vals) > 0 else 1.0
-    x = np.linspace(max(0, mu-4*sigma), mu+4*sigma, 200)
-    pdf = [normal_pdf(xx, mu, sigma) for xx in x]
-    cdf = [normal_cdf(xx, mu, sigma) for xx in x]
-    return {"x": list(map(float,x)), "pdf": list(map(float,pdf)), "cdf": list(map(float,cdf)), "mu": mu, "sigma": sigma}
+def predict_next_hour_from_history(lane_idx: int, minutes: int = 60, tod: bool = False, days: Optional[float] = None):
+    # days limits the fit to recent history (read from the hourly rollups, not the raw rows)
+    return forecaster.predict(lane_idx, minutes, num_lanes=len(ROIS), tod=tod, days=days)
 
 # ---------- Endpoints ----------
 @app.route("/auth/signup", methods=["POST"])
@@ -377,136 +441,357 @@ def enroll_official():
     ok = create_user(name, pw, role="official")
     return jsonify({"ok": ok})
 
+@app.route("/api/intersections")
+@require_token
+def api_intersections():
+    return jsonify({"intersections": [{"id": ix.iid, "lanes": ix.num_lanes, "mode": ix.latest.get("mode"),
+                                       "rl": ix.dm.agent is not None}
+                                      for ix in registry.all()],
+                    "last_tick_ms": scheduler.last_tick_seconds * 1000.0})
+
+@app.route("/api/tick_stats")
+@require_token
+def api_tick_stats():
+    return jsonify(scheduler.clock.stats())
+
+@app.route("/api/intersections", methods=["POST"])
+@official_required
+def api_add_intersection():
+    # runtime intersections get no history_path: only the default intersection records history
+    body = request.json or {}
+    iid = body.get("id"); rois = body.get("rois")
+    if not iid or not isinstance(rois, list) or not rois:
+        return jsonify({"error":"send {'id': str, 'rois': [[x,y,w,h], ...]}"}), 400
+    rl = bool(body.get("rl", False))
+    if rl and len(rois) > RL_MAX_LANES:
+        return jsonify({"error": f"RL supports at most {RL_MAX_LANES} lanes per intersection"}), 400
+    if registry.get(iid) is not None:
+        return jsonify({"error":"exists"}), 400
+    try:
+        ix = register_intersection(iid, rois, rl=rl, lane_capacity=int(body.get("lane_capacity", LANE_CAPACITY)),
+                                   mock_mode=bool(body.get("mock", True)), video_source=body.get("video_source", 0),
+                                   mock_rows=body.get("mock_rows"))
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"ok": True, "id": ix.iid, "lanes": ix.num_lanes, "rl": rl})
+
+@app.route("/api/intersections/<iid>", methods=["DELETE"])
+@official_required
+def api_remove_intersection(iid):
+    if iid == DEFAULT_INTERSECTION:
+        return jsonify({"error":"forbidden"}), 403
+    if registry.remove(iid) is None:
+        return jsonify({"error":"unknown_intersection"}), 404
+    checkpointer.untrack(checkpoint_path(iid))   # saves any training since the last checkpoint first
+    return jsonify({"ok": True})
+
 @app.route("/api/traffic_data")
-def api_traffic():
-    return jsonify(latest)
+@app.route("/api/intersections/<iid>/traffic_data")
+@with_intersection
+def api_traffic(ix):
+    # one attribute read of an immutable snapshot: no lock, no per-request encoding
+    snap = ix.feed.current()
+    tag = f"{ix.iid}-{ix.feed.etag(snap)}"
+    if request.if_none_match.contains(tag):
+        resp = app.response_class(status=304)
+    else:
+        resp = app.response_class(snap.body, mimetype="application/json")
+    resp.set_etag(tag)
+    resp.headers["Cache-Control"] = "no-cache"
+    return resp
+
+@app.route("/api/stream")
+@app.route("/api/intersections/<iid>/stream")
+@with_intersection
+def api_stream(ix):
+    # "<epoch>-<version>"; an id from another epoch (or malformed) gets a fresh snapshot
+    last = request.headers.get("Last-Event-ID") or request.args.get("since")
+    # soft cap: streams only count once their generator starts, so a burst can overshoot slightly
+    if sum(x.feed.subscribers for x in registry.all()) >= MAX_STREAMS:
+        resp = jsonify({"error": "too_many_streams", "poll": "/api/traffic_data"})
+        resp.status_code = 503
+        resp.headers["Retry-After"] = "30"
+        return resp
+    return Response(ix.feed.events(last, stop=_stop), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 @app.route("/api/mock_rows", methods=["POST"])
+@app.route("/api/intersections/<iid>/mock_rows", methods=["POST"])
 @require_token
-def api_set_mock_rows():
+@with_intersection
+def api_set_mock_rows(ix):
     body = request.json or {}
     rows = body.get("rows")
     if not rows or not isinstance(rows, list):
         return jsonify({"error":"send {'rows': [[c1,c2,...],[...], ...] }"}), 400
     try:
-        mock_gen.set_rows(rows)
+        ix.mock_gen.set_rows(rows)
         return jsonify({"ok": True, "rows_loaded": len(rows)})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @app.route("/api/set_mode", methods=["POST"])
+@app.route("/api/intersections/<iid>/set_mode", methods=["POST"])
 @require_token
-def api_set_mode():
-    global MOCK_MODE
+@with_intersection
+def api_set_mode(ix):
     body = request.json or {}
     mm = body.get("mock", None)
     if mm is None:
         return jsonify({"error":"send {'mock': true/false}"}), 400
-    MOCK_MODE = bool(mm)
-    latest["mode"] = "mock" if MOCK_MODE else "camera"
-    print("MOCK_MODE set to", MOCK_MODE)
-    return jsonify({"status":"ok","mock":MOCK_MODE})
+    with ix.lock:
+        ix.mock_mode = bool(mm)
+        ix.latest["mode"] = "mock" if ix.mock_mode else "camera"
+        ix.publish()
+    print(f"[{ix.iid}] MOCK_MODE set to", ix.mock_mode)
+    return jsonify({"status":"ok","mock":ix.mock_mode})
 
 @app.route("/api/emergency", methods=["POST"])
+@app.route("/api/intersections/<iid>/emergency", methods=["POST"])
 @require_token
-def api_emergency():
+@with_intersection
+def api_emergency(ix):
+    latest, state = ix.latest, ix.state
     body = request.json or {}
     on = bool(body.get("on", True))
     lane = body.get("lane", None)
-    if on:
-        latest["emergency"] = True
-        latest["emergency_lane"] = int(lane) if lane is not None else None
-        lane_idx = latest.get("emergency_lane", None)
-        if lane_idx is None:
-            lane_idx = 0
-        state["controller"] = {"type":"manual", "official":"system", "lane": int(lane_idx), "remaining": 20}
-        return jsonify({"ok":True, "lane": lane_idx})
-    else:
-        latest["emergency"] = False
-        latest["emergency_lane"] = None
-        if state.get("controller", {}).get("official") == "system":
-            state["controller"] = {"type":"auto"}
-        return jsonify({"ok":True})
+    # mutate under the intersection lock so a concurrent tick never publishes a half-applied change
+    with ix.lock:
+        if on:
+            latest["emergency"] = True
+            latest["emergency_lane"] = int(lane) if lane is not None else None
+            lane_idx = latest.get("emergency_lane", None)
+            if lane_idx is None:
+                lane_idx = 0
+            state["controller"] = {"type":"manual", "official":"system", "lane": int(lane_idx), "remaining": 20}
+            ix.touch_state()
+            ix.publish()
+            return jsonify({"ok":True, "lane": lane_idx})
+        else:
+            latest["emergency"] = False
+            latest["emergency_lane"] = None
+            if state.get("controller", {}).get("official") == "system":
+                state["controller"] = {"type":"auto"}
+            ix.touch_state()
+            ix.publish()
+            return jsonify({"ok":True})
 
 @app.route("/api/pedestrian", methods=["POST"])
+@app.route("/api/intersections/<iid>/pedestrian", methods=["POST"])
 @require_token
-def api_pedestrian():
+@with_intersection
+def api_pedestrian(ix):
     body = request.json or {}
     lane = int(body.get("lane", 0))
-    state["ped_request"] = {"lane": lane, "requested_at": time.time()}
+    with ix.lock:
+        ix.state["ped_request"] = {"lane": lane, "requested_at": time.time()}
     return jsonify({"ok":True, "lane": lane})
 
 @app.route("/official/status")
+@app.route("/api/intersections/<iid>/status")
 @official_required
-def official_status():
-    resp = latest.copy()
-    resp["controller"] = state.get("controller", {"type":"auto"})
-    resp["alerts"] = [a for a in state.get("alerts", [])]
-    return jsonify(resp)
+@with_intersection
+def official_status(ix):
+    return app.response_class(ix.status_view.get(), mimetype="application/json")
 
 @app.route("/official/prediction")
 @official_required
 def official_prediction():
-    lane = int(request.args.get("lane", 0))
-    res = predict_next_hour_from_history(lane)
+    # default intersection only (see the history store)
+    try:
+        lane = int(request.args.get("lane", 0))
+        minutes = int(request.args.get("minutes", 60))
+        days = float(request.args["days"]) if request.args.get("days") else None
+        if not 0 <= lane < len(ROIS):
+            raise ValueError("lane out of range")
+        tod = str(request.args.get("tod", "0")).lower() in ("1", "true", "yes")
+        res = predict_next_hour_from_history(lane, minutes, tod=tod, days=days)
+    except ValueError:
+        return jsonify({"error":"bad_params"}), 400
+    return jsonify(res)
+
+@app.route("/api/history/rollups")
+@require_token
+def history_rollups():
+    # ?lane=&since=&until=&resolution=minute|hour|day&max_points= (last 24h, auto resolution by default);
+    # default intersection only (see the history store)
+    args = request.args
+    try:
+        until = float(args["until"]) if args.get("until") else time.time()
+        since = float(args["since"]) if args.get("since") else until - 86400
+        lanes = [int(args["lane"])] if args.get("lane") not in (None, "") else range(len(ROIS))
+        if any(not 0 <= i < len(ROIS) for i in lanes):
+            raise ValueError("lane out of range")
+        max_points = max(1, int(args.get("max_points", 500)))
+        history.ensure_loaded()
+        res = history.rollups.query([f"lane{i+1}" for i in lanes], since, until,
+                                    resolution=args.get("resolution") or None, max_points=max_points)
+    except ValueError:
+        return jsonify({"error":"bad_params"}), 400
     return jsonify(res)
 
 @app.route("/official/takeover", methods=["POST"])
+@app.route("/api/intersections/<iid>/takeover", methods=["POST"])
 @official_required
-def official_takeover():
+@with_intersection
+def official_takeover(ix):
     body = request.json or {}
     lane = int(body.get("lane", 0))
     duration = int(body.get("duration", MIN_GREEN))
-    state["controller"] = {"type":"manual", "official": request.session["username"], "lane": lane, "remaining": duration}
-    log_override(request.session["username"], lane, duration, reason="manual_takeover")
+    with ix.lock:
+        ix.state["controller"] = {"type":"manual", "official": request.session["username"], "lane": lane, "remaining": duration}
+        ix.touch_state()
+    log_override(request.session["username"], lane, duration, reason="manual_takeover", intersection=ix.iid)
     return jsonify({"ok":True, "lane": lane, "duration": duration})
 
 @app.route("/official/release", methods=["POST"])
+@app.route("/api/intersections/<iid>/release", methods=["POST"])
 @official_required
-def official_release():
-    state["controller"] = {"type":"auto"}
+@with_intersection
+def official_release(ix):
+    with ix.lock:
+        ix.state["controller"] = {"type":"auto"}
+        ix.touch_state()
     return jsonify({"ok":True})
 
 @app.route("/alerts")
+@app.route("/api/intersections/<iid>/alerts")
 @official_required
-def get_alerts():
-    return jsonify(state.get("alerts", []))
+@with_intersection
+def get_alerts(ix):
+    # newest first; ?lane=&ack=0|1&since=&until=&limit=&cursor= (cursor = previous next_cursor)
+    args = request.args
+    try:
+        lane = int(args["lane"]) if args.get("lane") not in (None, "") else None
+        ack = {"1": True, "true": True, "0": False, "false": False}.get(str(args.get("ack", "")).lower())
+        since = float(args["since"]) if args.get("since") else None
+        until = float(args["until"]) if args.get("until") else None
+        cursor = int(args["cursor"]) if args.get("cursor") else None
+        limit = int(args.get("limit", 100))
+    except ValueError:
+        return jsonify({"error":"bad_params"}), 400
+    items, next_cursor = ix.alerts.query(lane=lane, ack=ack, since=since, until=until, cursor=cursor, limit=limit)
+    return jsonify({"alerts": items, "next_cursor": next_cursor, "total": len(ix.alerts)})
 
 @app.route("/alerts/ack", methods=["POST"])
+@app.route("/api/intersections/<iid>/alerts/ack", methods=["POST"])
 @official_required
-def ack_alert():
+@with_intersection
+def ack_alert(ix):
     body = request.json or {}
-    idx = body.get("lane")
-    if idx is None:
-        return jsonify({"error":"lane required"}), 400
-    for a in state["alerts"]:
-        if a.get("lane") == int(idx):
-            a["ack"] = True
-    save_alerts()
-    return jsonify({"ok":True})
+    idx, aid = body.get("lane"), body.get("id")
+    if idx is None and aid is None:
+        return jsonify({"error":"lane or id required"}), 400
+    try:
+        n = ix.alerts.ack(lane=idx, alert_id=aid)
+    except (TypeError, ValueError):
+        return jsonify({"error":"bad_params"}), 400
+    ix.touch_state()
+    return jsonify({"ok":True, "acked": n})
 
 @app.route("/api/train_rl", methods=["POST"])
+@app.route("/api/intersections/<iid>/train_rl", methods=["POST"])
 @official_required
-def api_train_rl():
+@with_intersection
+def api_train_rl(ix):
+    dm = ix.dm
+    if dm.agent is None:
+        return jsonify({"error":"no_agent"}), 400
     body = request.json or {}
-    iters = int(body.get("iters", 1000))
-    dm.train_agent_from_buffer(iterations=iters)
-    return jsonify({"status":"trained", "iters": iters, "buffer_size": len(dm.agent.buffer) if dm.agent else 0})
+    try:
+        iters = int(body.get("iters", 1000))
+        job = train_jobs.submit(dm.agent, iters, owner=ix.iid, lock=ix.lock)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except RuntimeError as e:
+        return jsonify({"error": str(e)}), 409
+    return jsonify({"status": job["status"], "job_id": job["id"], "iters": iters,
+                    "buffer_size": job["buffer_size"]}), 202
+
+@app.route("/api/rl", methods=["POST"])
+@app.route("/api/intersections/<iid>/rl", methods=["POST"])
+@official_required
+@with_intersection
+def api_rl_mode(ix):
+    # {"enabled": bool}: turning RL on creates the agent; turning it off saves and frees it
+    body = request.json or {}
+    if not isinstance(body.get("enabled"), bool):
+        return jsonify({"error":"send {'enabled': bool}"}), 400
+    if body["enabled"]:
+        try:
+            agent = enable_rl(ix)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        return jsonify({"ok": True, "enabled": True, "q_version": agent.q_version})
+    if ix.disable_rl() is not None:
+        checkpointer.untrack(checkpoint_path(ix.iid))
+    return jsonify({"ok": True, "enabled": False})
+
+@app.route("/api/train_rl/<job_id>")
+@official_required
+def api_train_job(job_id):
+    job = train_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error":"unknown_job"}), 404
+    return jsonify(job)
 
 @app.route("/api/agent_stats")
+@app.route("/api/intersections/<iid>/agent_stats")
 @official_required
-def api_agent_stats():
+@with_intersection
+def api_agent_stats(ix):
+    dm = ix.dm
     if dm.agent is None:
         return jsonify({"agent": None})
-    return jsonify({"eps": dm.agent.eps, "buffer_len": len(dm.agent.buffer)})
+    return jsonify({"eps": dm.agent.eps, "buffer_len": len(dm.agent.buffer), "q_version": dm.agent.q_version})
+
+@app.route("/api/detection_stats")
+@app.route("/api/intersections/<iid>/detection_stats")
+@official_required
+@with_intersection
+def api_detection_stats(ix):
+    # motion gating: frames seen, inferences run vs. skipped, share of pixels inferred, CPU saved (estimate);
+    # trigger: current lead, latency quantiles, last frame staleness at a phase change, fallbacks,
+    # phase overshoot dropped after stalls
+    return jsonify(dict(ix.gate.summary(), trigger=dict(ix.trigger_stats)))
 
 @app.route("/api/logs")
 @official_required
 def api_logs():
-    overrides = []
-    if os.path.exists(OVERRIDES_PATH):
-        overrides = pd.read_csv(OVERRIDES_PATH).to_dict(orient="records")
-    return jsonify({"overrides": overrides})
+    # ?since=&until=&user=&lane=&intersection=&limit=&cursor=&order=asc|desc (newest first by default);
+    # format=ndjson streams every matching row (oldest first by default) instead of one page
+    args = request.args
+    try:
+        filters = {
+            "since": float(args["since"]) if args.get("since") else None,
+            "until": float(args["until"]) if args.get("until") else None,
+            "user": args.get("user") or None,
+            "lane": int(args["lane"]) if args.get("lane") not in (None, "") else None,
+            "intersection": args.get("intersection") or None,
+            "cursor": args.get("cursor") or None,
+        }
+        if filters["cursor"]:
+            parse_cursor(filters["cursor"])
+        ndjson = args.get("format") == "ndjson"
+        order = args.get("order", "asc" if ndjson else "desc")
+        if order not in ("asc", "desc"):
+            raise ValueError(order)
+        filters["desc"] = order == "desc"
+        limit = int(args.get("limit", 100))
+    except ValueError:
+        return jsonify({"error":"bad_params"}), 400
+    if ndjson:
+        def gen():
+            buf = []
+            for _, r in override_log.scan(**filters):
+                buf.append(json.dumps(r))
+                if len(buf) == 256:
+                    yield "\n".join(buf) + "\n"; buf = []
+            if buf:
+                yield "\n".join(buf) + "\n"
+        return Response(stream_with_context(gen()), mimetype="application/x-ndjson")
+    rows, next_cursor = override_log.page(limit, **filters)
+    return jsonify({"overrides": rows, "next_cursor": next_cursor})
 
 @app.route("/camera/preview")
 @official_required
@@ -516,18 +801,16 @@ def camera_preview():
 @app.route("/user/status")
 @require_token
 def user_status():
-    resp = {"latest": latest.copy()}
+    # default intersection only (see the history store)
+    return app.response_class(user_view.get(), mimetype="application/json")
+
+def _user_status():
     mus = []
-    if os.path.exists(HISTORY_PATH):
-        df = pd.read_csv(HISTORY_PATH)
-        for i in range(len(ROIS)):
-            col = f"lane{i+1}"
-            if col in df.columns and df[col].size>0:
-                mus.append(float(np.mean(df[col].dropna().values)))
-            else:
-                mus.append(None)
-    resp["predicted_mu"] = mus
-    return jsonify(resp)
+    if history.exists:
+        mus = [history.mean(i) for i in range(len(ROIS))]
+    return {"latest": main_ix.feed.snapshot, "predicted_mu": mus}
+
+user_view = EncodedView(lambda: (main_ix.feed.version, history.version), _user_status)
 
 @app.route("/")
 def index():
@@ -541,3 +824,5 @@ if __name__ == "__main__":
         app.run(host="0.0.0.0", port=PORT, debug=False)
     finally:
         _stop.set()
+        checkpointer.stop()
+        journal.stop()
@@ -0,0 +1,48 @@
+# bench_decision_batch.py
+# Rule decisions for N intersections: per-intersection DecisionManager calls vs. one next_signal_state_batch call.
+#   python bench_decision_batch.py [--sizes 100,1000,10000] [--lanes 4] [--repeat 5]
+import argparse, time
+
+import numpy as np
+
+from decision import DecisionManager, next_signal_state_batch
+
+def make_inputs(n, lanes, rng):
+    d = rng.uniform(0, 120, size=(n, lanes)).round(1)
+    d[rng.random((n, lanes)) < 0.3] = 0.0                 # empty lanes
+    d[rng.random(n) < 0.05] = 0.1                         # whole intersections at the zero threshold
+    return d, rng.integers(0, lanes, size=n), rng.random(n) < 0.3, rng.random(n) < 0.2
+
+def scalar(dms, d, cur, rain, peak):
+    rows = d.tolist()
+    return [dm.get_next_signal_state(rows[i], int(cur[i]), rain=bool(rain[i]), peak=bool(peak[i]))
+            for i, dm in enumerate(dms)]
+
+def check(out, ref):
+    nxt, dur, timers = out
+    for i, (n_s, d_s, t_s) in enumerate(ref):
+        if n_s != nxt[i] or d_s != dur[i] or list(t_s) != timers[i].tolist():
+            raise AssertionError(f"mismatch at {i}: scalar {(n_s, d_s, t_s)} batch {(nxt[i], dur[i], timers[i])}")
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", default="100,1000,10000")
+    ap.add_argument("--lanes", type=int, default=4)
+    ap.add_argument("--repeat", type=int, default=5)
+    args = ap.parse_args()
+    rng = np.random.default_rng(0)
+    print(f"{'intersections':>13} {'scalar ms':>10} {'batch ms':>9} {'speedup':>8}")
+    for n in [int(x) for x in args.sizes.split(",")]:
+        d, cur, rain, peak = make_inputs(n, args.lanes, rng)
+        dms = [DecisionManager(args.lanes) for _ in range(n)]
+        ref = scalar(dms, d, cur, rain, peak)
+        check(next_signal_state_batch(d, cur, rain, peak), ref)
+        t_s = min(_timed(lambda: scalar(dms, d, cur, rain, peak)) for _ in range(args.repeat))
+        t_b = min(_timed(lambda: next_signal_state_batch(d, cur, rain, peak)) for _ in range(args.repeat))
+        print(f"{n:>13} {t_s*1e3:>10.2f} {t_b*1e3:>9.3f} {t_s/t_b:>8.1f}x")
+
+def _timed(fn):
+    t0 = time.perf_counter(); fn(); return time.perf_counter() - t0
+
+if __name__ == "__main__":
+    main()
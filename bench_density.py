@@ -0,0 +1,53 @@
+# bench_density.py
+# Latency and peak memory of the three ways to get lane densities at high vehicle counts:
+#   dicts   - run_mock_detection_from_counts + calculate_density (one dict per vehicle)
+#   compact - detection.Detections structured array + calculate_density
+#   counts  - density.density_from_counts, no per-vehicle objects at all
+#   python bench_density.py [--counts 10,100,1000,10000] [--repeat 20]
+import argparse, time, tracemalloc
+
+import numpy as np
+
+from detection import Detections, run_mock_detection_from_counts
+from density import calculate_density, density_from_counts
+
+ROIS = [(50,250,120,200),(200,250,120,200),(350,250,120,200),(500,250,120,200)]
+
+def compact_from_counts(counts):
+    n = sum(counts)
+    lanes = np.repeat(np.arange(len(counts)), counts)
+    xyxy = np.zeros((n, 4), dtype=np.int32); xyxy[:, 2:] = 1
+    return Detections.from_arrays(xyxy, np.full(n, 0.8), np.zeros(n, dtype=np.int16), lanes, len(counts))
+
+PATHS = {
+    "dicts": lambda c: calculate_density(run_mock_detection_from_counts(c, ROIS)),
+    "compact": lambda c: calculate_density(compact_from_counts(c)),
+    "counts": lambda c: density_from_counts(c),
+}
+
+def measure(fn, counts, repeat):
+    fn(counts)
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        fn(counts)
+    latency = (time.perf_counter() - t0) / repeat
+    tracemalloc.start()
+    fn(counts)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return latency, peak
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--counts", default="10,100,1000,10000", help="vehicles per lane")
+    ap.add_argument("--repeat", type=int, default=20)
+    args = ap.parse_args()
+    print(f"{'per lane':>9} {'path':<8} {'latency us':>12} {'peak KiB':>10}")
+    for per_lane in [int(x) for x in args.counts.split(",")]:
+        counts = [per_lane] * len(ROIS)
+        for name, fn in PATHS.items():
+            lat, peak = measure(fn, counts, args.repeat)
+            print(f"{per_lane:>9} {name:<8} {lat*1e6:>12.1f} {peak/1024:>10.1f}")
+
+if __name__ == "__main__":
+    main()
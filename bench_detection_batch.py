@@ -0,0 +1,63 @@
+# bench_detection_batch.py
+# Frames/sec for per-frame run_yolo_detection vs. batched run_yolo_detection_batch and MicroBatcher.
+#   python bench_detection_batch.py [--weights yolov8n.pt] [--frames 64] [--batches 1,2,4,8,16] [--size 640x480]
+import argparse, sys, time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from detection import load_model, run_yolo_detection, run_yolo_detection_batch, MicroBatcher
+
+ROIS = [(50,250,120,200),(200,250,120,200),(350,250,120,200),(500,250,120,200)]
+
+def make_frames(n, w, h, seed=0):
+    rng = np.random.default_rng(seed)
+    frames = []
+    for _ in range(n):
+        img = np.full((h, w, 3), 90, dtype=np.uint8)
+        for _ in range(12):
+            x, y = int(rng.integers(0, w - 60)), int(rng.integers(0, h - 40))
+            img[y:y+40, x:x+60] = rng.integers(0, 255, size=3, dtype=np.uint8)
+        frames.append(img)
+    return frames
+
+def fps(fn, n):
+    t0 = time.perf_counter()
+    fn()
+    return n / (time.perf_counter() - t0)
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--weights", default="yolov8n.pt")
+    ap.add_argument("--frames", type=int, default=64)
+    ap.add_argument("--batches", default="1,2,4,8,16")
+    ap.add_argument("--size", default="640x480")
+    ap.add_argument("--cameras", type=int, default=8, help="concurrent submitters for the MicroBatcher run")
+    args = ap.parse_args()
+    model = load_model(args.weights)
+    if model is None:
+        print("YOLO model not available (install ultralytics and weights)", file=sys.stderr)
+        sys.exit(1)
+    w, h = (int(v) for v in args.size.lower().split("x"))
+    frames = make_frames(args.frames, w, h)
+    run_yolo_detection(frames[0], model, ROIS)  # warm-up
+
+    single = fps(lambda: [run_yolo_detection(f, model, ROIS) for f in frames], len(frames))
+    print(f"{'mode':<22} {'frames/s':>10} {'speedup':>8}")
+    print(f"{'single':<22} {single:>10.1f} {1.0:>8.2f}")
+    for b in [int(x) for x in args.batches.split(",")]:
+        def run():
+            for i in range(0, len(frames), b):
+                run_yolo_detection_batch([(f, ROIS) for f in frames[i:i+b]], model)
+        r = fps(run, len(frames))
+        print(f"{f'batch={b}':<22} {r:>10.1f} {r/single:>8.2f}")
+
+    batcher = MicroBatcher(model, max_batch_size=max(int(x) for x in args.batches.split(",")), max_wait=0.005)
+    with ThreadPoolExecutor(max_workers=args.cameras) as pool:
+        r = fps(lambda: list(pool.map(lambda f: batcher.detect(f, ROIS), frames)), len(frames))
+    batcher.close()
+    mean_batch = batcher.stats["frames"] / max(1, batcher.stats["batches"])
+    print(f"{f'microbatch x{args.cameras}':<22} {r:>10.1f} {r/single:>8.2f}   (mean batch {mean_batch:.1f})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+# bench_intersections.py
+# Tick latency of the shared scheduler vs. number of registered intersections (mock mode, no persistence).
+#   python bench_intersections.py [--sizes 1,10,100,500,1000] [--ticks 60] [--workers 1,8]
+import argparse, statistics
+
+from controller import Intersection, IntersectionRegistry, Scheduler
+
+ROIS = [(50,250,120,200),(200,250,120,200),(350,250,120,200),(500,250,120,200)]
+
+def bench(n, ticks, workers):
+    reg = IntersectionRegistry()
+    for k in range(n):
+        reg.add(Intersection(f"ix{k}", ROIS, seed=k))
+    sched = Scheduler(reg, workers=workers)
+    sched.tick_all()  # warm-up: runs every intersection's initial snapshot
+    samples = [sched.tick_all() for _ in range(ticks)]
+    sched.stop()
+    samples.sort()
+    return {
+        "mean_ms": statistics.mean(samples) * 1000.0,
+        "p50_ms": samples[len(samples)//2] * 1000.0,
+        "p95_ms": samples[min(len(samples)-1, int(len(samples)*0.95))] * 1000.0,
+        "max_ms": samples[-1] * 1000.0,
+        "us_per_ix": statistics.mean(samples) / n * 1e6,
+    }
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", default="1,10,100,500,1000")
+    ap.add_argument("--ticks", type=int, default=60)
+    ap.add_argument("--workers", default="1,8")
+    args = ap.parse_args()
+    print(f"{'n':>6} {'workers':>7} {'mean ms':>9} {'p50 ms':>9} {'p95 ms':>9} {'max ms':>9} {'us/ix':>8}")
+    for w in [int(x) for x in args.workers.split(",")]:
+        for n in [int(x) for x in args.sizes.split(",")]:
+            r = bench(n, args.ticks, w)
+            print(f"{n:>6} {w:>7} {r['mean_ms']:>9.3f} {r['p50_ms']:>9.3f} {r['p95_ms']:>9.3f} {r['max_ms']:>9.3f} {r['us_per_ix']:>8.1f}")
+
+if __name__ == "__main__":
+    main()
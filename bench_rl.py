@@ -0,0 +1,56 @@
+# bench_rl.py
+# Replay training iterations/sec: the old deque + dict-Q loop vs. the ring-buffer/dense-Q minibatch path.
+#   python bench_rl.py [--fill 20000] [--iters 1000,10000,100000] [--batch 64]
+import argparse, random, time
+from collections import defaultdict, deque
+
+import numpy as np
+
+from decision import MultiplierAgent, RL_DENSITY_BINS, RL_ACTION_MULTS, RL_ALPHA, RL_GAMMA, RL_BUFFER_SIZE
+
+def legacy_discretize(densities):
+    key = []
+    for d in densities:
+        dd = max(0.0, min(100.0, d))
+        idx = 0
+        while idx + 1 < len(RL_DENSITY_BINS) and dd > RL_DENSITY_BINS[idx+1]:
+            idx += 1
+        key.append(int(idx))
+    return tuple(key)
+
+def legacy_train(buffer, iterations):
+    # the previous MultiplierAgent.learn_step + train_agent_from_buffer
+    Q = defaultdict(lambda: [0.0 for _ in RL_ACTION_MULTS])
+    for _ in range(iterations):
+        s, a_idx, r, s2 = random.choice(list(buffer))
+        k = legacy_discretize(s); k2 = legacy_discretize(s2)
+        old = Q[k][a_idx]; nxt = max(Q[k2]) if k2 in Q else 0.0
+        Q[k][a_idx] = old + RL_ALPHA * (r + RL_GAMMA * nxt - old)
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--lanes", type=int, default=4)
+    ap.add_argument("--fill", type=int, default=RL_BUFFER_SIZE)
+    ap.add_argument("--iters", default="1000,10000,100000")
+    ap.add_argument("--batch", type=int, default=64)
+    ap.add_argument("--legacy-max", type=int, default=2000, help="cap legacy iterations (it is O(buffer) per step)")
+    args = ap.parse_args()
+    rng = np.random.default_rng(0)
+    states = rng.uniform(0, 100, size=(args.fill + 1, args.lanes)).round(1)
+    agent = MultiplierAgent(args.lanes, seed=0)
+    old_buf = deque(maxlen=RL_BUFFER_SIZE)
+    for i in range(args.fill):
+        s, s2 = states[i].tolist(), states[i+1].tolist()
+        a = int(rng.integers(len(RL_ACTION_MULTS)))
+        agent.store(s, a, -sum(s), s2)
+        old_buf.append((s, a, -sum(s), s2))
+    print(f"buffer={args.fill} lanes={args.lanes} batch={args.batch}")
+    print(f"{'iters':>8} {'legacy it/s':>12} {'batched it/s':>13} {'speedup':>8}")
+    for iters in [int(x) for x in args.iters.split(",")]:
+        n_old = min(iters, args.legacy_max)
+        t0 = time.perf_counter(); legacy_train(old_buf, n_old); old_rate = n_old / (time.perf_counter() - t0)
+        t0 = time.perf_counter(); agent.train(iters, args.batch); new_rate = iters / (time.perf_counter() - t0)
+        print(f"{iters:>8} {old_rate:>12.0f} {new_rate:>13.0f} {new_rate/old_rate:>8.1f}x")
+
+if __name__ == "__main__":
+    main()
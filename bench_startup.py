@@ -0,0 +1,72 @@
+# bench_startup.py
+# Cold-start cost: fresh-interpreter `import backend`, the test.py user-creation script, and time until /ready.
+#   python bench_startup.py [--runs 5] [--ready-timeout 120]
+import argparse, os, shutil, statistics, subprocess, sys, tempfile, time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+IMPORT_SNIPPET = "import time; t0 = time.perf_counter(); import backend; print(time.perf_counter() - t0)"
+CREATE_USER_SNIPPET = ("import time; t0 = time.perf_counter(); from backend import create_user; "
+                       "create_user('bench_user', 'pw', role='official'); print(time.perf_counter() - t0)")
+READY_SNIPPET = """
+import threading, time
+t0 = time.perf_counter()
+import backend
+t_import = time.perf_counter() - t0
+threading.Thread(target=backend.processing_loop, daemon=True).start()
+c = backend.app.test_client()
+deadline = time.perf_counter() + {timeout}
+while c.get("/ready").status_code != 200 and time.perf_counter() < deadline:
+    time.sleep(0.01)
+t_ready = time.perf_counter() - t0
+r = c.get("/ready").get_json()
+t1 = time.perf_counter()
+backend.models.get(backend.MODEL_PATH, timeout={timeout})
+t_model = time.perf_counter() - t0
+backend._stop.set()
+print(t_import, t_ready, t_model, r["model"]["state"])
+"""
+
+def run(snippet, cwd):
+    # each run gets a fresh interpreter; wall time includes interpreter start-up
+    env = dict(os.environ, PYTHONPATH=HERE + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    t0 = time.perf_counter()
+    out = subprocess.run([sys.executable, "-c", snippet], cwd=cwd, env=env, capture_output=True, text=True, check=True)
+    return time.perf_counter() - t0, out.stdout.strip().splitlines()[-1].split()
+
+def fresh_dir():
+    # scratch working dir so the bench never touches the tracked CSVs
+    d = tempfile.mkdtemp(prefix="aito-startup-")
+    src = os.path.join(HERE, "history.csv")
+    if os.path.exists(src):
+        shutil.copy(src, d)
+    return d
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--runs", type=int, default=5)
+    ap.add_argument("--ready-timeout", type=float, default=120.0)
+    args = ap.parse_args()
+    rows = []
+    for name, snippet in (("import backend", IMPORT_SNIPPET), ("test.py create_user", CREATE_USER_SNIPPET)):
+        walls, inner = [], []
+        for _ in range(args.runs):
+            d = fresh_dir()
+            try:
+                wall, out = run(snippet, d)
+            finally:
+                shutil.rmtree(d, ignore_errors=True)
+            walls.append(wall); inner.append(float(out[0]))
+        rows.append((name, statistics.median(walls), statistics.median(inner)))
+    print(f"{'step':>22} {'process s':>10} {'in-process s':>13}")
+    for name, wall, inner in rows:
+        print(f"{name:>22} {wall:>10.3f} {inner:>13.3f}")
+    d = fresh_dir()
+    try:
+        _, (t_import, t_ready, t_model, state) = run(READY_SNIPPET.format(timeout=args.ready_timeout), d)
+    finally:
+        shutil.rmtree(d, ignore_errors=True)
+    print(f"import {float(t_import):.3f}s, /ready {float(t_ready):.3f}s, model {state} after {float(t_model):.3f}s")
+
+if __name__ == "__main__":
+    main()
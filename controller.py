@@ -0,0 +1,515 @@
+# controller.py
+import os, math, time, random, threading, itertools
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+from detection import run_yolo_detection_compact
+from density import density_from_counts
+from decision import DecisionManager, MultiplierAgent, MIN_GREEN, MAX_GREEN
+from pipeline import DetectionPipeline, RollingQuantile
+from stream import StateFeed
+from metrics import REGISTRY, stage, PHASES, ERRORS
+from alerts import AlertStore
+from motion import MotionGate
+
+LANE_CAPACITY = 10
+YOLO_TRIGGER_BEFORE = 10        # trigger lead (s) in mock mode and until camera latency has been measured
+TRIGGER_QUANTILE = 0.95         # camera lead covers this quantile of request -> result latency
+TRIGGER_SAFETY = 1.2
+TRIGGER_MAX_LEAD = 2*YOLO_TRIGGER_BEFORE
+LATENCY_WINDOW = 64
+MAX_GREEN_STREAK_SECONDS = 30*60
+TICK_SECONDS = 1.0
+TICK_STATS_WINDOW = 600
+DETECTION_WAIT_SECONDS = 0.25   # longest a phase change waits on an in-flight camera detection
+DETECTION_MAX_AGE = 2*YOLO_TRIGGER_BEFORE   # older completed results are not reused at a phase change
+
+# stage timers, bound once so the hot path skips the label lookup
+T_CAPTURE, T_INFERENCE, T_DENSITY = stage("capture"), stage("inference"), stage("density")
+T_DECISION, T_TICK, T_SCHEDULER = stage("decision"), stage("tick"), stage("scheduler_tick")
+T_ALERT = stage("alert_raise")
+STALENESS = REGISTRY.histogram("aito_detection_staleness_seconds", "Age of the camera frame behind each phase decision",
+                               buckets=(0.1, 0.25, 0.5, 1.0, 2.0, 3.0, 5.0, 7.5, 10.0, 15.0, 20.0, 30.0)).labels()
+OVERSHOOT_DROPPED = REGISTRY.counter("aito_phase_overshoot_dropped_seconds_total",
+                                     "Phase overshoot beyond one tick that was not carried into the next phase").labels()
+
+# ---------- Mock generator (enhanced) ----------
+class MockGen:
+    def __init__(self, rows=None, max_random=8, seed=None, num_lanes=4):
+        self.rows = [list(r) for r in (rows or [])]
+        self.i = 0
+        self.max_random = int(max_random)
+        self.num_lanes = int(num_lanes)
+        self._rand = random.Random(seed)
+    def next(self):
+        if self.rows:
+            out = self.rows[self.i % len(self.rows)]
+            self.i += 1
+            return list(out)
+        return [self._rand.randint(0, self.max_random) for _ in range(self.num_lanes)]
+    def current(self):
+        if not self.rows:
+            return None
+        idx = (self.i - 1) % len(self.rows)
+        return list(self.rows[idx])
+    def peek(self, offset=0):
+        if not self.rows:
+            return None
+        idx = (self.i + offset) % len(self.rows)
+        return list(self.rows[idx])
+    def reset(self):
+        self.i = 0
+    def set_rows(self, rows):
+        self.rows = [list(r) for r in rows]
+        self.reset()
+    def load_csv(self, path, lane_cols=None):
+        import pandas as pd
+        import numpy as np
+        if not os.path.exists(path):
+            raise FileNotFoundError(path)
+        df = pd.read_csv(path)
+        if lane_cols:
+            cols = lane_cols
+        else:
+            cols = [c for c in df.columns if str(c).lower().startswith("lane")]
+            if not cols:
+                cols = [c for c in df.select_dtypes(include=[np.number]).columns]
+        rows = []
+        for _, r in df.iterrows():
+            rows.append([int(r[c]) for c in cols])
+        self.set_rows(rows)
+    def set_max_random(self, m):
+        self.max_random = int(m)
+
+# ---------- one signalised intersection ----------
+class Intersection:
+    def __init__(self, iid: str, rois, lane_capacity: int = LANE_CAPACITY, mock_mode: bool = True,
+                 video_source=0, seed=None, mock_rows=None, history_path: Optional[str] = None,
+                 alerts_path: Optional[str] = None, motion_gating: bool = True, journal=None):
+        self.iid = str(iid)
+        self.rois = [tuple(r) for r in rois]
+        self.num_lanes = len(self.rois)
+        self.lane_capacity = int(lane_capacity)
+        self.mock_mode = bool(mock_mode)
+        self.video_source = video_source
+        self.history_path = history_path
+        self.alerts_path = alerts_path
+        self.model = None
+        self.pipeline: Optional[DetectionPipeline] = None
+        self.pending_version = None
+        self.inflight = None   # (slot version, monotonic request time) of the last camera request
+        self.det_latency = RollingQuantile(LATENCY_WINDOW)
+        self.trigger_lead = float(YOLO_TRIGGER_BEFORE)
+        self.next_frame_ts = None
+        self.trigger_stats = {"lead": self.trigger_lead, "samples": 0, "latency_p50": None, "latency_p95": None,
+                              "staleness_last": None, "fallbacks": 0, "overshoot_dropped_s": 0.0}
+        self.gate = MotionGate(self.rois, enabled=motion_gating)
+        # rule-only until enable_rl(): no Q table or replay buffer, and no RL lane limit
+        self.dm = DecisionManager(num_lanes=self.num_lanes)
+        self.alerts = AlertStore(alerts_path, journal=journal)
+        self.mock_gen = MockGen(rows=mock_rows, seed=seed, num_lanes=self.num_lanes)
+        # sinks are wired by the host process; None means "do not persist"
+        self.on_phase: Optional[Callable] = None
+        self.lock = threading.Lock()
+        self.latest = {
+            "densities": [0.0]*self.num_lanes,
+            "counts": [0]*self.num_lanes,
+            "timers": [MIN_GREEN]*self.num_lanes,
+            "next_lane": 0,
+            "signal_timer": MIN_GREEN,
+            "mode": "mock",
+            "error": None,
+            "timestamp": time.time()
+        }
+        self.state = {
+            "controller": {"type": "auto"},
+            "streak_seconds": [0]*self.num_lanes,
+            "smoothed_densities": None,
+            "rain": False,
+            "peak": False
+        }
+        self.feed = StateFeed()
+        # bumped whenever `state` (controller, alerts) changes, so cached views of it know to re-encode
+        self._state_seq = itertools.count(1)
+        self.state_version = 0
+        self.feed.publish(self.latest)
+        self.started = False
+        self.closed = False
+        self.current_green = 0
+        self.signal_timer = MIN_GREEN
+        self.next_densities = None
+        self.next_counts = None
+        self.yolo_triggered = False
+
+    def _infer(self, crop, rois, imgsz):
+        with T_INFERENCE.time():
+            return run_yolo_detection_compact(crop, self.model, rois, imgsz=imgsz).lane_counts()
+
+    def _detect(self, frame):
+        # still lanes reuse their last counts; the rest are inferred on the union crop of their ROIs
+        counts = self.gate.detect(frame, self._infer)
+        with T_DENSITY.time():
+            return density_from_counts(counts, lane_capacity=self.lane_capacity)
+
+    def _ensure_pipeline(self):
+        if self.pipeline is None:
+            from sources import open_source
+            def timed_read(src):
+                with T_CAPTURE.time():
+                    return src.read()
+            self.pipeline = DetectionPipeline(lambda: open_source(self.video_source, self.rois), timed_read,
+                                              self._detect, release_fn=lambda src: src.release()).start()
+        return self.pipeline
+
+    def _stop_pipeline(self):
+        if self.pipeline is not None:
+            self.pipeline.stop()
+            self.pipeline = None
+        self.pending_version = None
+        self.inflight = None
+        self.gate.reset()
+
+    def _take_detection(self, at_phase_change):
+        # poll the pipeline for the result requested at the trigger point
+        r = self.pipeline.result(self.pending_version, DETECTION_WAIT_SECONDS if at_phase_change else 0.0)
+        if r is None and at_phase_change:
+            fresh = self.pipeline.slot.freshest()
+            if fresh is not None and fresh.error is None and fresh.frame_ts is not None \
+                    and time.monotonic() - fresh.frame_ts <= DETECTION_MAX_AGE:
+                r = fresh
+        if r is None:
+            return
+        self.pending_version = None
+        if r.error is not None:
+            self.next_densities, self.next_counts = None, None
+            self.latest["error"] = r.error
+            ERRORS.labels(r.error.split(":", 1)[0]).inc()
+        else:
+            self.next_densities, self.next_counts = r.value
+            self.next_frame_ts = r.frame_ts
+
+    def _observe_latency(self, dt):
+        # request -> result latency of camera detections, sampled even when the result came too late
+        # to be used, and the trigger lead re-derived from its rolling quantile
+        r = self.pipeline.slot.freshest() if self.pipeline is not None else None
+        if self.inflight is None or r is None or r.version <= self.inflight[0]:
+            return
+        if r.error is None:
+            self.det_latency.add(max(0.0, r.ts - self.inflight[1]))
+            q = self.det_latency.quantile(TRIGGER_QUANTILE)
+            # checks happen once per tick, so the trigger can land up to dt later than the lead
+            self.trigger_lead = min(TRIGGER_MAX_LEAD, q * TRIGGER_SAFETY + dt)
+            self.trigger_stats.update({"lead": self.trigger_lead, "samples": len(self.det_latency),
+                                       "latency_p50": self.det_latency.quantile(0.5), "latency_p95": q})
+        self.inflight = None
+
+    def start(self):
+        latest, state, dm = self.latest, self.state, self.dm
+        if not self.mock_mode:
+            try:
+                self._ensure_pipeline()
+            except Exception as e:
+                latest["error"] = f"camera_open_err:{e}"
+        self.current_green = 0
+        initial_counts = self.mock_gen.next() if self.mock_mode else [0]*self.num_lanes
+        densities0, counts0 = density_from_counts(initial_counts, lane_capacity=self.lane_capacity)
+        _, duration0, timers0 = dm.get_next_signal_state(densities0, self.current_green, rain=state["rain"], peak=state["peak"], prefer_rl=False)
+        latest.update({"densities": densities0, "counts": counts0, "timers": timers0,
+                       "next_lane": self.current_green, "signal_timer": duration0, "mode": "mock" if self.mock_mode else "camera",
+                       "error": None, "timestamp": time.time()})
+        self.signal_timer = duration0
+        self.next_densities = None
+        self.next_counts = None
+        self.yolo_triggered = False
+        self.started = True
+        self.feed.publish(latest)
+
+    def tick(self, dt: float = TICK_SECONDS):
+        with self.lock, T_TICK.time():
+            if self.closed:
+                return   # removed while the scheduler still held it in this round
+            if not self.started:
+                self.start()
+            self._tick(dt)
+            self.feed.publish(self.latest)
+
+    def publish(self):
+        # call after changing `latest` outside a tick so stream/ETag readers see it immediately
+        return self.feed.publish(self.latest)
+
+    def touch_state(self):
+        self.state_version = next(self._state_seq)
+
+    def enable_rl(self, checkpoint: Optional[str] = None) -> MultiplierAgent:
+        # creates the multiplier agent (ValueError past RL_MAX_LANES), warm-started from checkpoint if
+        # it loads; built outside the lock, attached under it so ticks start feeding its buffer
+        agent = self.dm.agent
+        if agent is not None:
+            return agent
+        agent = MultiplierAgent(num_lanes=self.num_lanes)
+        if checkpoint and os.path.exists(checkpoint):
+            try:
+                agent.load_checkpoint(checkpoint)
+            except Exception as e:
+                print(f"ignoring Q checkpoint {checkpoint}: {e}")
+        with self.lock:
+            if self.dm.agent is None:
+                self.dm.agent = agent
+            return self.dm.agent
+
+    def disable_rl(self) -> Optional[MultiplierAgent]:
+        # back to rule-only; returns the detached agent so the caller can save it
+        with self.lock:
+            agent, self.dm.agent = self.dm.agent, None
+        return agent
+
+    def _tick(self, dt):
+        latest, state, dm = self.latest, self.state, self.dm
+        self.signal_timer -= dt
+
+        # read runtime mode each tick
+        mock_mode = self.mock_mode
+        if mock_mode and self.pipeline is not None:
+            self._stop_pipeline()
+
+        # trigger detection once the timer is within the lead (fixed in mock mode, measured for cameras)
+        # and not already taken; camera detections run on the pipeline threads and are collected below
+        if not mock_mode:
+            self._observe_latency(dt)
+        lead = YOLO_TRIGGER_BEFORE if mock_mode else self.trigger_lead
+        if self.signal_timer <= lead and not self.yolo_triggered:
+            try:
+                if mock_mode:
+                    # counts-only fast path: no per-vehicle objects in mock mode
+                    with T_DENSITY.time():
+                        self.next_densities, self.next_counts = density_from_counts(self.mock_gen.next(), lane_capacity=self.lane_capacity)
+                else:
+                    self.pending_version = self._ensure_pipeline().request()
+                    self.inflight = (self.pending_version, time.monotonic())
+                self.yolo_triggered = True
+            except Exception as e:
+                self.next_densities, self.next_counts = None, None
+                latest["error"] = f"detection_error:{str(e)}"
+                ERRORS.labels("detection_error").inc()
+        if not mock_mode and self.pending_version is not None and self.pipeline is not None:
+            self._take_detection(at_phase_change=self.signal_timer <= 0)
+
+        controller = state.get("controller", {"type":"auto"})
+        if controller.get("type") == "manual":
+            controller["remaining"] = max(0, controller.get("remaining", 0) - dt)
+            latest.update({"mode": "manual", "next_lane": controller["lane"], "signal_timer": math.ceil(controller["remaining"])})
+            if controller["remaining"] <= 0:
+                state["controller"] = {"type": "auto"}
+            self.touch_state()
+            return
+
+        if self.signal_timer <= 0:
+            # carry the sub-tick overshoot into the next phase so phase lengths don't drift; after a
+            # longer stall the rest is dropped (and counted) rather than cutting the next green short
+            carry = max(self.signal_timer, -TICK_SECONDS)
+            if carry > self.signal_timer:
+                dropped = carry - self.signal_timer
+                self.trigger_stats["overshoot_dropped_s"] += dropped
+                OVERSHOOT_DROPPED.inc(dropped)
+            if self.next_densities is not None:
+                with T_DECISION.time():
+                    chosen_lane, chosen_dur, timers = dm.get_next_signal_state(self.next_densities, self.current_green,
+                                                                               rain=state["rain"], peak=state["peak"],
+                                                                               prefer_rl=False)
+                PHASES.labels("mock" if mock_mode else "camera").inc()
+                if not mock_mode and self.next_frame_ts is not None:
+                    staleness = time.monotonic() - self.next_frame_ts
+                    STALENESS.observe(staleness)
+                    self.trigger_stats["staleness_last"] = staleness
+                self.current_green = chosen_lane
+                self.signal_timer = chosen_dur + carry
+                latest.update({"densities": self.next_densities, "counts": self.next_counts, "timers": timers,
+                               "next_lane": self.current_green, "signal_timer": chosen_dur,
+                               "mode": "mock" if mock_mode else "camera", "error": None,
+                               "timestamp": time.time()})
+                if self.on_phase is not None:
+                    self.on_phase(self, self.next_counts)
+            else:
+                next_idx = (self.current_green + 1) % self.num_lanes
+                fallback_t = dm.last_timers[next_idx] if getattr(dm, "last_timers", None) else MIN_GREEN
+                PHASES.labels("fallback").inc(); ERRORS.labels("detection_failed").inc()
+                if not mock_mode:
+                    self.trigger_stats["fallbacks"] += 1
+                self.current_green = next_idx
+                self.signal_timer = int(round(fallback_t)) + carry
+                latest.update({"densities": dm.last_timers if getattr(dm, "last_timers", None) else [0]*self.num_lanes,
+                               "counts": dm.last_timers if getattr(dm, "last_timers", None) else [0]*self.num_lanes,
+                               "timers": dm.last_timers if getattr(dm, "last_timers", None) else [0]*self.num_lanes,
+                               "next_lane": self.current_green, "signal_timer": int(round(fallback_t)),
+                               "mode": "fallback", "error": "detection_failed", "timestamp": time.time()})
+            self.yolo_triggered = False
+            self.pending_version = None
+            self.next_densities, self.next_counts = None, None
+            self.next_frame_ts = None
+
+            timers_now = latest.get("timers", [0]*self.num_lanes)
+            for i, t in enumerate(timers_now):
+                if t >= MAX_GREEN:
+                    state["streak_seconds"][i] += self.signal_timer if self.signal_timer>0 else 0
+                else:
+                    state["streak_seconds"][i] = 0
+                if state["streak_seconds"][i] >= MAX_GREEN_STREAK_SECONDS and not self.alerts.has_open(i):
+                    with T_ALERT.time():
+                        alert = self.alerts.raise_alert(i, f"Lane {i+1} at MAX_GREEN for prolonged period")
+                    if alert is not None:
+                        self.touch_state()
+            return
+
+        latest["signal_timer"] = math.ceil(self.signal_timer)
+        latest["timestamp"] = time.time()
+
+    def close(self):
+        # under the lock so a tick already running finishes before the pipeline fields are cleared;
+        # the pipeline threads are joined outside it
+        with self.lock:
+            self.closed = True
+            pipeline, self.pipeline = self.pipeline, None
+            self._stop_pipeline()
+        if pipeline is not None:
+            pipeline.stop()
+        self.feed.close()
+
+# ---------- registry + shared scheduler ----------
+class IntersectionRegistry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.items: Dict[str, Intersection] = {}
+        self.model = None
+    def add(self, ix: Intersection) -> Intersection:
+        with self.lock:
+            if ix.iid in self.items:
+                raise KeyError(f"intersection {ix.iid} already registered")
+            ix.model = self.model
+            self.items[ix.iid] = ix
+        return ix
+    def remove(self, iid: str) -> Optional[Intersection]:
+        with self.lock:
+            ix = self.items.pop(str(iid), None)
+        if ix is not None:
+            ix.close()
+        return ix
+    def get(self, iid: str) -> Optional[Intersection]:
+        return self.items.get(str(iid))
+    def all(self) -> List[Intersection]:
+        with self.lock:
+            return list(self.items.values())
+    def ids(self) -> List[str]:
+        with self.lock:
+            return list(self.items.keys())
+    def set_model(self, model):
+        with self.lock:
+            self.model = model
+            for ix in self.items.values():
+                ix.model = model
+    def __len__(self):
+        return len(self.items)
+
+class TickClock:
+    # monotonic deadline clock: deadlines sit on a fixed grid, so time spent in a tick never
+    # pushes later ticks back; wait() returns the real elapsed time since the previous tick
+    def __init__(self, period: float = TICK_SECONDS, window: int = TICK_STATS_WINDOW):
+        self.period = float(period)
+        self.jitter = deque(maxlen=window)
+        self.work = deque(maxlen=window)
+        self.reset()
+    def reset(self):
+        self.deadline = None
+        self.last = None
+        self.ticks = 0
+        self.missed = 0
+        self.overruns = 0
+        self.last_dt = 0.0
+        self.jitter.clear(); self.work.clear()
+    def wait(self, stop_event: threading.Event) -> Optional[float]:
+        now = time.monotonic()
+        if self.deadline is None:
+            self.deadline = now + self.period
+            self.last = now
+        delay = self.deadline - now
+        if delay > 0 and stop_event.wait(delay):
+            return None
+        if stop_event.is_set():
+            return None
+        now = time.monotonic()
+        late = now - self.deadline
+        missed = int(late // self.period) if late >= self.period else 0
+        self.missed += missed
+        self.deadline += (missed + 1) * self.period
+        self.jitter.append(late)
+        dt = now - self.last
+        self.last = now
+        self.last_dt = dt
+        self.ticks += 1
+        return dt
+    def record_work(self, seconds: float):
+        self.work.append(seconds)
+        if seconds > self.period:
+            self.overruns += 1
+    def stats(self) -> dict:
+        def summary(xs):
+            if not xs:
+                return {"mean_ms": 0.0, "p95_ms": 0.0, "max_ms": 0.0}
+            srt = sorted(xs)
+            return {"mean_ms": sum(srt) / len(srt) * 1000.0,
+                    "p95_ms": srt[min(len(srt)-1, int(len(srt)*0.95))] * 1000.0,
+                    "max_ms": srt[-1] * 1000.0}
+        return {"period_s": self.period, "ticks": self.ticks, "missed_ticks": self.missed,
+                "overruns": self.overruns, "last_dt_s": self.last_dt,
+                "jitter": summary(list(self.jitter)), "work": summary(list(self.work))}
+
+class Scheduler:
+    # one bounded worker pool ticks every registered intersection once per period
+    def __init__(self, registry: IntersectionRegistry, period: float = TICK_SECONDS, workers: int = 8,
+                 stop_event: Optional[threading.Event] = None):
+        self.registry = registry
+        self.period = float(period)
+        self.workers = max(1, int(workers))
+        self.pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="ix-tick")
+        self.stop_event = stop_event or threading.Event()
+        self.clock = TickClock(self.period)
+        self.last_tick_seconds = 0.0
+        self.ticks = 0
+        self.errors = {}
+
+    def _safe_tick(self, ix: Intersection, dt: float):
+        try:
+            ix.tick(dt)
+        except Exception as e:
+            self.errors[ix.iid] = str(e)
+            ix.latest["error"] = f"tick_error:{e}"
+            ERRORS.labels("tick_error").inc()
+
+    def tick_all(self, dt: Optional[float] = None) -> float:
+        dt = self.period if dt is None else dt
+        items = self.registry.all()
+        t0 = time.perf_counter()
+        if self.workers == 1 or len(items) <= 1:
+            for ix in items:
+                self._safe_tick(ix, dt)
+        else:
+            # chunk so each worker gets one task instead of one task per intersection
+            n = min(self.workers, len(items))
+            chunks = [items[k::n] for k in range(n)]
+            list(self.pool.map(lambda chunk: [self._safe_tick(ix, dt) for ix in chunk], chunks))
+        self.last_tick_seconds = time.perf_counter() - t0
+        T_SCHEDULER.observe(self.last_tick_seconds)
+        self.ticks += 1
+        return self.last_tick_seconds
+
+    def run(self):
+        self.clock.reset()
+        while True:
+            dt = self.clock.wait(self.stop_event)
+            if dt is None:
+                break
+            self.clock.record_work(self.tick_all(dt))
+
+    def stop(self):
+        self.stop_event.set()
+        self.pool.shutdown(wait=False)
@@ -1,7 +1,7 @@
 # decision.py
-import random, json
-from collections import defaultdict, deque
+import os, time, random, json, struct
 from typing import List, Optional, Tuple
+import numpy as np
 
 MIN_GREEN = 10.0
 MAX_GREEN = 50.0
@@ -15,6 +15,14 @@ RL_ALPHA = 0.2
 RL_GAMMA = 0.95
 RL_EPS = 0.2
 RL_BUFFER_SIZE = 20000
+RL_BATCH_SIZE = 64
+# the Q table is dense over levels**lanes states: 5**8 x 4 actions x 8 B is ~12.5 MB, 5**10 already ~312 MB
+RL_MAX_LANES = 8
+
+# binary Q checkpoint: magic, u32 format version, u32 header length, JSON header, padding, raw <f8 table
+Q_CHECKPOINT_MAGIC = b"AITOQCK\0"
+Q_CHECKPOINT_VERSION = 1
+Q_CHECKPOINT_ALIGN = 64
 
 def env_multiplier(rain: bool = False, peak: bool = False) -> float:
     m = 1.0
@@ -27,49 +35,221 @@ def base_timer_from_density(d_pct: float) -> float:
     frac = max(0.0, min(1.0, d_pct / 100.0))
     return MIN_GREEN + frac * (MAX_GREEN - MIN_GREEN)
 
+def q_update(Q, k, a, r, k2, alpha, gamma):
+    # one vectorized Q-learning update in place; duplicate (state, action) pairs get their mean TD error
+    n_actions = Q.shape[1]
+    td = r + gamma * Q[k2].max(axis=1) - Q[k, a]
+    uniq, inv = np.unique(k * n_actions + a, return_inverse=True)
+    Q.reshape(-1)[uniq] += alpha * (np.bincount(inv, weights=td) / np.bincount(inv))
+
+def q_train(Q, k, a, r, k2, alpha, gamma, iterations, batch_size=RL_BATCH_SIZE, rng=None):
+    # uniform minibatch replay over transitions (k, a, r, k2); returns the number of samples used
+    rng = rng if rng is not None else np.random.default_rng()
+    n = len(k)
+    done = 0
+    while done < iterations and n:
+        m = min(batch_size, iterations - done)
+        idx = rng.integers(0, n, size=m)
+        q_update(Q, k[idx], a[idx], r[idx], k2[idx], alpha, gamma)
+        done += m
+    return done
+
+class ReplayBuffer:
+    # preallocated ring buffer; states are stored both raw and as integer-encoded discrete keys
+    def __init__(self, capacity: int, num_lanes: int):
+        self.capacity = int(capacity)
+        self.s = np.zeros((self.capacity, num_lanes), dtype=np.float32)
+        self.s2 = np.zeros((self.capacity, num_lanes), dtype=np.float32)
+        self.a = np.zeros(self.capacity, dtype=np.int64)
+        self.r = np.zeros(self.capacity, dtype=np.float64)
+        self.k = np.zeros(self.capacity, dtype=np.int64)
+        self.k2 = np.zeros(self.capacity, dtype=np.int64)
+        self.pos = 0
+        self.size = 0
+    def append(self, s, a_idx, r, s2, k, k2):
+        i = self.pos
+        self.s[i] = s; self.s2[i] = s2; self.a[i] = a_idx; self.r[i] = r; self.k[i] = k; self.k2[i] = k2
+        self.pos = (i + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+    def sample(self, n: int, rng) -> np.ndarray:
+        return rng.integers(0, self.size, size=n)
+    def snapshot(self) -> dict:
+        # oldest-first copies of the filled part
+        order = (np.arange(self.size) + (self.pos - self.size)) % self.capacity
+        return {"s": self.s[order].copy(), "a": self.a[order].copy(), "r": self.r[order].copy(),
+                "s2": self.s2[order].copy(), "k": self.k[order].copy(), "k2": self.k2[order].copy()}
+    def __len__(self):
+        return self.size
+    def __bool__(self):
+        return self.size > 0
+    def __iter__(self):
+        snap = self.snapshot()
+        for i in range(self.size):
+            yield (snap["s"][i].tolist(), int(snap["a"][i]), float(snap["r"][i]), snap["s2"][i].tolist())
+
+def read_checkpoint_header(path: str) -> dict:
+    with open(path, "rb") as f:
+        magic = f.read(len(Q_CHECKPOINT_MAGIC))
+        if magic != Q_CHECKPOINT_MAGIC:
+            raise ValueError(f"{path}: not a Q checkpoint")
+        version, hlen = struct.unpack("<II", f.read(8))
+        if version != Q_CHECKPOINT_VERSION:
+            raise ValueError(f"{path}: unsupported checkpoint version {version}")
+        return json.loads(f.read(hlen))
+
 class MultiplierAgent:
-    def __init__(self, num_lanes: int, alpha=RL_ALPHA, gamma=RL_GAMMA, eps=RL_EPS):
+    def __init__(self, num_lanes: int, alpha=RL_ALPHA, gamma=RL_GAMMA, eps=RL_EPS, seed=None):
         self.num_lanes = int(num_lanes)
+        if not 1 <= self.num_lanes <= RL_MAX_LANES:
+            raise ValueError(f"RL agent supports 1..{RL_MAX_LANES} lanes, got {self.num_lanes}")
         self.alpha = alpha; self.gamma = gamma; self.eps = eps
-        self.Q = defaultdict(lambda: [0.0 for _ in RL_ACTION_MULTS])
-        self.buffer = deque(maxlen=RL_BUFFER_SIZE)
+        self.bins = np.asarray(RL_DENSITY_BINS[1:], dtype=np.float64)
+        # densities are clipped to [0, 100], so only bins up to 100 can be reached
+        self.levels = int(np.searchsorted(self.bins, 100.0, side="left")) + 1
+        self.n_actions = len(RL_ACTION_MULTS)
+        self.place = self.levels ** np.arange(self.num_lanes - 1, -1, -1, dtype=np.int64)
+        self.Q = np.zeros((self.levels ** self.num_lanes, self.n_actions), dtype=np.float64)
+        self.buffer = ReplayBuffer(RL_BUFFER_SIZE, self.num_lanes)
+        self.rng = np.random.default_rng(seed)
+        self.q_version = 0
+    def _levels(self, densities) -> np.ndarray:
+        dd = np.clip(np.asarray(densities, dtype=np.float64), 0.0, 100.0)
+        return np.minimum(np.searchsorted(self.bins, dd, side="left"), self.levels - 1)
     def _discretize(self, densities: List[float]) -> Tuple[int, ...]:
-        key = []
-        for d in densities:
-            dd = max(0.0, min(100.0, d))
-            idx = 0
-            while idx + 1 < len(RL_DENSITY_BINS) and dd > RL_DENSITY_BINS[idx+1]:
-                idx += 1
-            key.append(int(idx))
-        return tuple(key)
+        return tuple(int(i) for i in self._levels(densities))
+    def encode(self, densities) -> np.ndarray:
+        # (..., num_lanes) densities -> integer row index into Q
+        return self._levels(densities) @ self.place
+    def decode(self, key: int) -> Tuple[int, ...]:
+        return tuple(int(key // p) % self.levels for p in self.place)
     def choose_multiplier_idx(self, densities: List[float]) -> int:
-        key = self._discretize(densities)
+        k = int(self.encode(densities))
         if random.random() < self.eps:
             return random.randrange(len(RL_ACTION_MULTS))
-        qvals = self.Q[key]
-        best = int(max(range(len(qvals)), key=lambda i: qvals[i]))
-        return best
+        return int(np.argmax(self.Q[k]))
     def learn_step(self, s, a_idx, r, s2):
-        k = self._discretize(s); k2 = self._discretize(s2)
-        old = self.Q[k][a_idx]; nxt = max(self.Q[k2]) if k2 in self.Q else 0.0
+        k = int(self.encode(s)); k2 = int(self.encode(s2))
+        old = self.Q[k, a_idx]; nxt = self.Q[k2].max()
         target = r + self.gamma * nxt
-        self.Q[k][a_idx] = old + self.alpha * (target - old)
+        self.Q[k, a_idx] = old + self.alpha * (target - old)
+    def learn_batch(self, k, a, r, k2):
+        q_update(self.Q, k, a, r, k2, self.alpha, self.gamma)
+    def train(self, iterations: int, batch_size: int = RL_BATCH_SIZE):
+        buf = self.buffer
+        n = len(buf)
+        done = q_train(self.Q, buf.k[:n], buf.a[:n], buf.r[:n], buf.k2[:n], self.alpha, self.gamma,
+                       iterations, batch_size, self.rng)
+        if done:
+            self.q_version += 1
+        return done
+    def swap_q(self, Q: np.ndarray):
+        # readers index self.Q once per call, so rebinding the attribute is an atomic policy swap
+        if Q.shape != self.Q.shape:
+            raise ValueError(f"Q shape {Q.shape} does not match agent {self.Q.shape}")
+        self.Q = Q
+        self.q_version += 1
     def store(self, s, a_idx, r, s2):
-        self.buffer.append((s, a_idx, r, s2))
+        self.buffer.append(s, a_idx, r, s2, int(self.encode(s)), int(self.encode(s2)))
     def set_eps(self, eps: float): self.eps = float(eps)
     def save(self, path: str):
+        visited = np.flatnonzero(np.any(self.Q != 0.0, axis=1))
         dump = {"num_lanes": self.num_lanes, "alpha": self.alpha, "gamma": self.gamma, "eps": self.eps,
-                "q": {json.dumps(k): v for k, v in self.Q.items()}}
+                "q": {json.dumps(list(self.decode(k))): self.Q[k].tolist() for k in visited.tolist()}}
         with open(path, "w") as f: json.dump(dump, f)
+    def save_checkpoint(self, path: str):
+        # dense table plus a header describing its layout; written to a temp file and renamed into place
+        Q = np.ascontiguousarray(self.Q, dtype="<f8").copy()
+        meta = {"num_lanes": self.num_lanes, "levels": self.levels, "bins": RL_DENSITY_BINS,
+                "actions": RL_ACTION_MULTS, "shape": list(Q.shape), "dtype": "<f8",
+                "alpha": self.alpha, "gamma": self.gamma, "eps": self.eps, "q_version": self.q_version,
+                "saved": time.time()}
+        head = len(Q_CHECKPOINT_MAGIC) + 8
+        meta["offset"] = 0
+        while True:
+            body = json.dumps(meta).encode()
+            offset = -(-(head + len(body)) // Q_CHECKPOINT_ALIGN) * Q_CHECKPOINT_ALIGN
+            if offset == meta["offset"]:
+                break
+            meta["offset"] = offset
+        body += b" " * (offset - head - len(body))
+        tmp = f"{path}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(Q_CHECKPOINT_MAGIC + struct.pack("<II", Q_CHECKPOINT_VERSION, len(body)) + body)
+            Q.tofile(f)
+            f.flush(); os.fsync(f.fileno())
+        os.replace(tmp, path)
+    def load_checkpoint(self, path: str, mmap: bool = True):
+        # mmap=True maps the table copy-on-write: no read at load, pages fault in as states are visited
+        meta = read_checkpoint_header(path)
+        if meta["num_lanes"] != self.num_lanes:
+            raise ValueError(f"checkpoint has {meta['num_lanes']} lanes, agent has {self.num_lanes}")
+        if meta["bins"] != RL_DENSITY_BINS or meta["actions"] != RL_ACTION_MULTS:
+            raise ValueError("checkpoint bins/actions do not match RL_DENSITY_BINS/RL_ACTION_MULTS")
+        shape = tuple(meta["shape"])
+        if shape != self.Q.shape:
+            raise ValueError(f"Q shape {shape} does not match agent {self.Q.shape}")
+        if mmap:
+            Q = np.memmap(path, dtype=meta["dtype"], mode="c", offset=meta["offset"], shape=shape)
+        else:
+            Q = np.fromfile(path, dtype=meta["dtype"], count=int(np.prod(shape)), offset=meta["offset"]).reshape(shape)
+        self.alpha = meta.get("alpha", self.alpha); self.gamma = meta.get("gamma", self.gamma)
+        self.eps = meta.get("eps", self.eps)
+        self.Q = Q
+        self.q_version = int(meta.get("q_version", 0))
+        return meta
     def load(self, path: str):
         with open(path, "r") as f:
             data = json.load(f)
-        self.num_lanes = int(data.get("num_lanes", self.num_lanes))
         self.alpha = data.get("alpha", self.alpha); self.gamma = data.get("gamma", self.gamma)
         self.eps = data.get("eps", self.eps)
         q = data.get("q", {})
         for kjson, v in q.items():
-            key = tuple(json.loads(kjson)); self.Q[key] = v
+            key = json.loads(kjson)
+            if len(key) != self.num_lanes:
+                raise ValueError(f"checkpoint has {len(key)} lanes, agent has {self.num_lanes}")
+            self.Q[int(np.asarray(key, dtype=np.int64) @ self.place)] = v
+
+# ---------- batch (intersections × lanes) rule path ----------
+def env_multiplier_batch(rain, peak) -> np.ndarray:
+    # same additions in the same order as env_multiplier, so results are bit-identical
+    m = np.where(np.asarray(rain, dtype=bool), 1.0 + ALPHA_RAIN, 1.0)
+    return np.where(np.asarray(peak, dtype=bool), m + ALPHA_PEAK, m)
+
+def base_timer_from_density_batch(d) -> np.ndarray:
+    d = np.asarray(d, dtype=np.float64)
+    frac = np.clip(d / 100.0, 0.0, 1.0)
+    return np.where(d <= 0.0, 0.0, MIN_GREEN + frac * (MAX_GREEN - MIN_GREEN))
+
+def compute_rule_timers_batch(densities, rain=False, peak=False) -> np.ndarray:
+    # (N, L) densities, scalar or (N,) rain/peak -> (N, L) timers, as DecisionManager.compute_rule_timers per row
+    d = np.asarray(densities, dtype=np.float64)
+    mult = np.broadcast_to(env_multiplier_batch(rain, peak), d.shape[:1])[:, None]
+    final = base_timer_from_density_batch(d) * mult
+    return np.where(d <= ZERO_DENSITY_THRESHOLD, 0.0, np.clip(final, 0.0, MAX_GREEN))
+
+def next_nonempty_batch(densities, current) -> Tuple[np.ndarray, np.ndarray]:
+    # first lane after `current` (cyclically) above the zero threshold; second array says whether one exists
+    d = np.asarray(densities, dtype=np.float64)
+    n, L = d.shape
+    order = (np.asarray(current, dtype=np.int64).reshape(-1, 1) + np.arange(1, L + 1)) % L
+    busy = np.take_along_axis(d > ZERO_DENSITY_THRESHOLD, order, axis=1)
+    first = busy.argmax(axis=1)
+    return order[np.arange(n), first], busy.any(axis=1)
+
+def next_signal_state_batch(densities, current, rain=False, peak=False) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    # vectorized DecisionManager.get_next_signal_state(..., prefer_rl=False) for N intersections at once:
+    # returns next lanes (N,), durations (N,) and timers (N, L), matching the scalar path exactly
+    d = np.asarray(densities, dtype=np.float64)
+    if d.ndim != 2:
+        raise ValueError(f"densities must be (intersections, lanes), got shape {d.shape}")
+    timers = compute_rule_timers_batch(d, rain, peak)
+    nxt, found = next_nonempty_batch(d, current)
+    L = d.shape[1]
+    nxt = np.where(found, nxt, (np.asarray(current, dtype=np.int64) + 1) % L)
+    chosen = timers[np.arange(d.shape[0]), nxt]
+    durations = np.where(found, np.rint(np.clip(chosen, MIN_GREEN, MAX_GREEN)), round(MIN_GREEN)).astype(np.int64)
+    # with no busy lane every timer is already 0.0, which is what the scalar path reports
+    return nxt, durations, timers
 
 class DecisionManager:
     def __init__(self, num_lanes: int):
@@ -120,10 +300,6 @@ class DecisionManager:
         self.last_timers = timers
         duration = float(max(MIN_GREEN, min(MAX_GREEN, timers[next_idx])))
         return int(next_idx), int(round(duration)), timers
-    def train_agent_from_buffer(self, iterations: int = 1000):
+    def train_agent_from_buffer(self, iterations: int = 1000, batch_size: int = RL_BATCH_SIZE):
         if self.agent is None: return
-        import random
-        for _ in range(iterations):
-            if not self.agent.buffer: break
-            s, a_idx, r, s2 = random.choice(list(self.agent.buffer))
-            self.agent.learn_step(s, a_idx, r, s2)
+        return self.agent.train(iterations, batch_size)
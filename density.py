@@ -1,12 +1,21 @@
 # density.py
+from numbers import Integral
 from typing import List, Tuple
 
-def calculate_density(detections_in_lanes, lane_capacity: int = 10) -> Tuple[List[float], List[int]]:
+def density_from_counts(counts, lane_capacity: int = 10) -> Tuple[List[float], List[int]]:
     densities = []
-    counts = []
-    for lane_dets in detections_in_lanes:
-        count = len(lane_dets)
-        counts.append(count)
+    out = []
+    for count in counts:
+        count = int(count)
+        out.append(count)
         d = (count / lane_capacity) * 100 if lane_capacity > 0 else 0.0
         densities.append(round(min(d, 100.0), 1))
-    return densities, counts
+    return densities, out
+
+def calculate_density(detections_in_lanes, lane_capacity: int = 10) -> Tuple[List[float], List[int]]:
+    # accepts per-lane detection lists, a compact detection.Detections, or plain per-lane counts
+    if hasattr(detections_in_lanes, "lane_counts"):
+        return density_from_counts(detections_in_lanes.lane_counts(), lane_capacity)
+    if len(detections_in_lanes) > 0 and all(isinstance(c, Integral) for c in detections_in_lanes):
+        return density_from_counts(detections_in_lanes, lane_capacity)
+    return density_from_counts([len(lane_dets) for lane_dets in detections_in_lanes], lane_capacity)
@@ -1,43 +1,255 @@
 # detection.py
-import random
-from typing import List, Tuple
+import random, time, threading
+from concurrent.futures import Future
+from typing import List, Optional, Sequence, Tuple
+import numpy as np
 
-try:
-    from ultralytics import YOLO
-except Exception:
-    YOLO = None
+YOLO = None   # ultralytics.YOLO, imported on the first load_model() so importing this module stays cheap
+WARMUP_SHAPE = (480, 640, 3)
 
 def load_model(path="yolov8n.pt"):
+    global YOLO
     if YOLO is None:
-        return None
+        try:
+            from ultralytics import YOLO
+        except Exception:
+            return None
     try:
         m = YOLO(path)
         return m
     except Exception:
         return None
 
-def run_yolo_detection(frame, model, rois, conf_threshold=0.3):
+# ---------- compact detections ----------
+DETECTION_DTYPE = np.dtype([("bbox", np.int32, (4,)), ("conf", np.float32), ("cls", np.int16), ("lane", np.int16)])
+
+class Detections:
+    # one structured array for a whole frame instead of a dict per vehicle
+    __slots__ = ("arr", "num_lanes")
+    def __init__(self, arr: np.ndarray, num_lanes: int):
+        self.arr = arr
+        self.num_lanes = int(num_lanes)
+    @classmethod
+    def empty(cls, num_lanes: int) -> "Detections":
+        return cls(np.zeros(0, dtype=DETECTION_DTYPE), num_lanes)
+    @classmethod
+    def from_arrays(cls, xyxy, conf, cls_ids, lanes, num_lanes: int, keep_unassigned: bool = False) -> "Detections":
+        sel = slice(None) if keep_unassigned else np.flatnonzero(np.asarray(lanes) >= 0)
+        arr = np.zeros(len(np.asarray(lanes)[sel]), dtype=DETECTION_DTYPE)
+        arr["bbox"] = np.asarray(xyxy)[sel]; arr["conf"] = np.asarray(conf)[sel]
+        arr["cls"] = np.asarray(cls_ids)[sel]; arr["lane"] = np.asarray(lanes)[sel]
+        return cls(arr, num_lanes)
+    def __len__(self):
+        return len(self.arr)
+    def lane_counts(self) -> List[int]:
+        lanes = self.arr["lane"]
+        return np.bincount(lanes[lanes >= 0], minlength=self.num_lanes)[:self.num_lanes].tolist()
+    def lane(self, i: int) -> np.ndarray:
+        return self.arr[self.arr["lane"] == i]
+    def to_lanes(self) -> List[List[dict]]:
+        # legacy list-of-dicts view
+        out = [[] for _ in range(self.num_lanes)]
+        for bbox, conf, c, lane in zip(self.arr["bbox"].tolist(), self.arr["conf"].tolist(),
+                                       self.arr["cls"].tolist(), self.arr["lane"].tolist()):
+            if lane >= 0:
+                out[lane].append({"bbox": tuple(bbox), "conf": conf, "cls": c})
+        return out
+
+# ---------- lane label raster ----------
+def _fill_polygon(raster, poly, label):
+    # even-odd test on integer pixel coordinates, restricted to the polygon's bounding box
+    pts = np.asarray(poly, dtype=float)
+    h, w = raster.shape
+    x0, y0 = max(0, int(np.floor(pts[:, 0].min()))), max(0, int(np.floor(pts[:, 1].min())))
+    x1, y1 = min(w - 1, int(np.ceil(pts[:, 0].max()))), min(h - 1, int(np.ceil(pts[:, 1].max())))
+    if x1 < x0 or y1 < y0:
+        return
+    ys, xs = np.mgrid[y0:y1 + 1, x0:x1 + 1]
+    inside = np.zeros(xs.shape, dtype=bool)
+    xj, yj = pts[-1]
+    for xi, yi in pts:
+        crosses = (yi > ys) != (yj > ys)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            xc = (xj - xi) * (ys - yi) / (yj - yi) + xi
+        inside ^= crosses & (xs < xc)
+        xj, yj = xi, yi
+    view = raster[y0:y1 + 1, x0:x1 + 1]
+    view[inside & (view < 0)] = label
+
+class LaneMap:
+    # integer raster: pixel -> lane index (-1 outside every lane). Lanes are (x, y, w, h) rectangles
+    # or polygons [(x, y), ...]; the first lane listed wins where lanes overlap, like the old linear scan.
+    def __init__(self, lanes, shape: Optional[Tuple[int, int]] = None, inclusive: bool = True):
+        self.lanes = [tuple(map(tuple, l)) if _is_polygon(l) else tuple(l) for l in lanes]
+        if shape is None:
+            xmax = ymax = 0
+            for l in self.lanes:
+                if _is_polygon(l):
+                    xmax = max(xmax, max(p[0] for p in l)); ymax = max(ymax, max(p[1] for p in l))
+                else:
+                    xmax = max(xmax, l[0] + l[2]); ymax = max(ymax, l[1] + l[3])
+            shape = (int(np.ceil(ymax)) + 1, int(np.ceil(xmax)) + 1)
+        self.shape = (int(shape[0]), int(shape[1]))
+        self.raster = np.full(self.shape, -1, dtype=np.int16)
+        for i, l in enumerate(self.lanes):
+            if _is_polygon(l):
+                _fill_polygon(self.raster, l, i)
+                continue
+            rx, ry, rw, rh = (int(v) for v in l)
+            # inclusive matches run_yolo_detection's <=, exclusive matches utils.is_within_roi's <
+            lo, hi = (0, 1) if inclusive else (1, 0)
+            view = self.raster[max(0, ry + lo):max(0, ry + rh + hi), max(0, rx + lo):max(0, rx + rw + hi)]
+            view[view < 0] = i
+    def lookup(self, cx, cy) -> np.ndarray:
+        cx = np.asarray(cx, dtype=np.int64); cy = np.asarray(cy, dtype=np.int64)
+        h, w = self.shape
+        ok = (cx >= 0) & (cx < w) & (cy >= 0) & (cy < h)
+        out = np.full(cx.shape, -1, dtype=np.int64)
+        out[ok] = self.raster[cy[ok], cx[ok]]
+        return out
+
+def _is_polygon(lane) -> bool:
+    return len(lane) > 0 and isinstance(lane[0], (tuple, list, np.ndarray))
+
+_LANE_MAPS = {}
+def lane_map_for(rois, inclusive: bool = True) -> LaneMap:
+    key = (tuple(tuple(map(tuple, l)) if _is_polygon(l) else tuple(l) for l in rois), inclusive)
+    m = _LANE_MAPS.get(key)
+    if m is None:
+        if len(_LANE_MAPS) > 64:
+            _LANE_MAPS.clear()
+        m = _LANE_MAPS[key] = LaneMap(rois, inclusive=inclusive)
+    return m
+
+_VEHICLE_IDS = {}
+def vehicle_class_ids(model) -> Optional[np.ndarray]:
+    names = getattr(model, "names", None)
+    if not isinstance(names, dict) or not names:
+        return None
+    key = id(names)
+    if key not in _VEHICLE_IDS:
+        from utils import get_vehicle_class_indices
+        _VEHICLE_IDS[key] = np.asarray(get_vehicle_class_indices(names), dtype=np.int64)
+    return _VEHICLE_IDS[key]
+
+def _np(x):
+    if x is None:
+        return None
+    if hasattr(x, "cpu"):
+        x = x.cpu()
+    return np.asarray(x.numpy() if hasattr(x, "numpy") else x)
+
+def box_arrays(res0):
+    # (xyxy int Nx4, conf N, cls N) straight from the result tensors, no per-box Python objects
+    boxes = getattr(res0, "boxes", None) if res0 is not None else None
+    xyxy = _np(getattr(boxes, "xyxy", None)) if boxes is not None else None
+    if xyxy is None or xyxy.size == 0:
+        return np.zeros((0, 4), dtype=np.int64), np.zeros(0), np.zeros(0, dtype=np.int64)
+    xyxy = xyxy.reshape(-1, xyxy.shape[-1])[:, :4].astype(np.int64)
+    conf = _np(getattr(boxes, "conf", None))
+    cls = _np(getattr(boxes, "cls", None))
+    conf = conf.reshape(-1).astype(float) if conf is not None and conf.size else np.zeros(len(xyxy))
+    cls = cls.reshape(-1).astype(np.int64) if cls is not None and cls.size else np.full(len(xyxy), -1, dtype=np.int64)
+    return xyxy, conf, cls
+
+def assign_lanes(xyxy, cls, lane_map: LaneMap, class_ids=None) -> np.ndarray:
+    lanes = lane_map.lookup((xyxy[:, 0] + xyxy[:, 2]) // 2, (xyxy[:, 1] + xyxy[:, 3]) // 2)
+    if class_ids is not None:
+        lanes[~np.isin(cls, class_ids)] = -1
+    return lanes
+
+def _compact(res0, rois, lane_map=None, class_ids=None) -> Detections:
+    xyxy, conf, cls = box_arrays(res0)
+    if len(xyxy) == 0:
+        return Detections.empty(len(rois))
+    lanes = assign_lanes(xyxy, cls, lane_map or lane_map_for(rois), class_ids)
+    return Detections.from_arrays(xyxy, conf, cls, lanes, len(rois))
+
+def _assign_lanes(res0, rois, lane_map=None, class_ids=None):
+    return _compact(res0, rois, lane_map, class_ids).to_lanes()
+
+def run_yolo_detection(frame, model, rois, conf_threshold=0.3, lane_map=None, vehicles_only=True):
     if model is None:
         raise RuntimeError("YOLO model not available")
     results = model(frame, conf=conf_threshold, verbose=False)
     if not results:
         return [[] for _ in rois]
-    res0 = results[0]
-    detections_in_lanes = [[] for _ in rois]
-    if getattr(res0, "boxes", None) is None:
-        return detections_in_lanes
-    for b in res0.boxes:
-        xy = b.xyxy[0].tolist()
-        x1, y1, x2, y2 = map(int, xy[:4])
-        conf = float(b.conf[0]) if getattr(b, "conf", None) else 0.0
-        cls = int(b.cls[0]) if getattr(b, "cls", None) else -1
-        cx = (x1 + x2) // 2
-        cy = (y1 + y2) // 2
-        for i, (rx, ry, rw, rh) in enumerate(rois):
-            if rx <= cx <= rx + rw and ry <= cy <= ry + rh:
-                detections_in_lanes[i].append({"bbox": (x1, y1, x2, y2), "conf": conf, "cls": cls})
-                break
-    return detections_in_lanes
+    return _assign_lanes(results[0], rois, lane_map, vehicle_class_ids(model) if vehicles_only else None)
+
+def run_yolo_detection_compact(frame, model, rois, conf_threshold=0.3, lane_map=None, vehicles_only=True,
+                               imgsz=None) -> Detections:
+    if model is None:
+        raise RuntimeError("YOLO model not available")
+    kw = {} if imgsz is None else {"imgsz": imgsz}
+    results = model(frame, conf=conf_threshold, verbose=False, **kw)
+    if not results:
+        return Detections.empty(len(rois))
+    return _compact(results[0], rois, lane_map, vehicle_class_ids(model) if vehicles_only else None)
+
+def run_yolo_detection_batch(items: Sequence[Tuple[object, list]], model, conf_threshold=0.3, vehicles_only=True):
+    # items: [(frame, rois), ...] -> one forward pass over the stacked frames, per-frame lane detections back
+    if model is None:
+        raise RuntimeError("YOLO model not available")
+    if not items:
+        return []
+    results = model([frame for frame, _ in items], conf=conf_threshold, verbose=False) or []
+    class_ids = vehicle_class_ids(model) if vehicles_only else None
+    out = []
+    for k, (_, rois) in enumerate(items):
+        out.append(_assign_lanes(results[k] if k < len(results) else None, rois, class_ids=class_ids))
+    return out
+
+class MicroBatcher:
+    # collects single-frame requests from many callers into batched forward passes
+    def __init__(self, model, max_batch_size: int = 8, max_wait: float = 0.01, conf_threshold=0.3):
+        self.model = model
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = float(max_wait)
+        self.conf_threshold = conf_threshold
+        self.cond = threading.Condition()
+        self.pending = []
+        self.stats = {"batches": 0, "frames": 0}
+        self._stop = False
+        self._thread = threading.Thread(target=self._run, name="yolo-batcher", daemon=True)
+        self._thread.start()
+    def submit(self, frame, rois) -> Future:
+        fut = Future()
+        with self.cond:
+            self.pending.append((frame, rois, fut))
+            self.cond.notify()
+        return fut
+    def detect(self, frame, rois, timeout: Optional[float] = None):
+        return self.submit(frame, rois).result(timeout)
+    def _run(self):
+        while True:
+            with self.cond:
+                while not self.pending and not self._stop:
+                    self.cond.wait()
+                if self._stop and not self.pending:
+                    return
+                # first request opens the batch window; close it on size or max_wait
+                deadline = time.monotonic() + self.max_wait
+                while len(self.pending) < self.max_batch_size and not self._stop:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.cond.wait(remaining)
+                batch = self.pending[:self.max_batch_size]
+                self.pending = self.pending[self.max_batch_size:]
+            try:
+                out = run_yolo_detection_batch([(f, r) for f, r, _ in batch], self.model, self.conf_threshold)
+                for (_, _, fut), dets in zip(batch, out):
+                    fut.set_result(dets)
+            except Exception as e:
+                for _, _, fut in batch:
+                    fut.set_exception(e)
+            self.stats["batches"] += 1
+            self.stats["frames"] += len(batch)
+    def close(self):
+        with self.cond:
+            self._stop = True
+            self.cond.notify_all()
+        self._thread.join(2.0)
 
 def run_mock_detection_from_counts(counts: List[int], rois) -> List[List[dict]]:
     lanes = [[] for _ in rois]
@@ -45,5 +257,9 @@ def run_mock_detection_from_counts(counts: List[int], rois) -> List[List[dict]]:
         for _ in range(c):
             lanes[i].append({"bbox": (0, 0, 1, 1), "conf": round(random.uniform(0.6, 0.99), 2), "cls": 0})
     return lanes
-print("detection.py loaded")
+
+def warm_up(model, shape=WARMUP_SHAPE):
+    # one throwaway inference so the first real detection doesn't pay for lazy init and kernel selection
+    h, w = shape[:2]
+    return run_yolo_detection_compact(np.zeros(shape, dtype=np.uint8), model, [(0, 0, w, h)])
 
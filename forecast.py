@@ -0,0 +1,136 @@
+# forecast.py
+import math, time, threading
+from typing import List, Optional
+import numpy as np
+
+GRID_POINTS = 200
+MAX_FORECAST_MINUTES = 24*60   # a day already touches every hour of the day
+MAX_FORECAST_DAYS = 400        # hourly rollup retention
+MAX_CACHE_ENTRIES = 4096
+SQRT2 = math.sqrt(2.0)
+SQRT2PI = math.sqrt(2.0 * math.pi)
+OFFSET_GRAIN = 900   # zone offset changes fall on quarter hours
+
+# Abramowitz & Stegun 7.1.26, |error| < 1.5e-7: plenty for a plotted CDF and, unlike
+# np.frompyfunc(math.erf), it runs as array ops instead of a Python call per grid point
+_ERF_P = 0.3275911
+_ERF_A = (0.254829592, -0.284496736, 1.421413741, -1.453152027, 1.061405429)
+
+def _erf(z):
+    z = np.asarray(z, dtype=float)
+    a = np.abs(z)
+    t = 1.0 / (1.0 + _ERF_P * a)
+    poly = t * (_ERF_A[0] + t * (_ERF_A[1] + t * (_ERF_A[2] + t * (_ERF_A[3] + t * _ERF_A[4]))))
+    return np.sign(z) * (1.0 - poly * np.exp(-a * a))
+
+def utc_offset(ts):
+    # local UTC offset (seconds) in force at each ts, so rows on either side of a DST change, and
+    # half-hour zones, land in the right local hour; looked up once per distinct quarter hour
+    t = np.asarray(ts, dtype=float)
+    q = np.floor(np.where(np.isfinite(t), t, 0.0) / OFFSET_GRAIN)
+    if t.ndim == 0:
+        return time.localtime(float(q) * OFFSET_GRAIN).tm_gmtoff
+    uq, inv = np.unique(q, return_inverse=True)
+    offs = np.array([time.localtime(v * OFFSET_GRAIN).tm_gmtoff for v in uq.tolist()], dtype=float)
+    return offs[inv].reshape(t.shape)
+
+def local_seconds(ts):
+    # ts on the local wall clock (seconds since the local epoch)
+    return np.asarray(ts, dtype=float) + utc_offset(ts)
+
+def from_local(local):
+    # inverse of local_seconds; in a repeated (fall-back) hour, the later of the two instants
+    local = np.asarray(local, dtype=float)
+    return local - utc_offset(local - utc_offset(local))
+
+def hour_of_day(ts):
+    h = (local_seconds(ts) % 86400.0) // 3600.0
+    return h.astype(int) if np.ndim(h) else int(h)
+
+def window_hours(now: float, minutes: int) -> tuple:
+    # hours of the day touched by [now, now + minutes]: sampled every quarter hour, plus the end,
+    # so a DST change inside the window is followed
+    span = min(max(0, minutes), MAX_FORECAST_MINUTES) * 60
+    pts = np.append(np.arange(now, now + span, OFFSET_GRAIN), now + max(0.0, span - 1e-6))
+    return tuple(sorted(set(hour_of_day(pts).tolist())))
+
+def normal_pdf(x, mu, sigma):
+    sigma = np.where(np.asarray(sigma) <= 0, 1e-6, sigma)
+    z = (np.asarray(x, dtype=float) - mu) / sigma
+    return np.exp(-0.5 * z * z) / (sigma * SQRT2PI)
+
+def normal_cdf(x, mu, sigma):
+    sigma = np.where(np.asarray(sigma) <= 0, 1e-6, sigma)
+    z = (np.asarray(x, dtype=float) - mu) / (sigma * SQRT2)
+    return 0.5 * (1.0 + _erf(z))
+
+class Forecaster:
+    def __init__(self, store, grid_points: int = GRID_POINTS):
+        self.store = store
+        self.grid_points = int(grid_points)
+        self.lock = threading.Lock()
+        self.cache = {}
+        self.cache_version = None
+        self.stats = {"hits": 0, "misses": 0}
+
+    def predict(self, lane_idx: int, minutes: int = 60, num_lanes: Optional[int] = None,
+                tod: bool = False, now: Optional[float] = None, days: Optional[float] = None) -> dict:
+        if lane_idx < 0:
+            return {"error": "insufficient_history"}
+        if not 0 <= minutes <= MAX_FORECAST_MINUTES:
+            raise ValueError(f"minutes must be in 0..{MAX_FORECAST_MINUTES}")
+        if days is not None and not 0 < days <= MAX_FORECAST_DAYS:
+            raise ValueError(f"days must be in (0, {MAX_FORECAST_DAYS}]")
+        now = time.time() if now is None else now
+        hours = window_hours(now, minutes) if tod else None
+        # start of the local hour (the rollup bucket), so the cache key only moves once an hour
+        since = float(from_local(local_seconds(now - days * 86400) // 3600 * 3600)) if days is not None else None
+        key = (int(lane_idx), int(minutes), hours, since)
+        with self.lock:
+            if self.cache_version == self.store.version and key in self.cache:
+                self.stats["hits"] += 1
+                return self.cache[key]
+        self.stats["misses"] += 1
+        lanes = list(range(max(lane_idx + 1, num_lanes or 0)))
+        out = self.predict_all(lanes, minutes, hours, since)
+        return out[lane_idx]
+
+    def _stats(self, lanes, hours, since):
+        return self.store.lanes(lanes, hours) if since is None else self.store.window(lanes, since, hours)
+
+    def predict_all(self, lanes: List[int], minutes: int = 60, hours: Optional[tuple] = None,
+                    since: Optional[float] = None) -> List[dict]:
+        # one vectorized pass over every lane, results cached per (lane, minutes, hours, since, version)
+        version, exists, stats = self._stats(lanes, hours, since)
+        conditioned = [hours is not None and s is not None and s.n >= 2 for s in stats]
+        if hours is not None:
+            # fall back to the unconditioned distribution for lanes without enough samples in those hours
+            _, _, base = self._stats(lanes, None, since)
+            stats = [s if c else b for s, b, c in zip(stats, base, conditioned)]
+        results = [None] * len(lanes)
+        ok = [i for i, s in enumerate(stats) if s is not None and s.n >= 2]
+        for i in set(range(len(lanes))) - set(ok if exists else []):
+            results[i] = {"error": "insufficient_history" if exists else "no_history"}
+        if exists and ok:
+            mu = np.array([stats[i].mean for i in ok])
+            sigma = np.array([stats[i].std() for i in ok])
+            sigma = np.where(sigma > 0, sigma, 1.0)
+            lo = np.maximum(0.0, mu - 4 * sigma); hi = mu + 4 * sigma
+            x = np.linspace(lo, hi, self.grid_points, axis=1)
+            pdf = normal_pdf(x, mu[:, None], sigma[:, None])
+            cdf = normal_cdf(x, mu[:, None], sigma[:, None])
+            xs, pdfs, cdfs = x.tolist(), pdf.tolist(), cdf.tolist()
+            for row, i in enumerate(ok):
+                results[i] = {"x": xs[row], "pdf": pdfs[row], "cdf": cdfs[row],
+                              "mu": float(mu[row]), "sigma": float(sigma[row])}
+                if conditioned[i]:
+                    results[i]["hours"] = list(hours)
+                if since is not None:
+                    results[i]["since"] = since
+        with self.lock:
+            if self.cache_version != version or len(self.cache) > MAX_CACHE_ENTRIES:
+                self.cache = {}
+                self.cache_version = version
+            for lane, res in zip(lanes, results):
+                self.cache[(int(lane), int(minutes), hours, since)] = res
+        return results
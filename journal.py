@@ -0,0 +1,224 @@
+# journal.py
+import os, io, csv, glob, time, queue, threading
+from typing import List, Optional
+
+from metrics import REGISTRY, stage
+
+T_COMMIT = stage("journal_commit")
+DROPPED = REGISTRY.counter("aito_journal_dropped_total", "Journal records dropped after failed writes").labels()
+
+FSYNC_POLICIES = ("commit", "interval", "never")
+RETRY_MIN_SECONDS = 0.5
+RETRY_MAX_SECONDS = 30.0
+MAX_HELD_RECORDS = 10000   # failed rows kept per path for retry; older ones are dropped (and counted) past this
+
+def _numbered(path: str) -> List[int]:
+    # suffixes of the rotated segments on disk, highest (oldest) first
+    tails = (p[len(path) + 1:] for p in glob.glob(glob.escape(path) + ".*"))
+    return sorted((int(t) for t in tails if t.isdigit()), reverse=True)
+
+def segments(path: str, backups: Optional[int] = 16) -> List[str]:
+    # rotated files oldest first, live file last; backups=None keeps (and finds) every segment
+    nums = _numbered(path) if backups is None else range(backups, 0, -1)
+    out = [f"{path}.{i}" for i in nums if os.path.exists(f"{path}.{i}")]
+    if os.path.exists(path):
+        out.append(path)
+    return out
+
+class JournalWriter:
+    # `backups` rotated segments are kept per CSV (None keeps all); retain() sets it for one path. Past
+    # the limit the oldest segment is deleted, with a warning and stats["segments_dropped"]
+    def __init__(self, flush_every: int = 64, flush_interval: float = 1.0, fsync: str = "interval",
+                 fsync_interval: float = 5.0, max_bytes: int = 0, backups: Optional[int] = 5):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"fsync must be one of {FSYNC_POLICIES}")
+        self.flush_every = max(1, int(flush_every))
+        self.flush_interval = float(flush_interval)
+        self.fsync = fsync
+        self.fsync_interval = float(fsync_interval)
+        self.max_bytes = int(max_bytes)
+        self.backups = None if backups is None else int(backups)
+        self.retention = {}   # path -> backups, overriding the default
+        self.q = queue.Queue()
+        self.stats = {"records": 0, "commits": 0, "fsyncs": 0, "rotations": 0, "segments_dropped": 0,
+                      "errors": 0, "dropped": 0, "last_error": None}
+        self._held = {}   # path -> (kind, header, rows or lines) whose write failed, retried with backoff
+        self._retry_at = 0.0
+        self._retry_delay = 0.0
+        self._thread = None
+        self._stop = threading.Event()
+        self._last_fsync = time.monotonic()
+
+    def retain(self, path: str, backups: Optional[int]):
+        self.retention[path] = None if backups is None else int(backups)
+
+    # ---------- producer side (never touches disk) ----------
+    def append_csv(self, path: str, header: List[str], row: list):
+        self.q.put(("csv", path, header, row))
+    def append_lines(self, path: str, lines: List[str]):
+        # raw text lines (e.g. JSONL event logs), appended in order; no header, no rotation
+        self.q.put(("text", path, None, lines))
+    def flush(self, timeout: Optional[float] = None):
+        ev = threading.Event()
+        self.q.put(("barrier", None, None, ev))
+        if self._thread is None or not self._thread.is_alive():
+            self._drain_once()
+        ev.wait(timeout)
+    def pending(self) -> int:
+        held = list(self._held.values())
+        return self.q.qsize() + sum(len(p) for _, _, p in held)
+
+    # ---------- writer thread ----------
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="journal-writer", daemon=True)
+        self._thread.start()
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        self.q.put(("wake", None, None, None))
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._drain_once(final=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            batch = []
+            try:
+                batch.append(self.q.get(timeout=0.5))
+            except queue.Empty:
+                if self._held and time.monotonic() >= self._retry_at:
+                    self._commit([])
+                continue
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.flush_every and batch[-1][0] != "barrier":
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.q.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._commit(batch)
+
+    def _drain_once(self, final: bool = False):
+        batch = []
+        while True:
+            try:
+                batch.append(self.q.get_nowait())
+            except queue.Empty:
+                break
+        if batch or (final and self._held):
+            self._commit(batch, force=final)
+        if final and self._held:
+            # last attempt at shutdown failed too
+            for _, _, payload in self._held.values():
+                self._drop(len(payload))
+            self._held = {}
+
+    def _commit(self, batch, force: bool = False):
+        with T_COMMIT.time():
+            self._commit_batch(batch, force)
+
+    def _drop(self, n):
+        self.stats["dropped"] += n
+        DROPPED.inc(n)
+
+    def _hold(self, path, kind, header, payload):
+        if len(payload) > MAX_HELD_RECORDS:
+            self._drop(len(payload) - MAX_HELD_RECORDS)
+            payload = payload[-MAX_HELD_RECORDS:]
+        self._held[path] = (kind, header, payload)
+
+    def _commit_batch(self, batch, force: bool = False):
+        lines, headers, texts, barriers = {}, {}, {}, []
+        # rows whose write failed earlier go first so each file keeps its order; while their path is
+        # backing off, new rows for it are held behind them instead of being written
+        held, self._held = self._held, {}
+        retry = force or time.monotonic() >= self._retry_at
+        for path, (kind, header, payload) in held.items():
+            if kind == "csv":
+                lines[path] = list(payload); headers[path] = header
+            else:
+                texts[path] = list(payload)
+        for kind, path, header, payload in batch:
+            if kind == "csv":
+                lines.setdefault(path, []).append(payload)
+                headers[path] = header
+            elif kind == "text":
+                texts.setdefault(path, []).extend(payload)
+            elif kind == "barrier":
+                barriers.append(payload)
+        do_sync = self.fsync == "commit" or (
+            self.fsync == "interval" and time.monotonic() - self._last_fsync >= self.fsync_interval)
+        failed = False
+        for path, rows in lines.items():
+            if path in held and not retry:
+                self._hold(path, "csv", headers[path], rows)
+                continue
+            try:
+                self._write_csv(path, headers[path], rows, do_sync)
+                self.stats["records"] += len(rows)
+            except Exception as e:
+                self.stats["errors"] += 1; self.stats["last_error"] = f"{path}:{e}"
+                self._hold(path, "csv", headers[path], rows); failed = True
+        for path, text in texts.items():
+            if path in held and not retry:
+                self._hold(path, "text", None, text)
+                continue
+            try:
+                self._write_text(path, text, do_sync)
+                self.stats["records"] += len(text)
+            except Exception as e:
+                self.stats["errors"] += 1; self.stats["last_error"] = f"{path}:{e}"
+                self._hold(path, "text", None, text); failed = True
+        if failed:
+            self._retry_delay = min(RETRY_MAX_SECONDS, max(RETRY_MIN_SECONDS, self._retry_delay * 2))
+            self._retry_at = time.monotonic() + self._retry_delay
+        elif not self._held:
+            self._retry_delay = 0.0
+        if do_sync:
+            self._last_fsync = time.monotonic()
+            self.stats["fsyncs"] += 1
+        self.stats["commits"] += 1
+        for ev in barriers:
+            ev.set()
+
+    def _rotate(self, path, backups):
+        if backups is None:
+            nums = _numbered(path)
+        else:
+            oldest = f"{path}.{backups}"
+            if os.path.exists(oldest):
+                print(f"journal: retention for {path} is {backups} segments, deleting {oldest}")
+                os.remove(oldest)
+                self.stats["segments_dropped"] += 1
+            nums = range(backups - 1, 0, -1)
+        for i in nums:
+            src = f"{path}.{i}"
+            if os.path.exists(src):
+                os.replace(src, f"{path}.{i+1}")
+        os.replace(path, f"{path}.1")
+        self.stats["rotations"] += 1
+
+    def _write_csv(self, path, header, rows, do_sync):
+        backups = self.retention.get(path, self.backups)
+        if (self.max_bytes > 0 and (backups is None or backups > 0) and os.path.exists(path)
+                and os.path.getsize(path) >= self.max_bytes):
+            self._rotate(path, backups)
+        buf = io.StringIO()
+        w = csv.writer(buf, lineterminator="\n")
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            w.writerow(header)
+        w.writerows(rows)
+        with open(path, "a", newline="") as f:
+            f.write(buf.getvalue())
+            if do_sync:
+                f.flush(); os.fsync(f.fileno())
+
+    def _write_text(self, path, lines, do_sync):
+        with open(path, "a") as f:
+            f.write("".join(line + "\n" for line in lines))
+            if do_sync:
+                f.flush(); os.fsync(f.fileno())
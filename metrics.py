@@ -0,0 +1,178 @@
+# metrics.py
+# In-process counters, gauges and fixed-bucket histograms rendered in Prometheus text format.
+import abc, bisect, threading, time
+from typing import Callable, Dict, Optional, Sequence, Tuple
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _fmt(v: float) -> str:
+    v = float(v)
+    if v == float("inf"):
+        return "+Inf"
+    return str(int(v)) if v.is_integer() and abs(v) < 1e15 else repr(v)
+
+def _escape(v) -> str:
+    return str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labelstr(names, values, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+class _Timer:
+    __slots__ = ("child", "t0")
+    def __init__(self, child):
+        self.child = child
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+    def __exit__(self, *exc):
+        self.child.observe(time.perf_counter() - self.t0)
+        return False
+
+class _HistogramChild:
+    __slots__ = ("buckets", "counts", "sum", "count", "lock")
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)   # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self.lock = threading.Lock()
+    def observe(self, value: float):
+        i = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+    def time(self) -> _Timer:
+        return _Timer(self)
+    def snapshot(self):
+        with self.lock:
+            return list(self.counts), self.sum, self.count
+
+class _CounterChild:
+    __slots__ = ("value", "lock")
+    def __init__(self):
+        self.value = 0.0
+        self.lock = threading.Lock()
+    def inc(self, amount: float = 1.0):
+        with self.lock:
+            self.value += amount
+
+class _Metric(abc.ABC):
+    kind = ""
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.children: Dict[Tuple, object] = {}
+        self.lock = threading.Lock()
+    @abc.abstractmethod
+    def _new_child(self):
+        ...
+    @abc.abstractmethod
+    def render(self):
+        ...
+    def labels(self, *values):
+        # children are cached per label tuple; hot paths should keep the returned child
+        key = tuple(str(v) for v in values)
+        child = self.children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {values}")
+            with self.lock:
+                child = self.children.setdefault(key, self._new_child())
+        return child
+    def header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+class Counter(_Metric):
+    kind = "counter"
+    def _new_child(self):
+        return _CounterChild()
+    def render(self):
+        out = self.header()
+        for key, child in list(self.children.items()):
+            out.append(f"{self.name}{_labelstr(self.labelnames, key)} {_fmt(child.value)}")
+        return out
+
+class Gauge(_Metric):
+    # value is read from a callback at scrape time, so nothing is updated on the hot path
+    kind = "gauge"
+    def __init__(self, name, help, labelnames=(), fn: Optional[Callable] = None):
+        super().__init__(name, help, labelnames)
+        self.fn = fn
+    def _new_child(self):
+        raise TypeError(f"{self.name}: gauge values come from fn, not labels()")
+    def render(self):
+        out = self.header()
+        try:
+            values = self.fn() if self.fn is not None else {}
+        except Exception:
+            return out
+        if not isinstance(values, dict):
+            values = {(): values}
+        for key, v in values.items():
+            key = key if isinstance(key, tuple) else (key,)
+            out.append(f"{self.name}{_labelstr(self.labelnames, key)} {_fmt(v)}")
+        return out
+
+class Histogram(_Metric):
+    kind = "histogram"
+    def __init__(self, name, help, labelnames=(), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(float(b) for b in buckets))
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+    def render(self):
+        out = self.header()
+        for key, child in list(self.children.items()):
+            counts, total, count = child.snapshot()
+            acc = 0
+            for b, c in zip(self.buckets + (float("inf"),), counts):
+                acc += c
+                le = 'le="%s"' % _fmt(b)
+                out.append(f"{self.name}_bucket{_labelstr(self.labelnames, key, le)} {acc}")
+            out.append(f"{self.name}_sum{_labelstr(self.labelnames, key)} {_fmt(total)}")
+            out.append(f"{self.name}_count{_labelstr(self.labelnames, key)} {count}")
+        return out
+
+class Registry:
+    def __init__(self):
+        self.metrics: Dict[str, _Metric] = {}
+        self.lock = threading.Lock()
+    def _add(self, metric):
+        with self.lock:
+            existing = self.metrics.get(metric.name)
+            if existing is not None:
+                if type(existing) is not type(metric) or existing.labelnames != metric.labelnames:
+                    raise ValueError(f"metric {metric.name} already registered differently")
+                return existing
+            self.metrics[metric.name] = metric
+            return metric
+    def counter(self, name, help, labelnames=()) -> Counter:
+        return self._add(Counter(name, help, labelnames))
+    def gauge(self, name, help, labelnames=(), fn=None) -> Gauge:
+        g = self._add(Gauge(name, help, labelnames, fn))
+        if fn is not None:
+            g.fn = fn
+        return g
+    def histogram(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, help, labelnames, buckets))
+    def render(self) -> str:
+        lines = []
+        for m in list(self.metrics.values()):
+            lines.extend(m.render())
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# hot-path metrics shared by the controller, pipeline and backend
+STAGE_SECONDS = REGISTRY.histogram("aito_stage_seconds", "Latency of control-loop stages", ("stage",))
+PHASES = REGISTRY.counter("aito_phase_changes_total", "Signal phase changes by mode", ("mode",))
+ERRORS = REGISTRY.counter("aito_errors_total", "Control-loop errors by kind", ("kind",))
+
+def stage(name: str):
+    return STAGE_SECONDS.labels(name)
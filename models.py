@@ -0,0 +1,76 @@
+# models.py
+import time, threading
+from typing import Callable, Optional
+
+DEFAULT_WEIGHTS = "yolov8n.pt"
+
+class ModelRegistry:
+    # one shared detector per weights path; loaded once (optionally on a background thread),
+    # warmed up with a throwaway inference, then handed to every caller
+    def __init__(self, loader: Callable, warmup: Optional[Callable] = None):
+        self.loader = loader
+        self.warmup = warmup
+        self.lock = threading.Lock()
+        self.entries = {}   # path -> {"state", "model", "event", "error", "load_s", "warmup_s", "callbacks"}
+
+    def _entry(self, path):
+        with self.lock:
+            e = self.entries.get(path)
+            if e is None:
+                e = {"state": "idle", "model": None, "event": threading.Event(), "error": None,
+                     "load_s": None, "warmup_s": None, "callbacks": []}
+                self.entries[path] = e
+            return e
+
+    def load(self, path: str = DEFAULT_WEIGHTS, background: bool = False, on_ready: Optional[Callable] = None) -> dict:
+        # idempotent: only the first call for a path starts a load; later calls just register on_ready
+        e = self._entry(path)
+        with self.lock:
+            start = e["state"] == "idle"
+            if start:
+                e["state"] = "loading"
+            done = e["event"].is_set()
+            if on_ready is not None and not done:
+                e["callbacks"].append(on_ready)
+        if on_ready is not None and done and e["model"] is not None:
+            on_ready(e["model"])
+        if start:
+            if background:
+                threading.Thread(target=self._load, args=(path, e), name="model-load", daemon=True).start()
+            else:
+                self._load(path, e)
+        return self.status(path)
+
+    def _load(self, path, e):
+        t0 = time.perf_counter()
+        try:
+            model = self.loader(path)
+        except Exception as ex:
+            model = None; e["error"] = str(ex)
+        e["load_s"] = time.perf_counter() - t0
+        if model is not None and self.warmup is not None:
+            t0 = time.perf_counter()
+            try:
+                self.warmup(model)
+            except Exception as ex:
+                e["error"] = f"warmup:{ex}"
+            e["warmup_s"] = time.perf_counter() - t0
+        with self.lock:
+            e["model"] = model
+            e["state"] = "ready" if model is not None else "failed" if e["error"] else "unavailable"
+            callbacks, e["callbacks"] = e["callbacks"], []
+            e["event"].set()
+        if model is not None:
+            for cb in callbacks:
+                cb(model)
+
+    def get(self, path: str = DEFAULT_WEIGHTS, timeout: Optional[float] = 0.0):
+        # the loaded model or None; timeout=None waits for an in-flight load
+        e = self._entry(path)
+        if timeout is None or timeout > 0:
+            e["event"].wait(timeout)
+        return e["model"]
+
+    def status(self, path: str = DEFAULT_WEIGHTS) -> dict:
+        e = self._entry(path)
+        return {"path": path, "state": e["state"], "error": e["error"], "load_s": e["load_s"], "warmup_s": e["warmup_s"]}
@@ -0,0 +1,138 @@
+# motion.py
+import math, time, threading
+from typing import Callable, List, Optional, Sequence
+import numpy as np
+
+from metrics import REGISTRY, stage
+
+MOTION_STEP = 4                # sample every 4th pixel each way inside an ROI
+MOTION_PIXEL_DELTA = 25        # per-channel grey-level change that marks a sample as moving
+MOTION_CHANGED_FRAC = 0.02     # share of moving samples that marks an ROI as changed
+MOTION_MAX_REUSE_SECONDS = 60.0   # re-infer a lane at least this often even when it looks still
+CROP_PAD = 32                  # context kept around the ROIs so boxes at the edge are not cut off
+INFER_SIZE = 640               # the detector's input size for a full frame
+COST_EWMA = 0.2
+
+DETECTIONS = REGISTRY.counter("aito_detections_total", "Camera detections by outcome (inferred or skipped)", ("outcome",))
+CPU_SAVED = REGISTRY.counter("aito_detection_cpu_saved_seconds_total", "Estimated inference CPU seconds avoided by gating and cropping").labels()
+T_GATE = stage("motion_gate")
+
+def roi_box(roi, shape) -> tuple:
+    # (x0, y0, x1, y1) bounding box of a rectangle or polygon ROI, clipped to the frame
+    h, w = shape[:2]
+    if len(roi) and isinstance(roi[0], (tuple, list, np.ndarray)):
+        pts = np.asarray(roi, dtype=float)
+        x0, y0 = math.floor(pts[:, 0].min()), math.floor(pts[:, 1].min())
+        x1, y1 = math.ceil(pts[:, 0].max()) + 1, math.ceil(pts[:, 1].max()) + 1
+    else:
+        x, y, rw, rh = (int(v) for v in roi)
+        x0, y0, x1, y1 = x, y, x + rw + 1, y + rh + 1
+    return max(0, x0), max(0, y0), min(w, x1), min(h, y1)
+
+def shift_roi(roi, dx, dy):
+    if len(roi) and isinstance(roi[0], (tuple, list, np.ndarray)):
+        return [(p[0] - dx, p[1] - dy) for p in roi]
+    x, y, rw, rh = roi
+    return (x - dx, y - dy, rw, rh)
+
+def crop_imgsz(crop_shape, frame_shape, full: int = INFER_SIZE) -> int:
+    # input size that keeps the crop at the same scale the full frame would be inferred at,
+    # so inference cost follows the crop area instead of being upscaled back to `full`
+    scale = full / max(frame_shape[:2])
+    return max(32, int(math.ceil(max(crop_shape[:2]) * scale / 32.0)) * 32)
+
+class MotionGate:
+    # per-ROI frame differencing against the frame each lane was last inferred on: still lanes keep
+    # their previous count, and only the union crop of the changed ROIs goes through the detector
+    def __init__(self, rois: Sequence, step: int = MOTION_STEP, pixel_delta: int = MOTION_PIXEL_DELTA,
+                 changed_frac: float = MOTION_CHANGED_FRAC, max_reuse: float = MOTION_MAX_REUSE_SECONDS,
+                 pad: int = CROP_PAD, enabled: bool = True):
+        self.rois = list(rois)
+        self.step = max(1, int(step))
+        self.pixel_delta = int(pixel_delta)
+        self.changed_frac = float(changed_frac)
+        self.max_reuse = float(max_reuse)
+        self.pad = int(pad)
+        self.enabled = bool(enabled)
+        self.lock = threading.Lock()
+        self.shape = None
+        self.boxes = []
+        self.refs: List[Optional[np.ndarray]] = [None] * len(self.rois)
+        self.ref_ts = [0.0] * len(self.rois)
+        self.counts = [0] * len(self.rois)
+        self.cpu_per_px = None   # EWMA of inference CPU seconds per input pixel
+        self.stats = {"frames": 0, "inferences": 0, "skipped": 0, "lanes_reused": 0,
+                      "pixels_inferred": 0, "pixels_full": 0, "infer_cpu_s": 0.0, "cpu_saved_s": 0.0}
+
+    def reset(self):
+        with self.lock:
+            self.refs = [None] * len(self.rois)
+
+    def _signature(self, frame, box):
+        x0, y0, x1, y1 = box
+        sub = frame[y0:y1:self.step, x0:x1:self.step]
+        return sub.astype(np.int16) if sub.ndim == 2 else sub.sum(axis=2, dtype=np.int16)
+
+    def _moved(self, sig, ref, channels) -> bool:
+        if ref is None or ref.shape != sig.shape:
+            return True
+        moving = np.count_nonzero(np.abs(sig - ref) > self.pixel_delta * channels)
+        return moving > self.changed_frac * sig.size
+
+    def changed(self, frame, now: Optional[float] = None):
+        # ([changed per lane], [signature per lane])
+        now = time.monotonic() if now is None else now
+        if frame.shape[:2] != self.shape:
+            self.shape = frame.shape[:2]
+            self.boxes = [roi_box(r, frame.shape) for r in self.rois]
+            self.refs = [None] * len(self.rois)
+        channels = 1 if frame.ndim == 2 else frame.shape[2]
+        sigs = [self._signature(frame, b) for b in self.boxes]
+        out = [not self.enabled or now - ts > self.max_reuse or self._moved(s, ref, channels)
+               for s, ref, ts in zip(sigs, self.refs, self.ref_ts)]
+        return out, sigs
+
+    def detect(self, frame, infer: Callable) -> List[int]:
+        # infer(crop, shifted_rois, imgsz) -> per-lane counts for the crop
+        with self.lock:
+            now = time.monotonic()
+            with T_GATE.time():
+                changed, sigs = self.changed(frame, now)
+            h, w = frame.shape[:2]
+            self.stats["frames"] += 1
+            self.stats["pixels_full"] += h * w
+            if not any(changed):
+                saved = (self.cpu_per_px or 0.0) * h * w
+                self.stats["skipped"] += 1; self.stats["lanes_reused"] += len(changed)
+                self.stats["cpu_saved_s"] += saved
+                DETECTIONS.labels("skipped").inc(); CPU_SAVED.inc(saved)
+                return list(self.counts)
+            boxes = [b for b, c in zip(self.boxes, changed) if c]
+            x0 = max(0, min(b[0] for b in boxes) - self.pad); y0 = max(0, min(b[1] for b in boxes) - self.pad)
+            x1 = min(w, max(b[2] for b in boxes) + self.pad); y1 = min(h, max(b[3] for b in boxes) + self.pad)
+            crop = frame[y0:y1, x0:x1]
+            rois = [shift_roi(r, x0, y0) for r in self.rois]
+            c0 = time.process_time()
+            counts = infer(crop, rois, crop_imgsz(crop.shape, frame.shape))
+            cpu = time.process_time() - c0
+            px = (y1 - y0) * (x1 - x0)
+            per_px = cpu / max(1, px)
+            self.cpu_per_px = per_px if self.cpu_per_px is None else self.cpu_per_px + COST_EWMA * (per_px - self.cpu_per_px)
+            saved = self.cpu_per_px * (h * w - px)
+            for i, c in enumerate(changed):
+                if c:
+                    self.counts[i] = int(counts[i])
+                    self.refs[i] = sigs[i]; self.ref_ts[i] = now
+                else:
+                    self.stats["lanes_reused"] += 1
+            self.stats["inferences"] += 1; self.stats["pixels_inferred"] += px
+            self.stats["infer_cpu_s"] += cpu; self.stats["cpu_saved_s"] += saved
+            DETECTIONS.labels("inferred").inc(); CPU_SAVED.inc(saved)
+            return list(self.counts)
+
+    def summary(self) -> dict:
+        with self.lock:
+            s = dict(self.stats)
+        s["skip_rate"] = s["skipped"] / s["frames"] if s["frames"] else 0.0
+        s["pixel_fraction"] = s["pixels_inferred"] / s["pixels_full"] if s["pixels_full"] else 0.0
+        return s
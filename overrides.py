@@ -0,0 +1,209 @@
+# overrides.py
+import os, csv, threading
+from bisect import bisect_left, bisect_right
+from typing import Iterator, List, Optional, Tuple
+
+from journal import segments
+
+# `intersection` was appended later; files started before it keep the old header, and rows from before
+# it have intersection None
+OVERRIDE_COLUMNS = ["ts", "user", "lane", "duration", "reason", "intersection"]
+INDEX_EVERY = 256          # rows between sparse index marks; also the read block size
+LOG_PAGE_MAX = 1000
+READ_CHUNK = 4 << 20
+
+def _row(cols, fields) -> Optional[dict]:
+    if len(fields) > len(cols) and OVERRIDE_COLUMNS[:len(cols)] == cols:
+        cols = OVERRIDE_COLUMNS   # new-format row appended under an old header
+    r = dict(zip(cols, fields))
+    r.setdefault("intersection", None)
+    try:
+        r["ts"] = float(r["ts"])
+        if "lane" in r: r["lane"] = int(r["lane"])
+        if "duration" in r: r["duration"] = float(r["duration"])
+    except (KeyError, ValueError):
+        return None
+    return r
+
+def parse_cursor(cursor: str) -> Tuple[int, int]:
+    # "<inode>-<offset>"; raises ValueError on anything else
+    ino, off = cursor.split("-", 1)
+    return int(ino), int(off)
+
+def _lines(f, start, stop) -> Iterator[Tuple[int, Optional[bytes], int]]:
+    # (offset, line, end) for each complete line in [start, stop), read in READ_CHUNK pieces; a line
+    # longer than READ_CHUNK comes back as None instead of being held in memory. Stops before an
+    # unfinished last line
+    off = start
+    while off < stop:
+        f.seek(off)
+        data = f.read(min(READ_CHUNK, stop - off))
+        end = data.rfind(b"\n") + 1
+        if end:
+            for line in data[:end].splitlines(keepends=True):
+                yield off, line, off + len(line)
+                off += len(line)
+            continue
+        if len(data) < READ_CHUNK:
+            return
+        skip = off + len(data)
+        while skip < stop:
+            data = f.read(min(READ_CHUNK, stop - skip))
+            nl = data.find(b"\n")
+            if nl >= 0:
+                yield off, None, skip + nl + 1
+                off = skip + nl + 1
+                break
+            skip += len(data)
+        else:
+            return
+
+class _Segment:
+    # sparse (ts, byte offset) marks over one CSV file, extended as the file grows;
+    # keyed by inode so an index survives the journal's rename-based rotation; `monotonic` goes False
+    # once a row's ts is below the one before it (clock stepped back), and scans then stop seeking
+    __slots__ = ("path", "inode", "cols", "indexed", "rows", "mark_ts", "mark_off", "last_ts", "monotonic")
+    def __init__(self, path, inode):
+        self.path = path; self.inode = inode
+        self.cols = None
+        self.indexed = 0          # bytes covered (always ends on a line boundary)
+        self.rows = 0
+        self.mark_ts: List[float] = []
+        self.mark_off: List[int] = []
+        self.last_ts = None
+        self.monotonic = True
+
+    def extend(self, size):
+        # index new complete lines; a partially written last line waits for next time
+        with open(self.path, "rb") as f:
+            for off, line, end in _lines(f, self.indexed, size):
+                if line is None:
+                    print(f"skipping {end - off}-byte line at {self.path}:{off}")
+                else:
+                    text = line.decode("utf-8", "replace").rstrip("\r\n")
+                    if self.cols is None:
+                        self.cols = next(csv.reader([text]))
+                    elif text:
+                        r = _row(self.cols, next(csv.reader([text])))
+                        if r is not None:
+                            if self.rows % INDEX_EVERY == 0:
+                                self.mark_ts.append(r["ts"]); self.mark_off.append(off)
+                            if self.last_ts is not None and r["ts"] < self.last_ts:
+                                self.monotonic = False
+                            self.rows += 1
+                            self.last_ts = r["ts"]
+                self.indexed = end
+
+    def read_block(self, k) -> List[Tuple[int, dict]]:
+        # rows of block k as (offset, row), ascending
+        start = self.mark_off[k]
+        stop = self.mark_off[k + 1] if k + 1 < len(self.mark_off) else self.indexed
+        out = []
+        with open(self.path, "rb") as f:
+            for off, line, _ in _lines(f, start, stop):
+                text = line.decode("utf-8", "replace").rstrip("\r\n") if line is not None else ""
+                if text:
+                    r = _row(self.cols, next(csv.reader([text])))
+                    if r is not None:
+                        out.append((off, r))
+        return out
+
+class OverrideLog:
+    # time-ordered override rows across the live file and its rotated segments, read block by
+    # block through a sparse index: memory and latency scale with the page, not the log
+    def __init__(self, path: str, backups: Optional[int] = None):
+        self.path = path
+        self.backups = backups
+        self.lock = threading.Lock()
+        self.segs = {}   # inode -> _Segment
+
+    def refresh(self) -> List[_Segment]:
+        with self.lock:
+            out, seen = [], set()
+            for p in segments(self.path, self.backups):
+                try:
+                    st = os.stat(p)
+                except OSError:
+                    continue
+                seg = self.segs.get(st.st_ino)
+                if seg is None or st.st_size < seg.indexed:   # new file, or truncated and reused
+                    seg = self.segs[st.st_ino] = _Segment(p, st.st_ino)
+                seg.path = p
+                seg.extend(st.st_size)
+                seen.add(st.st_ino)
+                out.append(seg)
+            for ino in list(self.segs):
+                if ino not in seen:
+                    del self.segs[ino]
+            return out
+
+    def scan(self, since: Optional[float] = None, until: Optional[float] = None, user: Optional[str] = None,
+             lane: Optional[int] = None, cursor: Optional[str] = None, desc: bool = False,
+             intersection: Optional[str] = None) -> Iterator[Tuple[str, dict]]:
+        # yields (cursor, row); resuming from a yielded cursor continues just after that row.
+        # Seeking by ts needs rows in ts order across segments; when a clock step broke that, every
+        # block is read in file order and filtered instead
+        segs = self.refresh()
+        ordered = all(s.monotonic for s in segs) and all(
+            a.last_ts is None or not b.mark_ts or b.mark_ts[0] >= a.last_ts for a, b in zip(segs, segs[1:]))
+        pos = None
+        if cursor:
+            ino, off = parse_cursor(cursor)
+            idx = next((i for i, s in enumerate(segs) if s.inode == ino), None)
+            if idx is None:
+                return   # segment rotated out of retention
+            pos = (idx, off)
+        order = range(len(segs) - 1, -1, -1) if desc else range(len(segs))
+        for i in order:
+            seg = segs[i]
+            if not seg.mark_off or (pos is not None and (i > pos[0] if desc else i < pos[0])):
+                continue
+            if ordered and not desc and since is not None and seg.last_ts is not None and seg.last_ts < since:
+                continue
+            if ordered and desc and until is not None and seg.mark_ts[0] > until:
+                continue
+            n = len(seg.mark_off)
+            if desc:
+                k = n - 1
+                if ordered and until is not None:
+                    k = min(k, max(0, bisect_right(seg.mark_ts, until) - 1))
+                if pos is not None and i == pos[0]:
+                    k = min(k, max(0, bisect_right(seg.mark_off, pos[1]) - 1))
+                blocks = range(k, -1, -1)
+            else:
+                k = 0
+                if ordered and since is not None:
+                    k = max(0, bisect_left(seg.mark_ts, since) - 1)
+                if pos is not None and i == pos[0]:
+                    k = max(k, bisect_right(seg.mark_off, pos[1]) - 1)
+                blocks = range(k, n)
+            for b in blocks:
+                rows = seg.read_block(b)
+                for off, r in (reversed(rows) if desc else rows):
+                    if pos is not None and i == pos[0] and (off >= pos[1] if desc else off <= pos[1]):
+                        continue
+                    ts = r["ts"]
+                    if since is not None and ts < since:
+                        if desc and ordered:
+                            return
+                        continue
+                    if until is not None and ts > until:
+                        if desc or not ordered:
+                            continue
+                        return
+                    if user is not None and r.get("user") != user:
+                        continue
+                    if lane is not None and r.get("lane") != lane:
+                        continue
+                    if intersection is not None and r.get("intersection") != intersection:
+                        continue
+                    yield f"{seg.inode}-{off}", r
+
+    def page(self, limit: int = 100, **filters) -> Tuple[List[dict], Optional[str]]:
+        limit = max(1, min(int(limit), LOG_PAGE_MAX))
+        out, last = [], None
+        for cur, r in self.scan(**filters):
+            if len(out) == limit:
+                return out, last
+            out.append(r); last = cur
+        return out, None
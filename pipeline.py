@@ -0,0 +1,164 @@
+# pipeline.py
+import math, time, threading
+from collections import deque, namedtuple
+from typing import Callable, Optional
+
+FRAME_RING_SIZE = 2
+CAPTURE_RETRY_SECONDS = 1.0
+FIRST_FRAME_WAIT_SECONDS = 2.0
+
+Frame = namedtuple("Frame", ["seq", "ts", "image"])
+Result = namedtuple("Result", ["version", "ts", "frame_ts", "value", "error", "latency"])
+
+class RollingQuantile:
+    # nearest-rank quantiles over the last `size` samples
+    def __init__(self, size: int = 64):
+        self.samples = deque(maxlen=max(1, int(size)))
+    def add(self, x: float):
+        self.samples.append(float(x))
+    def quantile(self, q: float, default: Optional[float] = None) -> Optional[float]:
+        if not self.samples:
+            return default
+        s = sorted(self.samples)
+        return s[min(len(s) - 1, max(0, math.ceil(q * len(s)) - 1))]
+    def __len__(self):
+        return len(self.samples)
+
+class VersionedSlot:
+    # single-writer slot; readers get the newest completed result without blocking the writer
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.current: Optional[Result] = None
+        self.version = 0
+    def publish(self, value=None, error=None, frame_ts=None, latency=0.0) -> Result:
+        with self.cond:
+            self.version += 1
+            self.current = Result(self.version, time.monotonic(), frame_ts, value, error, latency)
+            self.cond.notify_all()
+            return self.current
+    def get(self, after_version: int = 0, timeout: float = 0.0) -> Optional[Result]:
+        with self.cond:
+            if self.version <= after_version and timeout > 0:
+                self.cond.wait_for(lambda: self.version > after_version, timeout)
+            r = self.current
+            return r if r is not None and r.version > after_version else None
+    def freshest(self) -> Optional[Result]:
+        return self.current
+
+class FrameGrabber:
+    # capture thread: keeps reading so the camera buffer never goes stale, retains only the last few frames
+    def __init__(self, open_fn: Callable, read_fn: Callable, release_fn: Optional[Callable] = None,
+                 ring_size: int = FRAME_RING_SIZE):
+        self.open_fn = open_fn; self.read_fn = read_fn; self.release_fn = release_fn
+        self.ring = deque(maxlen=max(1, int(ring_size)))
+        self.seq = 0
+        self.error = None
+        self.cap = None
+        self.has_frame = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="frame-grabber", daemon=True)
+        self._thread.start()
+    def _run(self):
+        while not self._stop.is_set():
+            if self.cap is None:
+                try:
+                    self.cap = self.open_fn()
+                    self.error = None
+                except Exception as e:
+                    self.error = f"camera_open_err:{e}"
+                    self._stop.wait(CAPTURE_RETRY_SECONDS)
+                    continue
+            try:
+                img = self.read_fn(self.cap)
+            except Exception as e:
+                self.error = f"camera_read_err:{e}"
+                self._release()
+                self._stop.wait(CAPTURE_RETRY_SECONDS)
+                continue
+            self.seq += 1
+            self.ring.append(Frame(self.seq, time.monotonic(), img))
+            self.has_frame.set()
+        self._release()
+    def _release(self):
+        if self.cap is not None and self.release_fn is not None:
+            try:
+                self.release_fn(self.cap)
+            except Exception:
+                pass
+        self.cap = None
+    def latest(self, timeout: float = 0.0) -> Optional[Frame]:
+        if timeout > 0:
+            self.has_frame.wait(timeout)
+        try:
+            return self.ring[-1]
+        except IndexError:
+            return None
+    def stop(self, timeout: float = 2.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+class DetectionWorker:
+    # runs detect_fn(frame) on the freshest frame whenever a detection is requested
+    def __init__(self, grabber: FrameGrabber, detect_fn: Callable, slot: Optional[VersionedSlot] = None):
+        self.grabber = grabber
+        self.detect_fn = detect_fn
+        self.slot = slot or VersionedSlot()
+        self.requested = threading.Event()
+        self.busy = False
+        self._stop = threading.Event()
+        self._thread = None
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="detection-worker", daemon=True)
+        self._thread.start()
+    def request(self) -> int:
+        # returns the slot version a caller should wait past
+        v = self.slot.version
+        self.requested.set()
+        return v
+    def _run(self):
+        while not self._stop.is_set():
+            if not self.requested.wait(0.5):
+                continue
+            self.requested.clear()
+            frame = self.grabber.latest(FIRST_FRAME_WAIT_SECONDS)
+            if frame is None:
+                self.slot.publish(error=self.grabber.error or "no_frame")
+                continue
+            self.busy = True
+            t0 = time.perf_counter()
+            try:
+                value = self.detect_fn(frame.image)
+                self.slot.publish(value=value, frame_ts=frame.ts, latency=time.perf_counter() - t0)
+            except Exception as e:
+                self.slot.publish(error=f"detection_error:{e}", frame_ts=frame.ts, latency=time.perf_counter() - t0)
+            finally:
+                self.busy = False
+    def stop(self, timeout: float = 2.0):
+        self._stop.set()
+        self.requested.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+class DetectionPipeline:
+    def __init__(self, open_fn, read_fn, detect_fn, release_fn=None, ring_size: int = FRAME_RING_SIZE):
+        self.grabber = FrameGrabber(open_fn, read_fn, release_fn, ring_size)
+        self.worker = DetectionWorker(self.grabber, detect_fn)
+        self.slot = self.worker.slot
+    def start(self):
+        self.grabber.start(); self.worker.start()
+        return self
+    def request(self) -> int:
+        return self.worker.request()
+    def result(self, after_version: int = 0, timeout: float = 0.0) -> Optional[Result]:
+        return self.slot.get(after_version, timeout)
+    def stop(self):
+        self.worker.stop(); self.grabber.stop()
@@ -0,0 +1,192 @@
+# rollups.py
+import time, threading
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Dict, Iterable, List, Optional
+import numpy as np
+
+from forecast import local_seconds, from_local
+
+# name -> (bucket seconds, buckets kept per lane); day buckets are kept for ~20 years
+RESOLUTIONS = {"minute": (60, 14*1440), "hour": (3600, 400*24), "day": (86400, 20*366)}
+MAX_POINTS = 500
+
+def bucket_of(ts, step: int):
+    # bucket index; boundaries are aligned to local time (at each ts's own offset, so across DST
+    # changes too) and days start at local midnight
+    return local_seconds(ts) // step
+
+class _Series:
+    # one lane at one resolution: sorted bucket indexes with count/sum/min/max/sum of squares
+    __slots__ = ("cap", "keys", "n", "s", "mn", "mx", "ss")
+    def __init__(self, cap):
+        self.cap = cap
+        self.keys = array("q"); self.n = array("q")
+        self.s = array("d"); self.mn = array("d"); self.mx = array("d"); self.ss = array("d")
+
+    def add(self, k: int, v: float):
+        keys = self.keys
+        if keys and keys[-1] == k:
+            i = len(keys) - 1
+        elif not keys or k > keys[-1]:
+            self._insert(len(keys), k, v)
+            self._trim()
+            return
+        else:
+            # late row: rare, so a list insert is fine
+            i = bisect_left(keys, k)
+            if i == len(keys) or keys[i] != k:
+                if keys[-1] - k >= self.cap:
+                    return   # older than retention
+                self._insert(i, k, v)
+                return
+        self.n[i] += 1; self.s[i] += v; self.ss[i] += v * v
+        if v < self.mn[i]: self.mn[i] = v
+        if v > self.mx[i]: self.mx[i] = v
+
+    def _insert(self, i, k, v):
+        self.keys.insert(i, k); self.n.insert(i, 1); self.s.insert(i, v)
+        self.mn.insert(i, v); self.mx.insert(i, v); self.ss.insert(i, v * v)
+
+    def _trim(self):
+        # drop expired buckets in slabs so the shift is amortized
+        if len(self.keys) < self.cap + self.cap // 8 + 1:
+            return
+        cut = bisect_left(self.keys, self.keys[-1] - self.cap + 1)
+        for a in (self.keys, self.n, self.s, self.mn, self.mx, self.ss):
+            del a[:cut]
+
+    def extend(self, keys, vals):
+        # bulk build from rows (used on load): group by bucket in numpy, then append
+        if vals.size == 0:
+            return
+        order = np.argsort(keys, kind="stable")
+        keys, vals = keys[order].astype(np.int64), vals[order]
+        starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+        uk = keys[starts]
+        n = np.diff(np.r_[starts, keys.size])
+        s = np.add.reduceat(vals, starts); ss = np.add.reduceat(vals * vals, starts)
+        mn = np.minimum.reduceat(vals, starts); mx = np.maximum.reduceat(vals, starts)
+        keep = uk > uk[-1] - self.cap
+        if self.keys and uk[keep][0] <= self.keys[-1]:
+            for k, c, a, lo, hi, q in zip(uk[keep], n[keep], s[keep], mn[keep], mx[keep], ss[keep]):
+                self._merge(int(k), int(c), a, lo, hi, q)
+        else:
+            self.keys.extend(uk[keep].tolist()); self.n.extend(n[keep].tolist())
+            self.s.extend(s[keep].tolist()); self.ss.extend(ss[keep].tolist())
+            self.mn.extend(mn[keep].tolist()); self.mx.extend(mx[keep].tolist())
+        self._trim()
+
+    def _merge(self, k, c, a, lo, hi, q):
+        i = bisect_left(self.keys, k)
+        if i < len(self.keys) and self.keys[i] == k:
+            self.n[i] += c; self.s[i] += a; self.ss[i] += q
+            self.mn[i] = min(self.mn[i], lo); self.mx[i] = max(self.mx[i], hi)
+        else:
+            for arr, v in ((self.keys, k), (self.n, c), (self.s, a), (self.mn, lo), (self.mx, hi), (self.ss, q)):
+                arr.insert(i, v)
+
+    def span(self, lo: Optional[int], hi: Optional[int]):
+        # index range of buckets with lo <= key <= hi
+        i = 0 if lo is None else bisect_left(self.keys, lo)
+        j = len(self.keys) if hi is None else bisect_right(self.keys, hi)
+        return i, j
+
+class Rollups:
+    # per-lane aggregates at minute/hour/day resolution, updated row by row; range queries
+    # read only the buckets in range at the coarsest resolution that still gives enough points
+    def __init__(self, resolutions: Dict[str, tuple] = RESOLUTIONS):
+        self.resolutions = dict(resolutions)
+        self.lock = threading.Lock()
+        self.series = {}   # (resolution, col) -> _Series
+        self.version = 0
+
+    def _get(self, res, col):
+        s = self.series.get((res, col))
+        if s is None:
+            s = self.series[(res, col)] = _Series(self.resolutions[res][1])
+        return s
+
+    def clear(self):
+        with self.lock:
+            self.series = {}
+            self.version += 1
+
+    def add_row(self, row: dict):
+        ts = row.get("ts")
+        if ts is None:
+            return
+        local = float(local_seconds(ts))
+        with self.lock:
+            for res, (step, _) in self.resolutions.items():
+                k = int(local // step)
+                for col, v in row.items():
+                    if str(col).lower().startswith("lane") and v is not None:
+                        self._get(res, col).add(k, float(v))
+            self.version += 1
+
+    def add_many(self, col: str, ts: np.ndarray, vals: np.ndarray):
+        keep = ~(np.isnan(ts) | np.isnan(vals))
+        local, vals = local_seconds(ts[keep]), vals[keep].astype(float)
+        with self.lock:
+            for res, (step, _) in self.resolutions.items():
+                self._get(res, col).extend(local // step, vals)
+            self.version += 1
+
+    def columns(self) -> List[str]:
+        with self.lock:
+            return sorted({col for _, col in self.series})
+
+    def pick(self, since: Optional[float], until: Optional[float], max_points: int = MAX_POINTS) -> str:
+        # finest resolution that covers `since` (retention) in at most max_points buckets
+        until = time.time() if until is None else until
+        names = sorted(self.resolutions, key=lambda r: self.resolutions[r][0])
+        for res in names:
+            step, cap = self.resolutions[res]
+            if since is not None and (until - since) / step <= max_points and until - since < cap * step:
+                return res
+        return names[-1]
+
+    def query(self, cols: Iterable[str], since: Optional[float] = None, until: Optional[float] = None,
+              resolution: Optional[str] = None, max_points: int = MAX_POINTS) -> dict:
+        # {"resolution", "step", "lanes": {col: {"ts", "count", "mean", "min", "max", "std"}}}
+        res = resolution or self.pick(since, until, max_points)
+        if res not in self.resolutions:
+            raise ValueError(f"resolution must be one of {sorted(self.resolutions)}")
+        step = self.resolutions[res][0]
+        lo = None if since is None else int(bucket_of(since, step))
+        hi = None if until is None else int(bucket_of(until, step))
+        out = {}
+        with self.lock:
+            for col in cols:
+                s = self.series.get((res, col))
+                if s is None:
+                    out[col] = {"ts": [], "count": [], "mean": [], "min": [], "max": [], "std": []}
+                    continue
+                i, j = s.span(lo, hi)
+                # slices copy out of the arrays; a live buffer view would block later appends
+                n = np.array(s.n[i:j], dtype=float)
+                sm = np.array(s.s[i:j]); sq = np.array(s.ss[i:j])
+                mean = sm / n
+                out[col] = {"ts": from_local(np.array(s.keys[i:j], dtype=np.int64) * step).astype(np.int64).tolist(),
+                            "count": n.astype(int).tolist(), "mean": mean.tolist(),
+                            "min": s.mn[i:j].tolist(), "max": s.mx[i:j].tolist(),
+                            "std": np.sqrt(np.maximum(0.0, sq / n - mean * mean)).tolist()}
+        return {"resolution": res, "step": step, "lanes": out}
+
+    def summary(self, col: str, since: Optional[float] = None, until: Optional[float] = None,
+                hours: Optional[tuple] = None):
+        # (n, sum, sum of squares) over the range from hour buckets; `hours` keeps only
+        # buckets in those hours of the day
+        step = self.resolutions["hour"][0]
+        with self.lock:
+            s = self.series.get(("hour", col))
+            if s is None:
+                return 0, 0.0, 0.0
+            lo = None if since is None else int(bucket_of(since, step))
+            hi = None if until is None else int(bucket_of(until, step))
+            i, j = s.span(lo, hi)
+            keys = np.array(s.keys[i:j], dtype=np.int64)
+            mask = np.isin(keys % 24, hours) if hours is not None else slice(None)
+            return (int(np.array(s.n[i:j], dtype=np.int64)[mask].sum()),
+                    float(np.array(s.s[i:j])[mask].sum()), float(np.array(s.ss[i:j])[mask].sum()))
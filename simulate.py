@@ -0,0 +1,210 @@
+# simulate.py
+# Headless replay of a count trace through the signal decision logic, no sleeps.
+#   python simulate.py [--trace history.csv | --synthetic-days 3] [--policies rule,rl,fixed:20,fixed:30]
+#                      [--scales 1.0,1.5] [--workers 4] [--checkpoint checkpoints/q_main.bin]
+import argparse, csv, os, time
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional
+
+import numpy as np
+
+from decision import DecisionManager, MIN_GREEN
+from density import density_from_counts
+from forecast import hour_of_day
+from controller import LANE_CAPACITY, YOLO_TRIGGER_BEFORE
+
+OBSERVE_LEAD = int(YOLO_TRIGGER_BEFORE)   # counts are sampled when the controller would trigger detection
+SATURATION_FLOW = 0.5       # vehicles/s discharged by a green lane once moving
+LOST_TIME = 2               # seconds at the start of each green before discharge starts
+MAX_ROW_GAP = 120.0         # longer gaps between trace rows are compressed (logger was down, not empty roads)
+SYNTH_RATES = (0.10, 0.06, 0.12, 0.05)   # mean vehicles/s per lane for synthetic traces
+
+# ---------- traces ----------
+class Trace:
+    # per-second arrivals (seconds × lanes) with a cumulative curve for O(1) range sums
+    def __init__(self, arrivals, start_ts: float = 0.0, name: str = "trace"):
+        self.arrivals = np.asarray(arrivals, dtype=np.float64)
+        self.start_ts = float(start_ts)
+        self.name = name
+        self.cum = np.vstack([np.zeros((1, self.arrivals.shape[1])), np.cumsum(self.arrivals, axis=0)])
+    @property
+    def seconds(self) -> int:
+        return self.arrivals.shape[0]
+    @property
+    def num_lanes(self) -> int:
+        return self.arrivals.shape[1]
+    def scaled(self, factor: float) -> "Trace":
+        return Trace(self.arrivals * factor, self.start_ts, f"{self.name}x{factor:g}")
+
+def load_trace(path: str, max_gap: float = MAX_ROW_GAP) -> Trace:
+    # each history row's counts are spread evenly as arrivals until the next row
+    with open(path, newline="") as f:
+        rows = list(csv.DictReader(f))
+    lanes = sorted((c for c in (rows[0].keys() if rows else []) if c.startswith("lane")), key=lambda c: int(c[4:]))
+    if not rows or not lanes:
+        raise ValueError(f"{path}: no lane columns")
+    counts = np.array([[float(r[c] or 0) for c in lanes] for r in rows])
+    ts = np.array([float(r.get("ts") or 0.0) for r in rows])
+    gaps = np.clip(np.diff(ts, append=ts[-1] + MIN_GREEN), 1.0, max_gap)
+    secs = np.maximum(1, np.rint(gaps).astype(int))
+    arrivals = np.repeat(counts / secs[:, None], secs, axis=0)
+    return Trace(arrivals, ts[0], os.path.basename(path))
+
+def synthetic_trace(days: float = 1.0, rates=SYNTH_RATES, seed: Optional[int] = 0, start_ts: float = 0.0) -> Trace:
+    # Poisson arrivals with a two-peak daily profile (morning and evening rush)
+    rng = np.random.default_rng(seed)
+    n = int(days * 86400)
+    hours = ((start_ts + np.arange(n)) % 86400) / 3600.0
+    profile = 0.3 + np.exp(-0.5 * ((hours - 8.5) / 1.5) ** 2) + np.exp(-0.5 * ((hours - 17.5) / 2.0) ** 2)
+    lam = profile[:, None] * np.asarray(rates, dtype=np.float64)[None, :]
+    return Trace(rng.poisson(lam).astype(np.float64), start_ts, f"synthetic{days:g}d")
+
+# ---------- policies ----------
+class RulePolicy:
+    name = "rule"
+    def __init__(self, num_lanes: int):
+        self.dm = DecisionManager(num_lanes)
+    def decide(self, densities, current, rain=False, peak=False):
+        lane, dur, _ = self.dm.get_next_signal_state(densities, current, rain=rain, peak=peak, prefer_rl=False)
+        return lane, dur
+
+class RLPolicy(RulePolicy):
+    # greedy (eps=0) multiplier agent on top of the rule timers
+    name = "rl"
+    def __init__(self, num_lanes: int, checkpoint: Optional[str] = None):
+        super().__init__(num_lanes)
+        agent = self.dm.init_agent(seed=0)
+        if checkpoint and os.path.exists(checkpoint):
+            agent.load_checkpoint(checkpoint, mmap=False)
+        agent.set_eps(0.0)
+    def decide(self, densities, current, rain=False, peak=False):
+        lane, dur, _ = self.dm.get_next_signal_state(densities, current, rain=rain, peak=peak, prefer_rl=True)
+        return lane, dur
+
+class FixedTimePolicy:
+    def __init__(self, num_lanes: int, green: float = 30.0):
+        self.num_lanes = int(num_lanes)
+        self.green = int(round(green))
+        self.name = f"fixed:{self.green}"
+    def decide(self, densities, current, rain=False, peak=False):
+        return (current + 1) % self.num_lanes, self.green
+
+def make_policy(spec: str, num_lanes: int, checkpoint: Optional[str] = None):
+    kind, _, arg = spec.partition(":")
+    if kind == "rule":
+        return RulePolicy(num_lanes)
+    if kind == "rl":
+        return RLPolicy(num_lanes, checkpoint)
+    if kind == "fixed":
+        return FixedTimePolicy(num_lanes, float(arg or 30))
+    raise ValueError(f"unknown policy {spec!r}")
+
+# ---------- engine ----------
+def _densities(q, lane_capacity):
+    # what the camera would report: whole vehicles, density capped at 100%
+    return density_from_counts(np.rint(q).astype(int), lane_capacity)[0]
+
+def simulate(trace: Trace, policy, lane_capacity: int = LANE_CAPACITY, saturation: float = SATURATION_FLOW,
+             lost_time: int = LOST_TIME, observe_lead: int = OBSERVE_LEAD, rain: bool = False, peak_hours=()) -> dict:
+    # fluid queues advanced one whole phase at a time; the green lane is a reflected
+    # (non-negative) queue served at `saturation` after `lost_time`
+    t_wall = time.perf_counter()
+    L, T = trace.num_lanes, trace.seconds
+    peak_hours = set(peak_hours)
+    q = np.zeros(L)
+    delay = np.zeros(L)
+    departed = np.zeros(L)
+    green_time = np.zeros(L)
+    max_q = np.zeros(L)
+    phases = 0
+    t = 0
+    current = 0
+    obs = _densities(q, lane_capacity)
+    _, dur = policy.decide(obs, current, rain, hour_of_day(trace.start_ts) in peak_hours)
+    while t < T:
+        dur = max(1, int(dur))
+        t1 = min(t + dur, T)
+        n = t1 - t
+        qs = q + (trace.cum[t + 1:t1 + 1] - trace.cum[t])           # (n, L) queues without service
+        served = saturation * np.maximum(np.arange(1, n + 1) - lost_time, 0)
+        x = qs[:, current] - served
+        qs[:, current] = x - np.minimum(np.minimum.accumulate(x), 0.0)
+        departed[current] += q[current] + (trace.cum[t1, current] - trace.cum[t, current]) - qs[-1, current]
+        delay += qs.sum(axis=0)
+        max_q = np.maximum(max_q, qs.max(axis=0))
+        green_time[current] += n
+        # counts are sampled `observe_lead` seconds before the phase ends, like the controller's trigger
+        obs = _densities(qs[max(0, n - 1 - observe_lead)], lane_capacity)
+        q = qs[-1]
+        t = t1
+        phases += 1
+        if t >= T:
+            break
+        peak = hour_of_day(trace.start_ts + t) in peak_hours
+        current, dur = policy.decide(obs, current, rain, peak)
+    arrived = trace.cum[-1]
+    wall = time.perf_counter() - t_wall
+    return {
+        "trace": trace.name, "policy": policy.name, "sim_seconds": T, "phases": phases,
+        "arrived": float(arrived.sum()), "departed": float(departed.sum()), "left_in_queue": float(q.sum()),
+        "throughput_vph": float(departed.sum() / T * 3600.0) if T else 0.0,
+        "avg_wait_s": float(delay.sum() / max(arrived.sum(), 1e-9)),
+        "lane_wait_s": (delay / np.maximum(arrived, 1e-9)).round(2).tolist(),
+        "max_queue": max_q.round(1).tolist(),
+        "avg_green_s": float(green_time.sum() / max(phases, 1)),
+        "wall_s": wall, "speedup": T / wall if wall > 0 else float("inf"),
+    }
+
+# ---------- sweeps ----------
+def run_scenario(sc: dict) -> dict:
+    # sc: policy, and either trace (path) or synthetic_days; optional scale, seed, checkpoint, rain,
+    # peak_hours, lane_capacity, saturation, lost_time
+    if sc.get("trace"):
+        trace = load_trace(sc["trace"])
+    else:
+        trace = synthetic_trace(sc.get("synthetic_days", 1.0), seed=sc.get("seed", 0))
+    if sc.get("scale", 1.0) != 1.0:
+        trace = trace.scaled(sc["scale"])
+    policy = make_policy(sc["policy"], trace.num_lanes, sc.get("checkpoint"))
+    out = simulate(trace, policy, lane_capacity=sc.get("lane_capacity", LANE_CAPACITY),
+                   saturation=sc.get("saturation", SATURATION_FLOW), lost_time=sc.get("lost_time", LOST_TIME),
+                   rain=sc.get("rain", False), peak_hours=sc.get("peak_hours", ()))
+    out["scenario"] = sc
+    return out
+
+def sweep(scenarios: List[dict], workers: Optional[int] = None) -> List[dict]:
+    # one process per scenario batch; results come back in input order
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1 or len(scenarios) <= 1:
+        return [run_scenario(sc) for sc in scenarios]
+    with ProcessPoolExecutor(max_workers=min(workers, len(scenarios))) as pool:
+        return list(pool.map(run_scenario, scenarios))
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--trace", default=None, help="history-style CSV (lane1..laneN, ts)")
+    ap.add_argument("--synthetic-days", type=float, default=None)
+    ap.add_argument("--policies", default="rule,rl,fixed:20,fixed:30")
+    ap.add_argument("--scales", default="1.0")
+    ap.add_argument("--checkpoint", default=os.path.join("checkpoints", "q_main.bin"))
+    ap.add_argument("--peak-hours", default="", help="comma separated hours of day, e.g. 8,9,17,18")
+    ap.add_argument("--rain", action="store_true")
+    ap.add_argument("--workers", type=int, default=None)
+    args = ap.parse_args()
+    base = {"checkpoint": args.checkpoint, "rain": args.rain,
+            "peak_hours": [int(h) for h in args.peak_hours.split(",") if h]}
+    if args.trace or args.synthetic_days is None:
+        base["trace"] = args.trace or "history.csv"
+    else:
+        base["synthetic_days"] = args.synthetic_days
+    scenarios = [dict(base, policy=p, scale=float(s)) for s in args.scales.split(",") for p in args.policies.split(",")]
+    t0 = time.perf_counter()
+    results = sweep(scenarios, args.workers)
+    print(f"{'trace':>18} {'policy':>9} {'sim_h':>7} {'avg_wait_s':>10} {'veh/h':>8} {'queued':>7} {'phases':>7} {'x realtime':>11}")
+    for r in results:
+        print(f"{r['trace']:>18} {r['policy']:>9} {r['sim_seconds']/3600:>7.1f} {r['avg_wait_s']:>10.1f} "
+              f"{r['throughput_vph']:>8.0f} {r['left_in_queue']:>7.1f} {r['phases']:>7} {r['speedup']:>11.0f}")
+    print(f"{len(results)} scenarios in {time.perf_counter() - t0:.2f}s")
+
+if __name__ == "__main__":
+    main()
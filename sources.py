@@ -0,0 +1,194 @@
+# sources.py
+# Frame sources for the camera pipeline: a live camera, a video file (optionally looped), or a
+# synthetic scene with vehicles moving through the ROIs, so the camera path runs without hardware.
+import re, time
+from typing import List, Optional, Sequence
+import numpy as np
+
+SYNTHETIC_SIZE = (640, 480)
+SYNTHETIC_FPS = 15.0
+ROAD_GREY = 90
+
+class FrameSource:
+    # open() once, read() per frame (raises when no frame can be produced), release() at the end
+    def open(self) -> "FrameSource":
+        return self
+    def read(self) -> np.ndarray:
+        raise NotImplementedError
+    def release(self):
+        pass
+
+class CameraSource(FrameSource):
+    def __init__(self, index=0):
+        self.index = index
+        self.cap = None
+    def open(self):
+        from app_opencv import get_video_capture
+        self.cap = get_video_capture(self.index)
+        return self
+    def read(self):
+        from app_opencv import read_frame
+        return read_frame(self.cap)
+    def release(self):
+        from app_opencv import release_capture
+        if self.cap is not None:
+            release_capture(self.cap)
+            self.cap = None
+
+class VideoFileSource(FrameSource):
+    # decodes a file, rewinding at the end when `loop` is set; `fps` paces reads like a live camera
+    # (None uses the file's own rate, 0 reads as fast as it decodes)
+    def __init__(self, path: str, loop: bool = True, fps: Optional[float] = None):
+        self.path = path
+        self.loop = bool(loop)
+        self.fps = fps
+        self.cap = None
+        self.interval = 0.0
+        self.next_t = None
+    def open(self):
+        from app_opencv import get_video_capture
+        import cv2
+        self.cap = get_video_capture(self.path)
+        fps = self.fps if self.fps is not None else self.cap.get(cv2.CAP_PROP_FPS)
+        self.interval = 1.0 / fps if fps and fps > 0 else 0.0
+        self.next_t = None
+        return self
+    def read(self):
+        import cv2
+        _pace(self)
+        ok, frame = self.cap.read()
+        if not ok and self.loop:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ok, frame = self.cap.read()
+        if not ok:
+            raise RuntimeError(f"end of video {self.path}")
+        return frame
+    def release(self):
+        if self.cap is not None:
+            self.cap.release()
+            self.cap = None
+
+def _pace(src):
+    # sleep until the next frame is due; a reader that falls behind drops the backlog instead of bursting
+    if not src.interval:
+        return
+    now = time.monotonic()
+    if src.next_t is None or now - src.next_t > src.interval:
+        src.next_t = now
+    elif src.next_t > now:
+        time.sleep(src.next_t - now)
+    src.next_t += src.interval
+
+class SyntheticSource(FrameSource):
+    # vehicles are filled rectangles that enter at the top of each lane ROI and drive down it;
+    # each lane alternates between flowing and queued (stopped) spells so counts and motion both vary.
+    # ROIs are rectangles or polygons, rasterized with the detector's LaneMap: vehicles follow the
+    # lane's per-row centre line and truth() uses the same pixel -> lane lookup as detection
+    def __init__(self, rois: Sequence, width: int = SYNTHETIC_SIZE[0], height: int = SYNTHETIC_SIZE[1],
+                 fps: float = SYNTHETIC_FPS, realtime: bool = True, arrival_rate: float = 0.4,
+                 speed: float = 60.0, spell_seconds: float = 8.0, seed: Optional[int] = 0):
+        self.rois = list(rois)
+        self.width, self.height = int(width), int(height)
+        self.fps = float(fps)
+        self.dt = 1.0 / self.fps
+        self.interval = self.dt if realtime else 0.0
+        self.next_t = None
+        self.arrival_rate = float(arrival_rate)   # vehicles per second per lane while flowing
+        self.speed = float(speed)                 # px per second
+        self.spell_seconds = float(spell_seconds)
+        self.seed = seed
+        self.reset()
+
+    def reset(self):
+        from detection import LaneMap
+        self.rng = np.random.default_rng(self.seed)
+        self.t = 0.0
+        self.frames = 0
+        self.lane_map = LaneMap(self.rois, shape=(self.height, self.width))
+        self.background = np.full((self.height, self.width, 3), ROAD_GREY, dtype=np.uint8)
+        self.lanes = []   # per lane: (top row, height, per-row centre x, vehicle w, vehicle h), None if off-frame
+        for i in range(len(self.rois)):
+            ys, xs = np.nonzero(self.lane_map.raster == i)
+            if ys.size == 0:
+                self.lanes.append(None)
+                continue
+            y0, h = int(ys.min()), int(ys.max() - ys.min())
+            r = ys - y0
+            n = np.bincount(r, minlength=h + 1)
+            left = np.full(h + 1, self.width); np.minimum.at(left, r, xs)
+            right = np.full(h + 1, -1); np.maximum.at(right, r, xs)
+            rows = np.flatnonzero(n)
+            centre = np.interp(np.arange(h + 1), rows, (left[rows] + right[rows]) / 2.0)
+            w = int(np.median(right[rows] - left[rows]))
+            self.lanes.append((y0, h, centre, max(8, w * 2 // 3), max(8, h // 6)))
+            # lane markings along the left edge so frames are not flat
+            for k in rows:
+                self.background[y0 + k, max(0, left[k] - 2):max(0, left[k])] = 230
+        self.vehicles: List[List[list]] = [[] for _ in self.rois]   # per lane: [x, y, w, h, (b, g, r)]
+        self.flowing = [bool(self.rng.integers(0, 2)) for _ in self.rois]
+        self.spell_end = [float(self.rng.uniform(0.5, 1.5) * self.spell_seconds) for _ in self.rois]
+
+    def _step(self):
+        self.t += self.dt
+        for i, geom in enumerate(self.lanes):
+            if self.t >= self.spell_end[i]:
+                self.flowing[i] = not self.flowing[i]
+                self.spell_end[i] = self.t + float(self.rng.uniform(0.5, 1.5) * self.spell_seconds)
+            if geom is None:
+                continue
+            y, h, centre, vw, vh = geom
+            lane = self.vehicles[i]
+            if self.flowing[i]:
+                for v in lane:
+                    v[1] += self.speed * self.dt
+                lane[:] = [v for v in lane if v[1] < y + h]
+                if self.rng.random() < self.arrival_rate * self.dt and (not lane or lane[-1][1] > y + vh + 4):
+                    colour = tuple(int(c) for c in self.rng.integers(140, 256, size=3))
+                    lane.append([0, float(y - vh // 2), vw, vh, colour])
+            else:
+                # queue up behind the stop line at the bottom of the ROI
+                stop = y + h - vh
+                for k, v in enumerate(lane):
+                    v[1] = min(v[1] + self.speed * self.dt, stop - k * (vh + 4))
+            for v in lane:
+                # keep each vehicle centred on the lane at its own row
+                v[0] = int(round(centre[min(h, max(0, int(v[1]) + vh // 2 - y))])) - vw // 2
+
+    def read(self):
+        _pace(self)
+        if self.frames:
+            self._step()
+        self.frames += 1
+        img = self.background.copy()
+        for lane in self.vehicles:
+            for x, y, w, h, colour in lane:
+                y0 = int(y)
+                img[max(0, y0):max(0, y0 + h), max(0, x):max(0, x + w)] = colour
+        return img
+
+    def truth(self) -> List[int]:
+        # vehicles whose centre maps to their own lane (inclusive, like run_yolo_detection)
+        out = []
+        for i, lane in enumerate(self.vehicles):
+            if not lane:
+                out.append(0)
+                continue
+            cx = [vx + vw // 2 for vx, vy, vw, vh, _ in lane]
+            cy = [int(vy) + vh // 2 for vx, vy, vw, vh, _ in lane]
+            out.append(int(np.count_nonzero(self.lane_map.lookup(cx, cy) == i)))
+        return out
+
+_SYNTHETIC = re.compile(r"^synthetic(?::(\d+)x(\d+))?(?:@([\d.]+))?$")
+
+def open_source(spec, rois=None) -> FrameSource:
+    # a FrameSource, a camera index (int or digit string), "synthetic[:WxH][@FPS]", or a video path
+    if isinstance(spec, FrameSource):
+        return spec.open()
+    if isinstance(spec, int) or (isinstance(spec, str) and spec.isdigit()):
+        return CameraSource(int(spec)).open()
+    m = _SYNTHETIC.match(str(spec))
+    if m:
+        w, h, fps = m.groups()
+        return SyntheticSource(rois or [], int(w or SYNTHETIC_SIZE[0]), int(h or SYNTHETIC_SIZE[1]),
+                               float(fps or SYNTHETIC_FPS)).open()
+    return VideoFileSource(str(spec)).open()
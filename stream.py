@@ -0,0 +1,141 @@
+# stream.py
+import json, threading, uuid
+from collections import deque, namedtuple
+from types import MappingProxyType
+from typing import Callable, Iterator, Optional
+
+DELTA_BACKLOG = 256
+HEARTBEAT_SECONDS = 15.0
+# keys that change on every tick without the state actually changing
+VOLATILE_KEYS = ("timestamp",)
+
+# a published state: read-only view, plus the JSON body encoded once for every reader
+Snapshot = namedtuple("Snapshot", ["version", "state", "body"])
+
+def _copy(latest: dict) -> dict:
+    return {k: (list(v) if isinstance(v, list) else dict(v) if isinstance(v, dict) else v) for k, v in latest.items()}
+
+def _freeze(v):
+    if isinstance(v, (list, tuple)):
+        return tuple(_freeze(x) for x in v)
+    if isinstance(v, dict):
+        return MappingProxyType({k: _freeze(x) for k, x in v.items()})
+    return v
+
+def parse_event_id(event_id) -> tuple:
+    # "<epoch>-<version>" -> (epoch, version); anything else (bare ints from before epochs) -> (None, -1)
+    try:
+        epoch, version = str(event_id).rsplit("-", 1)
+        return epoch, int(version)
+    except (TypeError, ValueError):
+        return None, -1
+
+class StateFeed:
+    # versioned view of an intersection's `latest`; version only moves when something other than
+    # the timestamp changed, and each change's snapshot and delta are JSON-encoded once for every reader.
+    # Versions restart at 0 with every feed, so ids and ETags carry the feed's random epoch too.
+    def __init__(self, backlog: int = DELTA_BACKLOG):
+        self.cond = threading.Condition()
+        self.epoch = uuid.uuid4().hex[:12]
+        self.version = 0
+        self.snapshot: dict = {}
+        self.snap = Snapshot(0, MappingProxyType({}), b"{}")   # replaced, never mutated: safe to read without the lock
+        self.deltas = deque(maxlen=backlog)   # (version, encoded delta bytes)
+        self.subscribers = 0
+        self.closed = False
+
+    def close(self):
+        # the intersection is gone: open streams send a final 'closed' event and end
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+    def publish(self, latest: dict) -> bool:
+        snap = _copy(latest)
+        with self.cond:
+            old = self.snapshot
+            delta = {k: v for k, v in snap.items() if k not in old or old[k] != v}
+            delta.update({k: None for k in old if k not in snap})
+            if all(k in VOLATILE_KEYS for k in delta):
+                return False
+            self.version += 1
+            self.snapshot = snap
+            self.snap = Snapshot(self.version, _freeze(snap), json.dumps(snap).encode())
+            self.deltas.append((self.version, json.dumps({"epoch": self.epoch, "version": self.version,
+                                                          "delta": delta}).encode()))
+            self.cond.notify_all()
+            return True
+
+    def current(self) -> Snapshot:
+        return self.snap
+
+    def wait(self, after_version: int, timeout: float) -> int:
+        with self.cond:
+            self.cond.wait_for(lambda: self.version > after_version or self.closed, timeout)
+            return self.version
+
+    def etag(self, snap: Snapshot) -> str:
+        return f"{self.epoch}-{snap.version}"
+
+    def since(self, after_version: int) -> Optional[list]:
+        # encoded deltas newer than after_version, or None when the client needs a full snapshot:
+        # the deltas have rolled out of the backlog, or the version is from the future (another feed)
+        with self.cond:
+            if after_version > self.version:
+                return None
+            if after_version == self.version:
+                return []
+            if not self.deltas or self.deltas[0][0] > after_version + 1:
+                return None
+            return [d for d in self.deltas if d[0] > after_version]
+
+    def events(self, last_event_id: Optional[str] = None, heartbeat: float = HEARTBEAT_SECONDS,
+               stop: Optional[threading.Event] = None) -> Iterator[bytes]:
+        # Server-Sent Events: a full 'snapshot' first (or after falling behind, or when the client's
+        # Last-Event-ID belongs to another epoch, e.g. before a restart), then 'delta' events
+        with self.cond:
+            self.subscribers += 1
+        epoch = self.epoch.encode()
+        try:
+            ep, v = parse_event_id(last_event_id)
+            if ep != self.epoch:
+                v = -1
+            while stop is None or not stop.is_set():
+                if self.closed:
+                    yield b"event: closed\ndata: {}\n\n"
+                    return
+                pending = self.since(v) if v >= 0 else None
+                if pending is None:
+                    snap = self.current()
+                    v = snap.version
+                    yield (b"id: %s-%d\nevent: snapshot\ndata: {\"epoch\": \"%s\", \"version\": %d, \"state\": "
+                           % (epoch, v, epoch, v) + snap.body + b"}\n\n")
+                    continue
+                for ver, body in pending:
+                    yield b"id: %s-%d\nevent: delta\ndata: " % (epoch, ver) + body + b"\n\n"
+                    v = ver
+                if self.wait(v, heartbeat) <= v and not self.closed:
+                    yield b": keepalive\n\n"
+        finally:
+            with self.cond:
+                self.subscribers -= 1
+
+class EncodedView:
+    # JSON bytes of a derived view, re-encoded only when key_fn() changes; a hit is a tuple compare, no lock
+    def __init__(self, key_fn: Callable, build_fn: Callable):
+        self.key_fn = key_fn
+        self.build_fn = build_fn
+        self.lock = threading.Lock()
+        self.cached = (None, b"")
+    def get(self) -> bytes:
+        key = self.key_fn()
+        cached = self.cached
+        if cached[0] == key:
+            return cached[1]
+        with self.lock:
+            # one encoder per change; concurrent misses wait for it instead of encoding again
+            cached = self.cached
+            if cached[0] != key:
+                cached = (key, json.dumps(self.build_fn()).encode())
+                self.cached = cached
+            return cached[1]
@@ -0,0 +1,5 @@
+# conftest.py
+# the backend is flat top-level modules; make them importable from tests/
+import os, sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
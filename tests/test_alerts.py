@@ -0,0 +1,38 @@
+# test_alerts.py
+from alerts import AlertStore
+from journal import JournalWriter
+
+def strip(alerts):
+    return [{k: a[k] for k in ("id", "lane", "msg", "ack")} for a in alerts]
+
+def test_reload_after_restart_through_journal(tmp_path):
+    path = str(tmp_path / "alerts.json")
+    jw = JournalWriter(flush_interval=0.01)
+    jw.start()
+    store = AlertStore(path, journal=jw)
+    store.load()
+    for lane in range(3):
+        store.raise_alert(lane, f"lane {lane} jammed")
+    store.ack(lane=1)
+    assert store.raise_alert(0, "again") is None   # lane 0 still open
+    jw.stop()
+    reloaded = AlertStore(path)
+    reloaded.load()
+    assert reloaded.all() == store.all()
+    assert strip(reloaded.open_alerts()) == strip(store.open_alerts())
+    assert [a["lane"] for a in reloaded.open_alerts()] == [0, 2]
+    # ids continue after the reloaded ones
+    assert reloaded.raise_alert(1, "new")["id"] == 4
+
+def test_reload_after_compaction(tmp_path):
+    path = str(tmp_path / "alerts.json")
+    store = AlertStore(path, compact_every=10**6)   # compact by hand, not on a thread
+    for lane in range(5):
+        store.raise_alert(lane, "x")
+    store.compact()
+    store.ack(alert_id=2)
+    assert store.raise_alert(1, "y")["id"] == 6
+    reloaded = AlertStore(path)
+    reloaded.load()
+    assert reloaded.all() == store.all()
+    assert [a["id"] for a in reloaded.open_alerts()] == [1, 3, 4, 5, 6]
@@ -0,0 +1,24 @@
+# test_decision_batch.py
+import numpy as np
+import pytest
+
+from decision import DecisionManager, ZERO_DENSITY_THRESHOLD, next_signal_state_batch
+
+@pytest.mark.parametrize("lanes", [1, 2, 4, 7])
+def test_batch_matches_scalar(lanes):
+    rng = np.random.default_rng(lanes)
+    n = 2000
+    d = rng.uniform(0, 120, size=(n, lanes)).round(1)
+    d[rng.random((n, lanes)) < 0.3] = 0.0                       # empty lanes
+    d[rng.random(n) < 0.05] = ZERO_DENSITY_THRESHOLD            # whole intersections at the threshold
+    cur = rng.integers(0, lanes, size=n)
+    rain, peak = rng.random(n) < 0.3, rng.random(n) < 0.2
+    nxt, dur, timers = next_signal_state_batch(d, cur, rain, peak)
+    for i, row in enumerate(d.tolist()):
+        n_s, d_s, t_s = DecisionManager(lanes).get_next_signal_state(row, int(cur[i]), rain=bool(rain[i]),
+                                                                     peak=bool(peak[i]))
+        assert (int(nxt[i]), int(dur[i]), timers[i].tolist()) == (n_s, d_s, list(t_s)), i
+
+def test_batch_rejects_1d():
+    with pytest.raises(ValueError):
+        next_signal_state_batch([1.0, 2.0], [0])
@@ -0,0 +1,79 @@
+# test_journal.py
+import csv, os
+
+from journal import JournalWriter, segments
+
+HEADER = ["ts", "lane", "count"]
+
+def read_back(path, backups):
+    # what a restarted process sees: every kept segment, oldest first
+    rows = []
+    for p in segments(path, backups):
+        with open(p, newline="") as f:
+            r = csv.reader(f)
+            assert next(r) == HEADER
+            rows.extend(r)
+    return rows
+
+def writer(**kw):
+    return JournalWriter(flush_interval=0.01, **kw)   # stop() does not wait out a long batch window
+
+def rows(n):
+    return [[str(1000 + i), str(i % 4), str(i)] for i in range(n)]
+
+def write(jw, path, rs):
+    jw.start()
+    for r in rs:
+        jw.append_csv(path, HEADER, r)
+        jw.flush()
+    jw.stop()
+
+def test_rows_survive_restart(tmp_path):
+    path = str(tmp_path / "history.csv")
+    jw = writer(max_bytes=500, backups=None)
+    write(jw, path, rows(200))
+    assert jw.stats["rotations"] > 0 and jw.stats["segments_dropped"] == 0
+    assert read_back(path, None) == rows(200)
+    # a second writer (after a restart) appends after what is already there
+    write(writer(max_bytes=500, backups=None), path, rows(250)[200:])
+    assert read_back(path, None) == rows(250)
+
+def test_retention_drops_oldest_and_counts_it(tmp_path):
+    path = str(tmp_path / "history.csv")
+    other = str(tmp_path / "overrides.csv")
+    jw = writer(max_bytes=300, backups=2)
+    jw.retain(other, None)
+    jw.start()
+    for r in rows(200):
+        jw.append_csv(path, HEADER, r)
+        jw.append_csv(other, HEADER, r)
+        jw.flush()
+    jw.stop()
+    assert jw.stats["segments_dropped"] > 0
+    assert len(segments(path, None)) == 3
+    kept = read_back(path, 2)
+    assert kept and kept == rows(200)[-len(kept):]
+    assert read_back(other, None) == rows(200)   # retain(None) keeps every segment
+
+def test_failed_write_is_retried(tmp_path):
+    path = str(tmp_path / "later" / "history.csv")
+    jw = writer()
+    for r in rows(3):
+        jw.append_csv(path, HEADER, r)
+    jw.flush()   # no writer thread: drains inline, and the directory does not exist yet
+    assert jw.stats["errors"] == 1 and jw.pending() == 3
+    os.makedirs(os.path.dirname(path))
+    jw.append_csv(path, HEADER, rows(4)[3])
+    jw.stop()    # the final drain retries regardless of backoff
+    assert jw.stats["dropped"] == 0 and jw.pending() == 0
+    assert read_back(path, 0) == rows(4)
+
+def test_text_lines_append_in_order(tmp_path):
+    path = str(tmp_path / "alerts.json.log")
+    jw = writer()
+    jw.start()
+    jw.append_lines(path, ["a", "b"])
+    jw.append_lines(path, ["c"])
+    jw.stop()
+    with open(path) as f:
+        assert f.read() == "a\nb\nc\n"
@@ -0,0 +1,161 @@
+# training.py
+import os, time, uuid, threading, contextlib, multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+import numpy as np
+
+from decision import q_train, RL_BATCH_SIZE
+
+MAX_TRAIN_ITERS = 200_000   # a few seconds of work per call; longer runs are repeated calls
+TRAIN_CHUNK_ITERS = 50_000   # progress granularity: one pool task per chunk
+MAX_JOBS_KEPT = 100
+
+def _train_chunk(Q, k, a, r, k2, alpha, gamma, iterations, batch_size, seed):
+    # runs in a worker process on private copies; returns the updated table
+    q_train(Q, k, a, r, k2, alpha, gamma, iterations, batch_size, np.random.default_rng(seed))
+    return Q
+
+class TrainingJobs:
+    def __init__(self, workers: int = 1, max_iters: int = MAX_TRAIN_ITERS):
+        self.workers = max(1, int(workers))
+        self.max_iters = int(max_iters)
+        self.lock = threading.Lock()
+        self.jobs = {}
+        self.active = {}   # id(agent) -> job_id, one job per agent at a time
+        self._pool = None
+
+    def _get_pool(self):
+        if self._pool is None:
+            # spawn, not fork: the parent runs Flask and the control loop threads. Spawn children re-import
+            # the parent's __main__ as __mp_main__, so a script that creates this pool must keep its
+            # startup side effects out of that import (backend.py checks SERVER_PROCESS)
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._pool
+
+    def submit(self, agent, iterations: int, batch_size: int = RL_BATCH_SIZE, owner: Optional[str] = None,
+               lock=None) -> dict:
+        # `lock` guards the agent against the thread that appends to its buffer (the intersection's lock):
+        # an append writes the fields one by one, so an unlocked copy could pair a new action with a stale state
+        iterations = int(iterations)
+        if iterations <= 0 or iterations > self.max_iters:
+            raise ValueError(f"iters must be in 1..{self.max_iters}")
+        with lock or contextlib.nullcontext():
+            snap = agent.buffer.snapshot()
+            Q = np.array(agent.Q)
+        with self.lock:
+            running = self.active.get(id(agent))
+            if running is not None:
+                raise RuntimeError(f"training job {running} already running")
+            if len(snap["k"]) == 0:
+                raise ValueError("replay buffer is empty")
+            job = {"id": uuid.uuid4().hex, "owner": owner, "status": "queued", "iters": iterations, "done": 0,
+                   "progress": 0.0, "buffer_size": len(snap["k"]), "submitted": time.time(),
+                   "started": None, "finished": None, "error": None, "q_version": None}
+            self.jobs[job["id"]] = job
+            self.active[id(agent)] = job["id"]
+            self._trim()
+            out = dict(job)
+        threading.Thread(target=self._run, args=(job, agent, Q, snap, batch_size),
+                         name=f"train-{job['id'][:8]}", daemon=True).start()
+        return out
+
+    def _run(self, job, agent, Q, snap, batch_size):
+        job["status"] = "running"; job["started"] = time.time()
+        try:
+            seed = int(np.random.SeedSequence().entropy % (2**32))
+            pool = self._get_pool()
+            while job["done"] < job["iters"]:
+                n = min(TRAIN_CHUNK_ITERS, job["iters"] - job["done"])
+                Q = pool.submit(_train_chunk, Q, snap["k"], snap["a"], snap["r"], snap["k2"],
+                                agent.alpha, agent.gamma, n, batch_size, seed + job["done"]).result()
+                job["done"] += n
+                job["progress"] = job["done"] / job["iters"]
+            agent.swap_q(Q)
+            job["q_version"] = agent.q_version
+            job["status"] = "done"
+        except Exception as e:
+            job["status"] = "failed"; job["error"] = str(e)
+        finally:
+            job["finished"] = time.time()
+            with self.lock:
+                self.active.pop(id(agent), None)
+
+    def _trim(self):
+        finished = [j for j in self.jobs.values() if j["status"] in ("done", "failed")]
+        for j in sorted(finished, key=lambda j: j["submitted"])[:max(0, len(self.jobs) - MAX_JOBS_KEPT)]:
+            self.jobs.pop(j["id"], None)
+
+    def get(self, job_id: str) -> Optional[dict]:
+        job = self.jobs.get(job_id)
+        return dict(job) if job is not None else None
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+
+class Checkpointer:
+    # background thread writing binary Q checkpoints for agents whose q_version moved since the last save
+    def __init__(self, interval: float = 300.0):
+        self.interval = float(interval)
+        self.lock = threading.Lock()
+        self.agents = {}   # path -> agent
+        self.saved = {}    # path -> q_version on disk
+        self.stats = {"saves": 0, "errors": 0, "last_error": None, "last_save": None}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def track(self, agent, path: str, saved_version: Optional[int] = None):
+        with self.lock:
+            self.agents[path] = agent
+            self.saved[path] = agent.q_version if saved_version is None else saved_version
+
+    def untrack(self, path: str, save: bool = True):
+        # a last save first, so training since the previous checkpoint is not lost
+        with self.lock:
+            agent = self.agents.pop(path, None); saved = self.saved.pop(path, None)
+        if save and agent is not None and agent.q_version != saved and self._save(path, agent):
+            self.stats["saves"] += 1; self.stats["last_save"] = time.time()
+
+    def _save(self, path, agent) -> bool:
+        try:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            agent.save_checkpoint(path)
+            return True
+        except Exception as e:
+            self.stats["errors"] += 1; self.stats["last_error"] = f"{path}: {e}"
+            return False
+
+    def checkpoint_all(self, force: bool = False) -> int:
+        with self.lock:
+            pending = [(p, a) for p, a in self.agents.items() if force or a.q_version != self.saved.get(p)]
+        n = 0
+        for path, agent in pending:
+            version = agent.q_version
+            if not self._save(path, agent):
+                continue
+            with self.lock:
+                if path in self.agents:
+                    self.saved[path] = version
+            n += 1
+        if n:
+            self.stats["saves"] += n; self.stats["last_save"] = time.time()
+        return n
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.checkpoint_all()
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="q-checkpoint", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        # final save so a clean shutdown never loses the latest policy
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join(timeout=5.0)
+            self._thread = None
+            self.checkpoint_all()
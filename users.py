@@ -0,0 +1,108 @@
+# users.py
+import os, csv, time, hashlib, threading
+from collections import OrderedDict
+from typing import Optional
+
+USER_COLUMNS = ["username", "pw_hash", "role"]
+SESSION_TTL_SECONDS = 12*3600
+SESSION_MAX = 100000
+
+class UserStore:
+    # username index loaded once from the CSV; new users are appended as one line each
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        self.index = None
+
+    def _load(self):
+        index = {}
+        if os.path.exists(self.path):
+            with open(self.path, newline="") as f:
+                for row in csv.DictReader(f):
+                    name = row.get("username")
+                    if name is not None and name not in index:
+                        index[name] = {"pw_hash": row.get("pw_hash", ""), "role": row.get("role", "user")}
+        else:
+            with open(self.path, "w", newline="") as f:
+                csv.writer(f, lineterminator="\n").writerow(USER_COLUMNS)
+        self.index = index
+
+    def _ensure(self):
+        if self.index is None:
+            with self.lock:
+                if self.index is None:
+                    self._load()
+
+    def get(self, username) -> Optional[dict]:
+        self._ensure()
+        return self.index.get(username)
+
+    def add(self, username: str, pw_hash: str, role: str = "user") -> bool:
+        self._ensure()
+        with self.lock:
+            if username in self.index:
+                return False
+            with open(self.path, "a", newline="") as f:
+                csv.writer(f, lineterminator="\n").writerow([username, pw_hash, role])
+            self.index[username] = {"pw_hash": pw_hash, "role": role}
+            return True
+
+    def __len__(self):
+        self._ensure()
+        return len(self.index)
+
+def _token_key(token: str) -> bytes:
+    # the table is keyed by a SHA-256 of the token, so raw tokens are never stored; a lookup hashes
+    # the presented token and does a plain dict lookup on the digest
+    return hashlib.sha256(str(token).encode()).digest()
+
+class SessionStore:
+    # bounded LRU of sessions with an absolute TTL from login
+    def __init__(self, ttl: float = SESSION_TTL_SECONDS, max_size: int = SESSION_MAX):
+        self.ttl = float(ttl)
+        self.max_size = max(1, int(max_size))
+        self.lock = threading.Lock()
+        self.items = OrderedDict()
+        self.evicted = 0
+        self.expired = 0
+
+    def put(self, token: str, session: dict):
+        key = _token_key(token)
+        now = time.time()
+        with self.lock:
+            self.items[key] = (now + self.ttl, session)
+            self.items.move_to_end(key)
+            self._purge(now)
+
+    def _purge(self, now):
+        # expired entries at the cold end go first, then the least recently used over capacity
+        while self.items:
+            k, (exp, _) = next(iter(self.items.items()))
+            if exp > now:
+                break
+            del self.items[k]; self.expired += 1
+        while len(self.items) > self.max_size:
+            self.items.popitem(last=False); self.evicted += 1
+
+    def get(self, token) -> Optional[dict]:
+        if not token:
+            return None
+        key = _token_key(token)
+        with self.lock:
+            entry = self.items.get(key)
+            if entry is None:
+                return None
+            exp, session = entry
+            if exp <= time.time():
+                del self.items[key]; self.expired += 1
+                return None
+            self.items.move_to_end(key)
+            return session
+
+    def pop(self, token) -> Optional[dict]:
+        with self.lock:
+            entry = self.items.pop(_token_key(token), None)
+        return entry[1] if entry else None
+
+    def __len__(self):
+        return len(self.items)
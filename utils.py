@@ -1,6 +1,8 @@
 import cv2
 import numpy as np
 
+from detection import lane_map_for
+
 
 LANE_ROIS = [
     (50, 250, 120, 200),
@@ -28,32 +30,25 @@ def is_within_roi(bbox_center, roi):
     x, y, w, h = roi
     return x < x_center < x + w and y < y_center < y + h
 
-def draw_detections(frame, detections, rois, model_names):
+def draw_detections(frame, detections, rois, model_names, lane_map=None):
     detections_in_lanes = [[] for _ in range(len(rois))]
 
 
     if detections is None or len(detections) == 0:
         return frame, detections_in_lanes
 
-    for det in detections:
-        x1, y1, x2, y2 = map(int, det[:4])
-        conf = float(det[4])
-        cls_idx = int(det[5])
-        class_name = model_names.get(cls_idx, 'Unknown')
+    dets = np.asarray(detections, dtype=float)
+    boxes = dets[:, :4].astype(int)
+    # same strict bounds as is_within_roi, looked up for all boxes at once
+    lane_map = lane_map or lane_map_for(rois, inclusive=False)
+    lanes = lane_map.lookup((boxes[:, 0] + boxes[:, 2]) // 2, (boxes[:, 1] + boxes[:, 3]) // 2).tolist()
 
-        cx = int((x1 + x2) / 2)
-        cy = int((y1 + y2) / 2)
-        bbox_center = (cx, cy)
+    for (x1, y1, x2, y2), conf, cls_idx, lane_index in zip(boxes.tolist(), dets[:, 4].tolist(), dets[:, 5].astype(int).tolist(), lanes):
+        class_name = model_names.get(cls_idx, 'Unknown')
         bbox = (x1, y1, x2, y2)
 
-
-        lane_index = -1
-        for i, roi in enumerate(rois):
-            if is_within_roi(bbox_center, roi):
-                lane_index = i
-
-                detections_in_lanes[i].append({'bbox': bbox, 'class_name': class_name, 'conf': conf})
-                break
+        if lane_index != -1:
+            detections_in_lanes[lane_index].append({'bbox': bbox, 'class_name': class_name, 'conf': conf})
 
 
         color = (0, 255, 0) if lane_index != -1 else (0, 0, 255)